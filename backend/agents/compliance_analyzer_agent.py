@@ -1,22 +1,28 @@
+import asyncio
 import os
-from pathlib import Path
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+import re
+import xxhash
+from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableParallel
+from agents.llm_provider import create_llm, register_synthetic_response, synthesize_model
+from agents.llm_scheduler import LlmPriority, estimate_tokens
+from agents.llm_telemetry import llm_telemetry
+from agents.prompt_registry import prompt_registry
+from agents.llm_cache import LlmCache
+from agents.text_processing import normalize_text
 from model.feature import Feature, FeatureStatus
-from model.source_content import SourceContent
+from model.source_content import SourceContent, compute_content_hash
+from model.source_section import SourceSection
 import dotenv
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import Any, Callable, Dict, List, Optional, Type
 
 dotenv.load_dotenv()
 
-llm = ChatAnthropic(
-    model=os.getenv("ANTHROPIC_MODEL"),
-    temperature=0.2,
-    api_key=os.getenv("ANTHROPIC_API_KEY")
-)
+llm = create_llm(temperature=0.2)
+
+# "[3] Name: ..." lines, the numbered features of a group prompt
+GROUP_POSITION_PATTERN = re.compile(r"^\[(\d+)\] Name:", re.MULTILINE)
 
 
 class ComplianceAnalyzerAgentResponse(BaseModel):
@@ -25,21 +31,130 @@ class ComplianceAnalyzerAgentResponse(BaseModel):
     status_change_to: FeatureStatus
     reason: str
     confidence: float
+    cited_section_ids: List[str] = []
 
 
-class ComplianceAnalyzerAgent:
-    def __init__(self):
-        self.structured_llm = llm.with_structured_output(
+class ComplianceAnalyzerAgentResult(ComplianceAnalyzerAgentResponse):
+    """A verdict with the model tier that decided it, "screening" or "analysis" """
+    tier: str = "analysis"
+    model: Optional[str] = None
+
+
+class ComplianceMapFinding(BaseModel):
+    """Partial findings of a feature against one source, or one part of a source"""
+    relevant: bool
+    findings: str
+    suggested_status: FeatureStatus
+    confidence: float
+    cited_section_ids: List[str] = []
+
+
+class ComplianceGroupVerdict(ComplianceAnalyzerAgentResponse):
+    # Position of the feature in the group prompt
+    index: int
+
+
+class ComplianceAnalyzerAgentGroupResponse(BaseModel):
+    verdicts: List[ComplianceGroupVerdict]
+
+
+def synthesize_group_response(messages, rng, tags) -> ComplianceAnalyzerAgentGroupResponse:
+    """Offline stand-in for a group answer, one verdict per feature numbered in the prompt"""
+    positions = [position for message in messages if isinstance(message.content, str)
+                 for position in GROUP_POSITION_PATTERN.findall(message.content)]
+    return ComplianceAnalyzerAgentGroupResponse(verdicts=[
+        ComplianceGroupVerdict(index=int(position), **synthesize_model(
+            ComplianceAnalyzerAgentResponse, rng, tags).model_dump())
+        for position in positions
+    ])
+
+
+register_synthetic_response(
+    ComplianceAnalyzerAgentGroupResponse, synthesize_group_response)
+
+
+class SourceContext(BaseModel):
+    """One source's text as sent to the analyzer, with the fingerprints of the version it came from"""
+    source_url: str
+    text: str
+    tokens: int
+    fingerprints: List[str]
+
+
+class ModelTier:
+    """A model the analyzer runs on, with its structured output chains"""
+
+    def __init__(self, name: str, chat_model):
+        self.name = name
+        self.model = chat_model.model
+        self.structured_llm = chat_model.with_structured_output(
             ComplianceAnalyzerAgentResponse)
+        self.structured_map_llm = chat_model.with_structured_output(
+            ComplianceMapFinding)
+        self.structured_group_llm = chat_model.with_structured_output(
+            ComplianceAnalyzerAgentGroupResponse)
+
+    def agent_name(self, agent: str) -> str:
+        """Agent name in the cache and telemetry, screening calls are counted apart"""
+        return agent if self.name == "analysis" else f"{agent}:{self.name}"
+
+
+class ComplianceAnalyzerAgent:
+    def __init__(self, llm_cache: Optional[LlmCache] = None, context_token_budget: Optional[int] = None, analysis_mode: Optional[str] = None, group_max_features: Optional[int] = None, screening_model: Optional[str] = None, escalation_confidence: Optional[float] = None):
+        self.analysis_tier = ModelTier("analysis", llm)
+        # With a screening model, every feature is analyzed by it first and only the verdicts it
+        # flags, or is unsure about, are analyzed again by the main model
+        screening_model = screening_model or os.getenv(
+            "COMPLIANCE_SCREENING_MODEL")
+        self.screening_tier = ModelTier("screening", create_llm(temperature=0.2, model=screening_model)) \
+            if screening_model and screening_model != llm.model else None
+        self.escalation_confidence = escalation_confidence if escalation_confidence is not None else float(
+            os.getenv("COMPLIANCE_ESCALATION_CONFIDENCE", "0.8"))
+        self.llm_cache = llm_cache
+        # Source tokens one call may carry. Anything larger is analyzed source by source and merged
+        self.context_token_budget = context_token_budget or int(
+            os.getenv("COMPLIANCE_CONTEXT_TOKEN_BUDGET", "30000"))
+        # "feature": one call per feature. "group": features that fit the budget together share
+        # one call and one copy of the source context
+        self.analysis_mode = analysis_mode or os.getenv(
+            "COMPLIANCE_ANALYSIS_MODE", "feature")
+        self.group_max_features = group_max_features or int(
+            os.getenv("COMPLIANCE_GROUP_MAX_FEATURES", "8"))
+        # Calls and estimated input tokens actually sent, per agent name (cache hits excluded)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._cascade_stats = {"screened": 0, "escalated": 0, "screening_failures": 0}
+
+    def analysis_version(self) -> str:
+        """Fingerprint of what decides a verdict besides its inputs: the prompts, the models, the
+        escalation threshold and how source context is packed into calls. Verdicts of another
+        version are out of date"""
+        hasher = xxhash.xxh3_64()
+        prompt_names = ["compliance_analyzer",
+                        "compliance_analyzer_map", "compliance_analyzer_reduce"]
+        if self.analysis_mode == "group":
+            prompt_names.append("compliance_analyzer_group")
+        for name in prompt_names:
+            hasher.update(prompt_registry.get_prompt(name).version.encode("utf-8"))
+            hasher.update(b"\0")
+        hasher.update(self.analysis_tier.model.encode("utf-8"))
+        # The budget decides when sources are mapped and reduced, the group size who shares a call
+        hasher.update(
+            f"\0{self.analysis_mode}\0{self.context_token_budget}".encode("utf-8"))
+        if self.analysis_mode == "group":
+            hasher.update(f"\0{self.group_max_features}".encode("utf-8"))
+        if self.screening_tier is not None:
+            hasher.update(
+                f"\0{self.screening_tier.model}\0{self.escalation_confidence}".encode("utf-8"))
+        return hasher.hexdigest()
 
     def _format_feature_for_prompt(self, feature: Feature) -> str:
         """Format feature information for prompt injection"""
         return f"Name: {feature.name}\nDescription: {feature.description}\nCurrent Status: {feature.status}"
 
-    def _format_source_contents_for_prompt(self, source_contents: List[SourceContent]) -> str:
+    def _format_source_contents_for_prompt(self, source_contents: List[SourceContent], start: int = 1) -> str:
         """Format source contents for prompt injection"""
         formatted_sources = []
-        for i, source_content in enumerate(source_contents, 1):
+        for i, source_content in enumerate(source_contents, start):
             formatted_sources.append(
                 f"Source {i}:\n"
                 # f"Title: {source_content.title}\n"
@@ -48,109 +163,379 @@ class ComplianceAnalyzerAgent:
             )
         return "\n\n".join(formatted_sources)
 
-    def _create_feature_chain(self, feature: Feature, source_contents: List[SourceContent], system_template: str):
-        """Create a chain for analyzing a single feature against source contents"""
-        formatted_feature = self._format_feature_for_prompt(feature)
-        formatted_sources = self._format_source_contents_for_prompt(
-            source_contents)
+    def _format_source_sections_for_prompt(self, source_sections: List[SourceSection]) -> str:
+        """Format retrieved source sections for prompt injection, labelled with their citable ids"""
+        formatted_sections = []
+        for source_section in source_sections:
+            heading = f"Heading: {source_section.heading}\n" if source_section.heading else ""
+            formatted_sections.append(
+                f"[Section {source_section.section_id}]\n"
+                f"URL: {source_section.source_url}\n"
+                f"{heading}"
+                f"Content: {source_section.text}"
+            )
+        return "\n\n".join(formatted_sections)
+
+    def _source_content_contexts(self, source_contents: List[SourceContent]) -> List[SourceContext]:
+        contexts = []
+        for i, source_content in enumerate(source_contents, 1):
+            text = self._format_source_contents_for_prompt(
+                [source_content], start=i)
+            contexts.append(SourceContext(
+                source_url=source_content.source_url,
+                text=text,
+                tokens=estimate_tokens(text),
+                fingerprints=[source_content.content_hash or compute_content_hash(
+                    source_content.title, source_content.content or "")],
+            ))
+        return contexts
+
+    def _source_section_contexts(self, source_sections: List[SourceSection]) -> List[SourceContext]:
+        """One context per source content version, its sections kept in retrieval order"""
+        sections_by_content: Dict[str, List[SourceSection]] = {}
+        for source_section in source_sections:
+            sections_by_content.setdefault(
+                source_section.source_content_id, []).append(source_section)
+        contexts = []
+        for content_sections in sections_by_content.values():
+            text = self._format_source_sections_for_prompt(content_sections)
+            contexts.append(SourceContext(
+                source_url=content_sections[0].source_url,
+                text=text,
+                tokens=estimate_tokens(text),
+                # Section ids name an immutable content version, so they identify the text
+                fingerprints=[
+                    source_section.section_id for source_section in content_sections],
+            ))
+        return contexts
+
+    def _split_context(self, context: SourceContext) -> List[SourceContext]:
+        """Parts of a context that each fit the budget, split at paragraph boundaries where possible"""
+        if context.tokens <= self.context_token_budget:
+            return [context]
+
+        max_chars = self.context_token_budget * 4
+        pieces = []
+        for paragraph in context.text.split("\n\n"):
+            # A paragraph longer than a whole part is cut at the limit
+            pieces.extend(paragraph[start:start + max_chars]
+                          for start in range(0, len(paragraph), max_chars))
+        parts = []
+        current = []
+        current_chars = 0
+        for piece in pieces:
+            if current and current_chars + len(piece) + 2 > max_chars:
+                parts.append("\n\n".join(current))
+                current = []
+                current_chars = 0
+            current.append(piece)
+            current_chars += len(piece) + 2
+        if current:
+            parts.append("\n\n".join(current))
+
+        return [SourceContext(
+            source_url=context.source_url,
+            text=f"(Part {i} of {len(parts)})\n{part}",
+            tokens=estimate_tokens(part),
+            fingerprints=[*context.fingerprints, f"part-{i}-of-{len(parts)}"],
+        ) for i, part in enumerate(parts, 1)]
 
+    async def _invoke_async(self, tier: ModelTier, agent: str, system_prompt, structured_llm, response_model: Type[BaseModel], human_contents: List[str], cache_inputs: Dict[str, Any], bypass_cache: bool, validate: Optional[Callable[[Any], None]] = None) -> Any:
+        """One scheduled, cached structured call. A response validate rejects is raised, never cached"""
+        agent = tier.agent_name(agent)
         chat_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=system_template),
-            HumanMessage(content="Feature to Analyze:\n{feature_details}"),
-            HumanMessage(
-                content="Regulatory Source Content:\n{source_content}")
+            system_prompt.system_message,
+            *[HumanMessage(content=human_content)
+              for human_content in human_contents],
+        ])
+        chain = chat_prompt | structured_llm
+        estimated_tokens = sum(estimate_tokens(human_content)
+                               for human_content in human_contents)
+
+        async def invoke():
+            agent_stats = self._stats.setdefault(
+                agent, {"calls": 0, "input_tokens": 0})
+            agent_stats["calls"] += 1
+            agent_stats["input_tokens"] += estimated_tokens + \
+                estimate_tokens(system_prompt.text)
+            response = await llm_telemetry.invoke_async(agent, tier.model, system_prompt, chain, estimated_tokens, LlmPriority.BULK)
+            if validate is not None:
+                validate(response)
+            return response
+
+        if self.llm_cache is None:
+            return await invoke()
+        cache_key = self.llm_cache.make_key(
+            agent, tier.model, system_prompt.version, cache_inputs)
+        return await self.llm_cache.get_or_compute_async(
+            agent, cache_key, response_model, invoke, bypass=bypass_cache)
+
+    async def _analyze_feature_async(self, tier: ModelTier, feature: Feature, contexts: List[SourceContext], bypass_cache: bool) -> ComplianceAnalyzerAgentResponse:
+        formatted_feature = self._format_feature_for_prompt(feature)
+        normalized_feature = normalize_text(formatted_feature)
+
+        if sum(context.tokens for context in contexts) <= self.context_token_budget:
+            # Everything fits one call
+            formatted_sources = "\n\n".join(
+                context.text for context in contexts)
+            return await self._invoke_async(
+                tier, "compliance_analyzer", prompt_registry.get_prompt("compliance_analyzer"), tier.structured_llm, ComplianceAnalyzerAgentResponse,
+                [f"Feature to Analyze:\n{formatted_feature}",
+                 f"Regulatory Source Content:\n{formatted_sources}"],
+                {"feature": normalized_feature, "sources": [
+                    fingerprint for context in contexts for fingerprint in context.fingerprints]},
+                bypass_cache)
+
+        # Map: findings per source (or part of one), cached per source version so that only
+        # changed sources are read again
+        map_prompt = prompt_registry.get_prompt("compliance_analyzer_map")
+        parts = [part for context in contexts for part in self._split_context(context)]
+        findings = await asyncio.gather(*[
+            self._invoke_async(
+                tier, "compliance_analyzer_map", map_prompt, tier.structured_map_llm, ComplianceMapFinding,
+                [f"Feature to Analyze:\n{formatted_feature}",
+                 f"Regulatory Source Content:\n{part.text}"],
+                {"feature": normalized_feature, "source": part.fingerprints},
+                bypass_cache)
+            for part in parts
         ])
 
-        chain = chat_prompt | self.structured_llm
+        relevant = [(part, finding) for part, finding in zip(
+            parts, findings) if finding.relevant]
+        if not relevant:
+            return ComplianceAnalyzerAgentResponse(
+                needs_action=False,
+                original_status=feature.status,
+                status_change_to=feature.status,
+                reason=f"None of the {len(contexts)} regulatory sources contain requirements that apply to this feature.",
+                confidence=min(finding.confidence for finding in findings),
+            )
+
+        # Reduce: merge the relevant findings into one assessment
+        formatted_findings = "\n\n".join(
+            f"Findings {i} (from {part.source_url}, suggested status {finding.suggested_status.value}, confidence {finding.confidence}):\n"
+            f"{finding.findings}\n"
+            f"Cited sections: {', '.join(finding.cited_section_ids) or 'none'}"
+            for i, (part, finding) in enumerate(relevant, 1))
+        return await self._invoke_async(
+            tier, "compliance_analyzer_reduce", prompt_registry.get_prompt("compliance_analyzer_reduce"), tier.structured_llm, ComplianceAnalyzerAgentResponse,
+            [f"Feature to Analyze:\n{formatted_feature}",
+             f"Findings per Source:\n{formatted_findings}"],
+            {"feature": normalized_feature, "findings": [
+                finding.model_dump(mode="json") for _, finding in relevant]},
+            bypass_cache)
+
+    def _pack_feature_groups(self, feature_tokens: List[int], feature_sources: List[Dict[str, int]]) -> List[List[int]]:
+        """Greedily group features, keeping input order, while the group's features plus the union of
+        their source pieces (id -> tokens) fit the context budget
+        """
+        groups = []
+        group = []
+        group_sources: Dict[str, int] = {}
+        group_tokens = 0
+        for index, (tokens, sources) in enumerate(zip(feature_tokens, feature_sources)):
+            if tokens + sum(sources.values()) > self.context_token_budget:
+                # Too large even alone, analyzed on its own (split by source if need be)
+                groups.append([index])
+                continue
+            added_tokens = tokens + sum(source_tokens for source_id, source_tokens in sources.items()
+                                        if source_id not in group_sources)
+            if group and (group_tokens + added_tokens > self.context_token_budget or len(group) >= self.group_max_features):
+                groups.append(group)
+                group = []
+                group_sources = {}
+                group_tokens = 0
+                added_tokens = tokens + sum(sources.values())
+            group.append(index)
+            group_sources.update(sources)
+            group_tokens += added_tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    def plan_feature_groups(self, source_contents: List[SourceContent], features: List[Feature], feature_sections: Optional[List[List[SourceSection]]] = None) -> List[List[int]]:
+        """Feature indices analyzed together, one index per group in "feature" mode"""
+        if self.analysis_mode != "group":
+            return [[index] for index in range(len(features))]
+
+        feature_tokens = [estimate_tokens(self._format_feature_for_prompt(feature))
+                          for feature in features]
+        if feature_sections is None:
+            shared_sources = {context.fingerprints[0]: context.tokens
+                              for context in self._source_content_contexts(source_contents)}
+            feature_sources = [shared_sources] * len(features)
+        else:
+            section_tokens = {}
+            for source_sections in feature_sections:
+                for source_section in source_sections:
+                    if source_section.section_id not in section_tokens:
+                        section_tokens[source_section.section_id] = estimate_tokens(
+                            self._format_source_sections_for_prompt([source_section]))
+            feature_sources = [{source_section.section_id: section_tokens[source_section.section_id] for source_section in source_sections}
+                               for source_sections in feature_sections]
+        return self._pack_feature_groups(feature_tokens, feature_sources)
+
+    def _validate_group_response(self, group_size: int) -> Callable[[ComplianceAnalyzerAgentGroupResponse], None]:
+        def validate(group_response: ComplianceAnalyzerAgentGroupResponse):
+            positions = [verdict.index for verdict in group_response.verdicts]
+            if sorted(positions) != list(range(group_size)):
+                raise ValueError(
+                    f"Group response covered positions {positions} of {group_size} features")
+        return validate
+
+    async def _analyze_group_async(self, tier: ModelTier, features: List[Feature], contexts: List[SourceContext], bypass_cache: bool) -> List[ComplianceAnalyzerAgentResponse]:
+        """Analyze a group of features against one shared copy of their source context, in one call"""
+        formatted_features = [self._format_feature_for_prompt(
+            feature) for feature in features]
+        numbered_features = "\n\n".join(
+            f"[{position}] {formatted_feature}" for position, formatted_feature in enumerate(formatted_features))
+        formatted_sources = "\n\n".join(context.text for context in contexts)
+        group_response = await self._invoke_async(
+            tier, "compliance_analyzer_group", prompt_registry.get_prompt("compliance_analyzer_group"), tier.structured_group_llm, ComplianceAnalyzerAgentGroupResponse,
+            [f"Features to Analyze ({len(features)}):\n{numbered_features}",
+             f"Regulatory Source Content:\n{formatted_sources}"],
+            {"features": [normalize_text(formatted_feature) for formatted_feature in formatted_features],
+             "sources": [fingerprint for context in contexts for fingerprint in context.fingerprints]},
+            bypass_cache, validate=self._validate_group_response(len(features)))
+
+        verdicts = sorted(group_response.verdicts,
+                          key=lambda verdict: verdict.index)
+        return [ComplianceAnalyzerAgentResponse(**verdict.model_dump(exclude={"index"})) for verdict in verdicts]
+
+    async def _analyze_features_async(self, tier: ModelTier, features: List[Feature], feature_sections: Optional[List[List[SourceSection]]], shared_contexts: Optional[List[SourceContext]], bypass_cache: bool) -> List[ComplianceAnalyzerAgentResponse]:
+        """Analyze features together in one call, or alone for a single feature. shared_contexts
+        stands in for the sections when feature_sections is None
+        """
+        def feature_contexts(i: int) -> List[SourceContext]:
+            return shared_contexts if feature_sections is None else self._source_section_contexts(feature_sections[i])
+
+        if len(features) == 1:
+            return [await self._analyze_feature_async(tier, features[0], feature_contexts(0), bypass_cache)]
+
+        group_contexts = shared_contexts
+        if feature_sections is not None:
+            # The union of the features' retrieved sections, each sent once
+            unique_sections = {}
+            for source_sections in feature_sections:
+                for source_section in source_sections:
+                    unique_sections.setdefault(
+                        source_section.section_id, source_section)
+            group_contexts = self._source_section_contexts(
+                list(unique_sections.values()))
+        try:
+            return await self._analyze_group_async(tier, features, group_contexts, bypass_cache)
+        except Exception as e:
+            # A malformed or partial group is retried one feature at a time
+            print(
+                f"Group analysis of {len(features)} features failed, falling back to per-feature calls: {e}")
+            return list(await asyncio.gather(*[
+                self._analyze_feature_async(tier, feature, feature_contexts(i), bypass_cache) for i, feature in enumerate(features)]))
+
+    def _needs_escalation(self, response: ComplianceAnalyzerAgentResponse) -> bool:
+        """A screening verdict stands only when it finds nothing to change and is confident about it"""
+        return response.needs_action or response.status_change_to != response.original_status or response.confidence < self.escalation_confidence
+
+    async def _analyze_tiered_async(self, features: List[Feature], feature_sections: Optional[List[List[SourceSection]]], shared_contexts: Optional[List[SourceContext]], bypass_cache: bool) -> List[ComplianceAnalyzerAgentResult]:
+        """Analyze features on the screening model first when there is one, escalating to the main model"""
+        def result(response: ComplianceAnalyzerAgentResponse, tier: ModelTier) -> ComplianceAnalyzerAgentResult:
+            return ComplianceAnalyzerAgentResult(**response.model_dump(), tier=tier.name, model=tier.model)
 
-        # Return a lambda that will invoke the chain with the formatted data
-        return lambda: chain.ainvoke({
-            "feature_details": formatted_feature,
-            "source_content": formatted_sources
-        })
+        escalated = list(range(len(features)))
+        results: List[Optional[ComplianceAnalyzerAgentResult]] = [
+            None] * len(features)
+        if self.screening_tier is not None:
+            self._cascade_stats["screened"] += len(features)
+            try:
+                screened = await self._analyze_features_async(
+                    self.screening_tier, features, feature_sections, shared_contexts, bypass_cache)
+                escalated = [i for i, response in enumerate(
+                    screened) if self._needs_escalation(response)]
+                for i, response in enumerate(screened):
+                    results[i] = result(response, self.screening_tier)
+            except Exception as e:
+                # Screening is an optimization, the main model still decides everything
+                self._cascade_stats["screening_failures"] += 1
+                print(
+                    f"Screening of {len(features)} features failed, escalating all of them: {e}")
+            self._cascade_stats["escalated"] += len(escalated)
 
-    async def analyze_compliance(self, source_contents: List[SourceContent], features: List[Feature]) -> List[ComplianceAnalyzerAgentResponse]:
-        """Analyze multiple features compliance against regulatory source requirements in parallel"""
+        if escalated:
+            analyzed = await self._analyze_features_async(
+                self.analysis_tier, [features[i] for i in escalated],
+                None if feature_sections is None else [feature_sections[i] for i in escalated], shared_contexts, bypass_cache)
+            for i, response in zip(escalated, analyzed):
+                results[i] = result(response, self.analysis_tier)
+        return results
+
+    async def analyze_feature_group_compliance(self, source_contents: List[SourceContent], features: List[Feature], feature_sections: Optional[List[List[SourceSection]]] = None, bypass_cache: bool = False) -> List[ComplianceAnalyzerAgentResult]:
+        """Analyze a group from plan_feature_groups in one call. Responses are in feature order.
+
+        The group shares one context, the union of its features' retrieved sections (or the full
+        source contents). A malformed group response falls back to one call per feature.
+        """
+        try:
+            shared_contexts = self._source_content_contexts(
+                source_contents) if feature_sections is None else None
+            return await self._analyze_tiered_async(features, feature_sections, shared_contexts, bypass_cache)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Template file not found: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Error analyzing compliance: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "analysis_mode": self.analysis_mode,
+            "agents": {agent: dict(agent_stats) for agent, agent_stats in self._stats.items()},
+            "cascade": {
+                "screening_model": self.screening_tier.model if self.screening_tier is not None else None,
+                "analysis_model": self.analysis_tier.model,
+                "escalation_confidence": self.escalation_confidence,
+                **self._cascade_stats,
+            },
+        }
+
+    async def analyze_feature_compliance(self, source_contents: List[SourceContent], feature: Feature, source_sections: Optional[List[SourceSection]] = None, bypass_cache: bool = False) -> ComplianceAnalyzerAgentResult:
+        """Analyze one feature, against its retrieved sections when given, else the full source contents"""
         try:
-            # Load system prompt template
-            current_dir = Path(__file__).parent
-            template_path = current_dir / "templates" / "compliance_analyzer.md"
-            system_template_content = template_path.read_text(encoding='utf-8')
-
-            # Create chains for each feature
-            chains_dict = {}
-            for i, feature in enumerate(features):
-                chain_key = f"feature_{i}_{feature.id}" if feature.id else f"feature_{i}"
-
-                # Create individual chat prompt for this feature
-                formatted_feature = self._format_feature_for_prompt(feature)
-                formatted_sources = self._format_source_contents_for_prompt(
-                    source_contents)
-
-                chat_prompt = ChatPromptTemplate.from_messages([
-                    SystemMessage(content=system_template_content),
-                    HumanMessage(
-                        content="Feature to Analyze:\n{feature_details}"),
-                    HumanMessage(
-                        content="Regulatory Source Content:\n{source_content}")
-                ])
-
-                # Create chain for this specific feature
-                chain = chat_prompt | self.structured_llm
-
-                # Store the chain with pre-formatted data
-                chains_dict[chain_key] = chain.with_config(
-                    {"configurable": {
-                        "feature_details": formatted_feature,
-                        "source_content": formatted_sources
-                    }}
-                )
-
-            # Create parallel runnable
-            parallel_runnable = RunnableParallel(**chains_dict)
-
-            # Execute all chains in parallel
-            # We need to create the input data for each chain
-            parallel_input = {}
-            for i, feature in enumerate(features):
-                chain_key = f"feature_{i}_{feature.id}" if feature.id else f"feature_{i}"
-                formatted_feature = self._format_feature_for_prompt(feature)
-                formatted_sources = self._format_source_contents_for_prompt(
-                    source_contents)
-                parallel_input[chain_key] = {
-                    "feature_details": formatted_feature,
-                    "source_content": formatted_sources
-                }
-
-            # Actually, let's simplify this - create individual chains and run them in parallel
-            chains_dict_simple = {}
-            for i, feature in enumerate(features):
-                chain_key = f"feature_{i}_{feature.id}" if feature.id else f"feature_{i}"
-                formatted_feature = self._format_feature_for_prompt(feature)
-                formatted_sources = self._format_source_contents_for_prompt(
-                    source_contents)
-
-                chat_prompt = ChatPromptTemplate.from_messages([
-                    SystemMessage(content=system_template_content),
-                    HumanMessage(
-                        content=f"Feature to Analyze:\n{formatted_feature}"),
-                    HumanMessage(
-                        content=f"Regulatory Source Content:\n{formatted_sources}")
-                ])
-
-                chains_dict_simple[chain_key] = chat_prompt | self.structured_llm
-
-            # Create parallel runnable and execute
-            parallel_runnable = RunnableParallel(**chains_dict_simple)
-            results_dict = await parallel_runnable.ainvoke({})
-
-            # Convert results dict to list maintaining feature order
-            results_list = []
-            for i, feature in enumerate(features):
-                chain_key = f"feature_{i}_{feature.id}" if feature.id else f"feature_{i}"
-                results_list.append(results_dict[chain_key])
-
-            return results_list
+            shared_contexts = self._source_content_contexts(
+                source_contents) if source_sections is None else None
+            return (await self._analyze_tiered_async([feature], None if source_sections is None else [source_sections], shared_contexts, bypass_cache))[0]
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Template file not found: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Error analyzing compliance: {e}")
+
+    async def analyze_compliance(self, source_contents: List[SourceContent], features: List[Feature], feature_sections: Optional[List[List[SourceSection]]] = None, bypass_cache: bool = False) -> List[ComplianceAnalyzerAgentResult]:
+        """Analyze multiple features compliance against regulatory source requirements in parallel.
+
+        When feature_sections is given, each feature is analyzed against its own retrieved
+        sections (index-aligned with features) instead of the full source contents. Sources
+        beyond the context token budget are analyzed one at a time and the findings merged.
+        In "group" mode, features that fit the budget together are analyzed in one call. With
+        COMPLIANCE_SCREENING_MODEL, each result records the model tier that decided it.
+        """
+        try:
+            groups = self.plan_feature_groups(
+                source_contents, features, feature_sections)
+            shared_contexts = self._source_content_contexts(
+                source_contents) if feature_sections is None else None
+
+            # All groups are started at once, the shared scheduler admits the calls as fast as
+            # the rate limits allow
+            group_responses = await asyncio.gather(*[
+                self._analyze_tiered_async(
+                    [features[i] for i in group],
+                    None if feature_sections is None else [feature_sections[i] for i in group], shared_contexts, bypass_cache)
+                for group in groups
+            ])
+
+            # Results come back in feature order
+            responses: List[Optional[ComplianceAnalyzerAgentResult]] = [
+                None] * len(features)
+            for group, group_response in zip(groups, group_responses):
+                for i, response in zip(group, group_response):
+                    responses[i] = response
+            return responses
 
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Template file not found: {e}")
@@ -1,79 +1,130 @@
+import asyncio
 import os
 import json
-from pathlib import Path
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+import re
+from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
+from agents.llm_provider import create_llm, register_synthetic_response, synthesize_model
+from agents.llm_scheduler import LlmPriority, estimate_tokens
+from agents.llm_telemetry import llm_telemetry
+from agents.prompt_registry import prompt_registry
+from agents.tag_pre_classifier import TagPrediction, TagPreClassifier
+from agents.llm_cache import LlmCache
+from agents.text_processing import normalize_text
 from model.feature import Feature, FeatureCreateRequest
 import dotenv
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
 dotenv.load_dotenv()
 
-llm = ChatAnthropic(
-    model=os.getenv("ANTHROPIC_MODEL"),
-    temperature=0.2,
-    api_key=os.getenv("ANTHROPIC_API_KEY")
-)
+llm = create_llm(temperature=0.2)
 
 
 class FeatureTaggingAgentResponse(BaseModel):
     tags: List[str]
 
 
+class FeatureTaggingBatchItem(BaseModel):
+    index: int
+    tags: List[str]
+
+
+class FeatureTaggingAgentBatchResponse(BaseModel):
+    features: List[FeatureTaggingBatchItem]
+
+
+BATCH_POSITION_PATTERN = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+
+
+def format_feature_details(feature: FeatureCreateRequest) -> str:
+    return str(feature.name + " " + feature.description)
+
+
+def synthesize_batch_response(messages, rng, tags) -> FeatureTaggingAgentBatchResponse:
+    """Offline stand-in for a batch answer, one entry per feature numbered in the prompt"""
+    positions = BATCH_POSITION_PATTERN.findall(messages[-1].content)
+    return FeatureTaggingAgentBatchResponse(features=[
+        FeatureTaggingBatchItem(index=int(position), tags=synthesize_model(
+            FeatureTaggingAgentResponse, rng, tags).tags)
+        for position in positions
+    ])
+
+
+register_synthetic_response(
+    FeatureTaggingAgentBatchResponse, synthesize_batch_response)
+
+
 class FeatureTaggingAgent:
-    def __init__(self):
+    def __init__(self, llm_cache: Optional[LlmCache] = None, tag_pre_classifier: Optional[TagPreClassifier] = None, batch_token_budget: Optional[int] = None, batch_max_size: Optional[int] = None):
         self.structured_llm = llm.with_structured_output(
             FeatureTaggingAgentResponse)
-
-    def _load_available_tags(self) -> dict:
-        """Load and parse the available tags from JSON file"""
-        current_dir = Path(__file__).parent
-        tags_path = current_dir / "resources" / "list_of_tags.json"
-
-        with open(tags_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    def _format_tags_for_prompt(self, tags_data: dict) -> str:
-        """Format JSON tags for prompt injection"""
-        formatted = []
-        for tag in tags_data["regulation_tags"]:
-            formatted.append(
-                f"• **{tag['tag']}** - {tag['name']}\n"
-                f"  Description: {tag['description']}\n"
-                f"  Examples: {', '.join(tag['examples'])}"
-            )
-        return "\n\n".join(formatted)
-
-    async def generate_feature_tags(self, feature: FeatureCreateRequest) -> FeatureTaggingAgentResponse:
+        self.structured_batch_llm = llm.with_structured_output(
+            FeatureTaggingAgentBatchResponse)
+        self.llm_cache = llm_cache
+        self.tag_pre_classifier = tag_pre_classifier
+        # Input tokens of feature text per batched call, the system prompt is shared and cached
+        self.batch_token_budget = batch_token_budget or int(
+            os.getenv("FEATURE_TAGGING_BATCH_TOKEN_BUDGET", "4000"))
+        # Output grows with the batch too, so the number of features is capped as well
+        self.batch_max_size = batch_max_size or int(
+            os.getenv("FEATURE_TAGGING_BATCH_MAX_SIZE", "20"))
+
+    def _cache_key(self, system_prompt_version: str, feature_details: str, candidates: Optional[List[str]] = None) -> str:
+        inputs = {"feature": normalize_text(feature_details)}
+        if candidates is not None:
+            inputs["candidates"] = candidates
+        return self.llm_cache.make_key("feature_tagging", llm.model, system_prompt_version, inputs)
+
+    def _classify(self, feature_details: str) -> Optional[TagPrediction]:
+        if self.tag_pre_classifier is None:
+            return None
+        return self.tag_pre_classifier.classify("feature_tagging", feature_details)
+
+    def _record_llm_tags(self, prediction: Optional[TagPrediction], response: FeatureTaggingAgentResponse):
+        if prediction is not None:
+            self.tag_pre_classifier.record_llm_tags(
+                "feature_tagging", prediction, response.tags)
+
+    async def generate_feature_tags(self, feature: FeatureCreateRequest, bypass_cache: bool = False) -> FeatureTaggingAgentResponse:
         """Generate regulation tags for a given feature"""
         try:
-            # Load system prompt template
-            current_dir = Path(__file__).parent
-            template_path = current_dir / "templates" / "feature_tagging.md"
-            system_template_content = template_path.read_text(encoding='utf-8')
-
-            # Load and format available tags
-            available_tags = self._load_available_tags()
-            formatted_tags = self._format_tags_for_prompt(available_tags)
-
-            # Simple string replacement instead of PromptTemplate to avoid curly brace conflicts
-            formatted_system_prompt = system_template_content.replace(
-                "{available_tags}", formatted_tags)
-
-            # Create the chat prompt with separate system and human messages
+            feature_details = format_feature_details(feature)
+            # Clear-cut features are tagged locally, the rest get a shortlist when there is one
+            prediction = self._classify(feature_details)
+            if prediction is not None and prediction.route == "local" and not prediction.shadow:
+                return FeatureTaggingAgentResponse(tags=prediction.tags)
+            candidates = prediction.candidates if prediction is not None and prediction.route == "shortlist" else None
+
+            # Compiled once with the tag catalog (or without it, for shortlists), and marked for
+            # provider-side prompt caching
+            system_prompt = prompt_registry.get_prompt(
+                "feature_tagging", shortlist=candidates is not None)
+            human_content = f"Feature: {feature_details}"
+            if candidates is not None:
+                human_content += f"\n\nCandidate Regulation Categories:\n{self.tag_pre_classifier.format_candidates_for_prompt(candidates)}"
+
+            # Create the chat prompt with separate system and human messages. Message objects
+            # are not templated, so the feature is formatted in directly
             chat_prompt = ChatPromptTemplate.from_messages([
-                SystemMessage(content=formatted_system_prompt),
-                HumanMessage(content="Feature: {feature_details}")
+                system_prompt.system_message,
+                HumanMessage(content=human_content)
             ])
 
-            # Create chain and invoke
+            # Create chain and invoke. Feature creation is user-facing, so it goes ahead of bulk analysis
             chain = chat_prompt | self.structured_llm
-            response = await chain.ainvoke({
-                "feature_details": str(feature.name + " " + feature.description)
-            })
 
+            def invoke():
+                return llm_telemetry.invoke_async("feature_tagging", llm.model, system_prompt, chain, estimate_tokens(human_content), LlmPriority.INTERACTIVE)
+
+            if self.llm_cache is None:
+                response = await invoke()
+            else:
+                cache_key = self._cache_key(
+                    system_prompt.version, feature_details, candidates)
+                response = await self.llm_cache.get_or_compute_async(
+                    "feature_tagging", cache_key, FeatureTaggingAgentResponse, invoke, bypass=bypass_cache)
+            self._record_llm_tags(prediction, response)
             return response
 
         except FileNotFoundError as e:
@@ -82,3 +133,105 @@ class FeatureTaggingAgent:
             raise ValueError(f"Invalid JSON in tags file: {e}")
         except Exception as e:
             raise RuntimeError(f"Error generating feature tags: {e}")
+
+    def _pack_batches(self, indexed_details: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """Greedily group (index, feature details) pairs under the token budget, keeping input order"""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for index, feature_details in indexed_details:
+            feature_tokens = estimate_tokens(feature_details)
+            if batch and (batch_tokens + feature_tokens > self.batch_token_budget or len(batch) >= self.batch_max_size):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            # A single feature over the budget still gets a batch of its own
+            batch.append((index, feature_details))
+            batch_tokens += feature_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _tag_batch_async(self, system_prompt, batch: List[Tuple[int, str]]) -> List[FeatureTaggingAgentResponse]:
+        """Tag a batch of features in one call. Raises ValueError unless every feature comes back exactly once"""
+        formatted_features = "\n\n".join(
+            f"[{position}] {feature_details}" for position, (_, feature_details) in enumerate(batch))
+        chat_prompt = ChatPromptTemplate.from_messages([
+            system_prompt.system_message,
+            HumanMessage(content=(
+                f"Tag each of the following {len(batch)} features independently, applying the "
+                "tag selection rules to every feature on its own. Return one entry per feature "
+                "with its number in brackets as the index and its tags.\n\n"
+                f"Features:\n{formatted_features}"
+            ))
+        ])
+        chain = chat_prompt | self.structured_batch_llm
+        batch_response = await llm_telemetry.invoke_async(
+            "feature_tagging_batch", llm.model, system_prompt, chain, estimate_tokens(formatted_features), LlmPriority.INTERACTIVE)
+
+        tags_by_position = {}
+        for item in batch_response.features:
+            if item.index in tags_by_position or not 0 <= item.index < len(batch):
+                raise ValueError(
+                    f"Unexpected feature index {item.index} in batch response")
+            tags_by_position[item.index] = item.tags
+        if len(tags_by_position) != len(batch):
+            raise ValueError(
+                f"Batch response covered {len(tags_by_position)} of {len(batch)} features")
+        return [FeatureTaggingAgentResponse(tags=tags_by_position[position]) for position in range(len(batch))]
+
+    async def generate_feature_tags_batch(self, features: Sequence[FeatureCreateRequest], bypass_cache: bool = False) -> List[FeatureTaggingAgentResponse]:
+        """Generate regulation tags for many features, several per LLM call. Responses are in input order.
+
+        Features the pre-classifier is confident about never reach the LLM. Batches carry the
+        full catalog, one shortlist per feature would not share a prompt.
+        """
+        try:
+            system_prompt = prompt_registry.get_prompt("feature_tagging")
+            responses: List[Optional[FeatureTaggingAgentResponse]] = [
+                None] * len(features)
+            predictions: List[Optional[TagPrediction]] = [
+                None] * len(features)
+            pending = []
+            for index, feature in enumerate(features):
+                feature_details = format_feature_details(feature)
+                predictions[index] = self._classify(feature_details)
+                if predictions[index] is not None and predictions[index].route == "local" and not predictions[index].shadow:
+                    responses[index] = FeatureTaggingAgentResponse(
+                        tags=predictions[index].tags)
+                    continue
+                if self.llm_cache is not None and not bypass_cache:
+                    responses[index] = await self.llm_cache.get_async(
+                        "feature_tagging", self._cache_key(system_prompt.version, feature_details), FeatureTaggingAgentResponse)
+                if responses[index] is None:
+                    pending.append((index, feature_details))
+
+            async def tag_batch(batch: List[Tuple[int, str]]):
+                try:
+                    batch_responses = await self._tag_batch_async(system_prompt, batch)
+                except Exception as e:
+                    # A malformed or partial batch is retried one feature at a time
+                    print(
+                        f"Batch tagging of {len(batch)} features failed, falling back to per-feature calls: {e}")
+                    batch_responses = await asyncio.gather(*[
+                        self.generate_feature_tags(features[index], bypass_cache=bypass_cache) for index, _ in batch])
+                    for (index, _), response in zip(batch, batch_responses):
+                        responses[index] = response
+                    return
+
+                for (index, feature_details), response in zip(batch, batch_responses):
+                    responses[index] = response
+                    self._record_llm_tags(predictions[index], response)
+                    if self.llm_cache is not None:
+                        await self.llm_cache.set_async(
+                            "feature_tagging", self._cache_key(system_prompt.version, feature_details), response)
+
+            await asyncio.gather(*[tag_batch(batch) for batch in self._pack_batches(pending)])
+            return responses
+
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Template or tags file not found: {e}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in tags file: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Error generating feature tags: {e}")
@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Type, TypeVar
+
+from pydantic import BaseModel
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+
+class LlmCache(Protocol):
+    """What the agents need from a response cache, implemented by LlmCacheService and injected by main"""
+
+    def make_key(self, agent: str, model: str, prompt_version: str, inputs: Dict[str, Any]) -> str:
+        ...
+
+    async def get_or_compute_async(self, agent: str, key: str, response_model: Type[ResponseT], compute: Callable[[], Awaitable[ResponseT]], bypass: bool = False) -> ResponseT:
+        ...
+
+    async def get_async(self, agent: str, key: str, response_model: Type[ResponseT]) -> Optional[ResponseT]:
+        ...
+
+    async def set_async(self, agent: str, key: str, response: BaseModel):
+        ...
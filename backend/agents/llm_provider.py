@@ -0,0 +1,287 @@
+"""LLM provider behind the agents' module-level `llm`.
+
+LLM_PROVIDER selects it:
+- anthropic (default): the real ChatAnthropic client
+- record: the real client, every structured response is also saved to a cassette
+- replay: responses come from cassettes, misses fall back to synthetic responses (or fail,
+  with LLM_REPLAY_ON_MISS=error)
+- synthetic: schema-valid made-up responses, no cassettes needed
+
+Replay and synthetic calls never touch the network. They wait out a latency drawn from
+LLM_REPLAY_LATENCY and fail with LLM_REPLAY_ERROR_STATUS at LLM_REPLAY_ERROR_RATE, so the whole
+request path, scheduler backoff included, can be load tested offline. Every draw is seeded by
+LLM_REPLAY_SEED and the call itself, so runs are repeatable whatever the concurrency.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import typing
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import anthropic
+import httpx
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from agents.prompt_registry import TAGS_PATH
+
+BACKEND_DIR = Path(__file__).parent.parent
+# (messages, rng, available tags) -> response
+SyntheticFactory = Callable[[List[BaseMessage], random.Random, List[str]], BaseModel]
+
+# Schemas whose synthetic responses need to follow the prompt, see register_synthetic_response
+_synthetic_factories: Dict[str, SyntheticFactory] = {}
+# One chat model per (model name, temperature), shared by the agent modules
+_llms: Dict[Tuple[str, float], Any] = {}
+
+
+def register_synthetic_response(schema: Type[BaseModel], factory: SyntheticFactory):
+    """Use factory(messages, rng, tags) for synthetic responses of schema instead of the generic generator"""
+    _synthetic_factories[schema.__name__] = factory
+
+
+def cassette_key(model: str, schema: Type[BaseModel], messages: List[BaseMessage]) -> str:
+    """Identifies a call by its model, output schema and the exact messages sent"""
+    payload = json.dumps({
+        "model": model,
+        "schema": schema.__name__,
+        "messages": [{"type": message.type, "content": message.content} for message in messages],
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random, Optional[float]], float]:
+    """Latency distribution in milliseconds from a spec like "lognormal:800:0.5" (median, sigma),
+    "uniform:200:1200", "fixed:300" or "recorded" (the latency seen when recording, else 0)
+    """
+    kind, *params = spec.split(":")
+    values = [float(param) for param in params]
+    if kind == "fixed":
+        return lambda rng, recorded: values[0]
+    if kind == "uniform":
+        return lambda rng, recorded: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng, recorded: median * rng.lognormvariate(0, sigma)
+    if kind == "recorded":
+        return lambda rng, recorded: recorded or 0.0
+    raise ValueError(f"Unknown latency distribution {spec}")
+
+
+def make_status_error(status_code: int) -> anthropic.APIStatusError:
+    """The error the Anthropic client raises for a response with this status"""
+    response = httpx.Response(status_code, request=httpx.Request(
+        "POST", "https://api.anthropic.com/v1/messages"))
+    message = f"Injected error {status_code}"
+    if status_code == 429:
+        return anthropic.RateLimitError(message, response=response, body=None)
+    if status_code >= 500:
+        return anthropic.InternalServerError(message, response=response, body=None)
+    return anthropic.APIStatusError(message, response=response, body=None)
+
+
+def synthesize_value(annotation: Any, field_name: str, rng: random.Random, tags: List[str]) -> Any:
+    """A plausible value of the annotated type, generic over the agents' response models"""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        options = [arg for arg in typing.get_args(
+            annotation) if arg is not type(None)]
+        return synthesize_value(options[0], field_name, rng, tags)
+    if origin in (list, List):
+        (item_type,) = typing.get_args(annotation)
+        if field_name == "tags" and item_type is str:
+            return rng.sample(tags, k=min(len(tags), rng.randint(1, 3)))
+        if item_type is str:
+            return []
+        return [synthesize_value(item_type, field_name, rng, tags) for _ in range(rng.randint(1, 3))]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return synthesize_model(annotation, rng, tags)
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return rng.choice(list(annotation))
+    if annotation is bool:
+        return rng.random() < 0.5
+    if annotation is float:
+        return round(rng.uniform(0.5, 1.0), 2)
+    if annotation is int:
+        return rng.randint(0, 10)
+    return f"Synthetic {field_name.replace('_', ' ')}"
+
+
+def synthesize_model(schema: Type[BaseModel], rng: random.Random, tags: List[str]) -> BaseModel:
+    return schema(**{
+        field_name: synthesize_value(field.annotation, field_name, rng, tags)
+        for field_name, field in schema.model_fields.items()
+    })
+
+
+class CassetteChatModel:
+    """Stands in for ChatAnthropic in the agents, for with_structured_output chains only"""
+
+    def __init__(self, mode: str, model: str, cassette_dir: Path, real_llm: Optional[ChatAnthropic] = None, latency: str = "recorded", error_rate: float = 0.0, error_status: int = 529, on_miss: str = "synthetic", seed: int = 0):
+        self.mode = mode
+        self.model = model
+        self.cassette_dir = cassette_dir
+        self.real_llm = real_llm
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.on_miss = on_miss
+        self.seed = seed
+
+        # schema name -> cassette key -> recorded entry, loaded on first use
+        self._cassettes: Dict[str, Dict[str, dict]] = {}
+        # Calls per key so far, retries of the same call draw differently
+        self._attempts: Dict[str, int] = {}
+        self._tags: Optional[List[str]] = None
+        self.stats = {"calls": 0, "replayed": 0,
+                      "synthetic": 0, "recorded": 0, "injected_errors": 0}
+
+    def _cassette_path(self, schema: Type[BaseModel]) -> Path:
+        return self.cassette_dir / f"{schema.__name__}.jsonl"
+
+    def _load_cassette(self, schema: Type[BaseModel]) -> Dict[str, dict]:
+        cassette = self._cassettes.get(schema.__name__)
+        if cassette is None:
+            cassette = {}
+            path = self._cassette_path(schema)
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            cassette[entry["key"]] = entry
+            self._cassettes[schema.__name__] = cassette
+        return cassette
+
+    def _available_tags(self) -> List[str]:
+        if self._tags is None:
+            with open(TAGS_PATH, "r", encoding="utf-8") as f:
+                self._tags = [tag["tag"]
+                              for tag in json.load(f)["regulation_tags"]]
+        return self._tags
+
+    def _record(self, schema: Type[BaseModel], key: str, response: BaseModel, latency_ms: float):
+        entry = {
+            "key": key,
+            "schema": schema.__name__,
+            "model": self.model,
+            "response": response.model_dump(mode="json"),
+            "latency_ms": round(latency_ms, 1),
+            "recorded_at": datetime.utcnow().isoformat(),
+        }
+        self.cassette_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._cassette_path(schema), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._load_cassette(schema)[key] = entry
+        self.stats["recorded"] += 1
+
+    async def _record_call(self, schema: Type[BaseModel], real_chain: Runnable, prompt_value) -> BaseModel:
+        started_at = time.perf_counter()
+        response = await real_chain.ainvoke(prompt_value)
+        self._record(schema, cassette_key(self.model, schema, prompt_value.to_messages()), response,
+                     (time.perf_counter() - started_at) * 1000)
+        return response
+
+    async def _replay_call(self, schema: Type[BaseModel], prompt_value) -> BaseModel:
+        messages = prompt_value.to_messages()
+        key = cassette_key(self.model, schema, messages)
+        attempt = self._attempts.get(key, 0)
+        self._attempts[key] = attempt + 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        self.stats["calls"] += 1
+
+        entry = self._load_cassette(schema).get(
+            key) if self.mode == "replay" else None
+        if entry is None and self.mode == "replay" and self.on_miss == "error":
+            raise LookupError(
+                f"No recorded {schema.__name__} response for this prompt in {self._cassette_path(schema)}")
+
+        await asyncio.sleep(self.latency(rng, entry["latency_ms"] if entry else None) / 1000)
+        if rng.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            raise make_status_error(self.error_status)
+
+        if entry is not None:
+            self.stats["replayed"] += 1
+            return schema(**entry["response"])
+        self.stats["synthetic"] += 1
+        factory = _synthetic_factories.get(schema.__name__)
+        if factory is not None:
+            return factory(messages, rng, self._available_tags())
+        return synthesize_model(schema, rng, self._available_tags())
+
+    def with_structured_output(self, schema: Type[BaseModel]) -> Runnable:
+        # Async functions, so the chains are awaited like the real model's (ainvoke only)
+        if self.mode == "record":
+            real_chain = self.real_llm.with_structured_output(schema)
+
+            async def record_call(prompt_value):
+                return await self._record_call(schema, real_chain, prompt_value)
+            return RunnableLambda(record_call)
+
+        async def replay_call(prompt_value):
+            return await self._replay_call(schema, prompt_value)
+        return RunnableLambda(replay_call)
+
+
+def _create_anthropic_llm(model: str, temperature: float) -> ChatAnthropic:
+    return ChatAnthropic(
+        model=model,
+        temperature=temperature,
+        max_tokens=max_output_tokens(),
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        # Rate limits are retried by the shared scheduler, which also backs off
+        max_retries=0
+    )
+
+
+def max_output_tokens() -> int:
+    """Longest response a call may produce, also what the scheduler reserves against the output budget"""
+    return int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "1024"))
+
+
+def create_llm(temperature: float = 0.2, model: Optional[str] = None):
+    """The chat model an agent module builds its chains on, per LLM_PROVIDER. ANTHROPIC_MODEL unless model is given"""
+    mode = os.getenv("LLM_PROVIDER", "anthropic").lower()
+    model = model or os.getenv("ANTHROPIC_MODEL") or mode
+    llm = _llms.get((model, temperature))
+    if llm is not None:
+        return llm
+
+    if mode == "anthropic":
+        llm = _create_anthropic_llm(model, temperature)
+    elif mode in ("record", "replay", "synthetic"):
+        llm = CassetteChatModel(
+            mode=mode,
+            model=model,
+            cassette_dir=BACKEND_DIR /
+            os.getenv("LLM_CASSETTE_DIR", "cassettes"),
+            real_llm=_create_anthropic_llm(
+                model, temperature) if mode == "record" else None,
+            latency=os.getenv("LLM_REPLAY_LATENCY", "recorded"),
+            error_rate=float(os.getenv("LLM_REPLAY_ERROR_RATE", "0")),
+            error_status=int(os.getenv("LLM_REPLAY_ERROR_STATUS", "529")),
+            on_miss=os.getenv("LLM_REPLAY_ON_MISS", "synthetic"),
+            seed=int(os.getenv("LLM_REPLAY_SEED", "0")),
+        )
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER {mode}")
+    _llms[(model, temperature)] = llm
+    return llm
+
+
+def get_provider_stats() -> dict:
+    """The provider in use and, for record, replay and synthetic, their call counters"""
+    return {
+        "provider": os.getenv("LLM_PROVIDER", "anthropic").lower(),
+        "stats": {f"{model}@{temperature}": dict(llm.stats) for (model, temperature), llm in _llms.items()
+                  if isinstance(llm, CassetteChatModel)},
+    }
@@ -0,0 +1,237 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple, TypeVar
+
+import anthropic
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+ResultT = TypeVar("ResultT")
+
+# Status codes the provider uses to ask clients to slow down: rate limited and overloaded
+RATE_LIMIT_STATUS_CODES = (429, 529)
+
+
+class LlmPriority(IntEnum):
+    """Lower values are admitted first"""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English prose"""
+    return len(text) // 4 + 1
+
+
+def min_cacheable_tokens(model: str) -> int:
+    """Shortest prompt prefix the provider caches, shorter ones are billed and rate limited in full"""
+    return 2048 if "haiku" in model.lower() else 1024
+
+
+def estimate_system_prompt_tokens(model: str, system_prompt_text: str) -> int:
+    """Input tokens a system prompt counts toward the rate limit.
+
+    Zero once it is long enough to be served from the prompt cache, cached reads do not count.
+    """
+    tokens = estimate_tokens(system_prompt_text)
+    return 0 if tokens >= min_cacheable_tokens(model) else tokens
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RATE_LIMIT_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay the provider asked for in its retry-after header, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LlmScheduler:
+    """Process-wide admission control for LLM calls, shared by every agent.
+
+    Calls are admitted in priority order while they fit the requests-per-minute, input
+    tokens-per-minute and output tokens-per-minute budgets and the current concurrency limit.
+    The limit grows by about one per limit's worth of successful calls and halves when the
+    provider rate limits or is overloaded; those calls are retried with jittered exponential
+    backoff.
+
+    Input estimates include the system prompt only when it is too short for the provider's
+    prompt cache, see estimate_system_prompt_tokens. Output is reserved at the call's
+    max_tokens, the provider counts it against its own output limit.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None, output_tokens_per_minute: Optional[int] = None, max_concurrency: Optional[int] = None, max_attempts: Optional[int] = None, backoff_max_seconds: Optional[float] = None):
+        self.requests_per_minute = requests_per_minute or int(
+            os.getenv("LLM_REQUESTS_PER_MINUTE", "50"))
+        self.tokens_per_minute = tokens_per_minute or int(
+            os.getenv("LLM_TOKENS_PER_MINUTE", "80000"))
+        self.output_tokens_per_minute = output_tokens_per_minute or int(
+            os.getenv("LLM_OUTPUT_TOKENS_PER_MINUTE", "16000"))
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.max_attempts = max_attempts or int(
+            os.getenv("LLM_MAX_ATTEMPTS", "6"))
+        self.backoff_max_seconds = backoff_max_seconds or float(
+            os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+
+        # Start halfway and let successes open it up
+        self.concurrency_limit = max(1.0, self.max_concurrency / 2)
+        self._in_flight = 0
+        # (admitted_at, input tokens, output tokens) of calls admitted in the last minute
+        self._window: Deque[Tuple[float, int, int]] = deque()
+        self._window_tokens = 0
+        self._window_output_tokens = 0
+        # (priority, arrival order, input tokens, output tokens, future) of calls waiting for admission
+        self._waiters: List[Tuple[int, int, int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0
+        self._last_decrease_at = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._stats = {"calls": 0, "retries": 0,
+                       "rate_limited": 0, "failures": 0}
+
+    def get_stats(self) -> dict:
+        self._prune_window(time.monotonic())
+        queued = {priority.name.lower(): 0 for priority in LlmPriority}
+        for priority, _, _, _, future in self._waiters:
+            if not future.done():
+                queued[LlmPriority(priority).name.lower()] += 1
+        return {
+            **self._stats,
+            "concurrency_limit": int(self.concurrency_limit),
+            "in_flight": self._in_flight,
+            "queued": queued,
+            "window_requests": len(self._window),
+            "window_tokens": self._window_tokens,
+            "window_output_tokens": self._window_output_tokens,
+        }
+
+    def _prune_window(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            _, tokens, output_tokens = self._window.popleft()
+            self._window_tokens -= tokens
+            self._window_output_tokens -= output_tokens
+
+    def _wait_seconds(self, now: float, tokens: int, output_tokens: int) -> Optional[float]:
+        """Seconds until a call of this size fits the budgets, 0 if it fits now, None if it waits on a running call"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= max(1, int(self.concurrency_limit)):
+            return None
+        if len(self._window) >= self.requests_per_minute:
+            return self._window[0][0] + 60 - now
+        # A call larger than the whole budget still runs, alone in the window
+        if self._window and (self._window_tokens + tokens > self.tokens_per_minute or
+                             self._window_output_tokens + output_tokens > self.output_tokens_per_minute):
+            return self._window[0][0] + 60 - now
+        return 0
+
+    def _dispatch(self):
+        self._wakeup = None
+        now = time.monotonic()
+        self._prune_window(now)
+        while self._waiters:
+            priority, _, tokens, output_tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait_seconds = self._wait_seconds(now, tokens, output_tokens)
+            if wait_seconds is None:
+                # Released calls dispatch again
+                return
+            if wait_seconds > 0:
+                # Strict priority: lower priorities never jump a call that is waiting on the budget
+                self._wakeup = asyncio.get_running_loop().call_later(
+                    wait_seconds, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            self._window.append((now, tokens, output_tokens))
+            self._window_tokens += tokens
+            self._window_output_tokens += output_tokens
+            future.set_result(None)
+
+    def _schedule_dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._dispatch()
+
+    async def _acquire_async(self, priority: LlmPriority, tokens: int, output_tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority),
+                       next(self._arrivals), tokens, output_tokens, future))
+        self._schedule_dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as the caller went away, hand the slot back
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._schedule_dispatch()
+
+    def _on_success(self):
+        self.concurrency_limit = min(
+            float(self.max_concurrency), self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def _on_rate_limited(self, error: BaseException):
+        now = time.monotonic()
+        self._stats["rate_limited"] += 1
+        retry_after = retry_after_seconds(error)
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        # Calls already in flight when the limit was hit fail together, that is one signal
+        if now - self._last_decrease_at >= 1:
+            self._last_decrease_at = now
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            print(
+                f"LLM rate limited, concurrency limit lowered to {int(self.concurrency_limit)}: {error}")
+
+    def _before_retry(self, retry_state: RetryCallState):
+        self._stats["retries"] += 1
+
+    async def run(self, call: Callable[[], Awaitable[ResultT]], estimated_tokens: int, priority: LlmPriority = LlmPriority.BULK, max_output_tokens: int = 0) -> ResultT:
+        """Run an LLM call once admitted, retrying it while the provider rate limits.
+
+        estimated_tokens is its input, max_output_tokens the output it may produce.
+        """
+        retrying = AsyncRetrying(
+            retry=retry_if_exception(is_rate_limited),
+            wait=wait_random_exponential(
+                multiplier=1, max=self.backoff_max_seconds),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=self._before_retry,
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                await self._acquire_async(priority, estimated_tokens, max_output_tokens)
+                self._stats["calls"] += 1
+                try:
+                    result = await call()
+                except Exception as e:
+                    if is_rate_limited(e):
+                        self._on_rate_limited(e)
+                    else:
+                        self._stats["failures"] += 1
+                    raise
+                finally:
+                    self._release()
+                self._on_success()
+        return result
+
+
+llm_scheduler = LlmScheduler()
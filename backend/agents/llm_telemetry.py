@@ -0,0 +1,309 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from agents.llm_provider import get_provider_stats, max_output_tokens
+from agents.llm_scheduler import LlmPriority, estimate_system_prompt_tokens, estimate_tokens, is_rate_limited, llm_scheduler
+from model.llm_telemetry import LlmCallRecord, LlmUsage
+
+# Route of the request being served, like "POST /compliance/analyze-sources", see EndpointContextMiddleware
+current_endpoint: ContextVar[Optional[str]] = ContextVar(
+    "llm_telemetry_endpoint", default=None)
+# Analysis run the calls belong to, see LlmTelemetry.track_run
+current_run_id: ContextVar[Optional[str]] = ContextVar(
+    "llm_telemetry_run_id", default=None)
+# Usage totals open in this context, see LlmTelemetry.collect
+_collectors: ContextVar[Tuple[LlmUsage, ...]] = ContextVar(
+    "llm_telemetry_collectors", default=())
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Sums the token usage the provider reports for the chat model runs of a chain"""
+
+    def __init__(self):
+        self.reported = False
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None),
+                                "usage_metadata", None)
+                if not usage:
+                    continue
+                self.reported = True
+                details = usage.get("input_token_details") or {}
+                cache_read = details.get("cache_read") or 0
+                cache_creation = details.get("cache_creation") or 0
+                # The reported input tokens include the cached reads and writes
+                self.input_tokens += usage.get("input_tokens",
+                                               0) - cache_read - cache_creation
+                self.cached_input_tokens += cache_read
+                self.cache_creation_input_tokens += cache_creation
+                self.output_tokens += usage.get("output_tokens", 0)
+
+
+def _new_aggregate(recent_size: int) -> dict:
+    return {
+        "calls": 0, "failed_calls": 0, "rate_limited_calls": 0, "retries": 0,
+        "input_tokens": 0, "cached_input_tokens": 0, "cache_creation_input_tokens": 0, "output_tokens": 0,
+        "cost_usd": 0.0, "latency_ms": 0.0, "queue_ms": 0.0,
+        "recent_latencies_ms": deque(maxlen=recent_size),
+    }
+
+
+def _percentile(ordered: list, fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 1)
+
+
+def _summarize(aggregate: dict) -> dict:
+    latencies = sorted(aggregate["recent_latencies_ms"])
+    calls = aggregate["calls"]
+    summary = {key: value for key, value in aggregate.items()
+               if key not in ("recent_latencies_ms", "latency_ms", "queue_ms")}
+    summary["cost_usd"] = round(aggregate["cost_usd"], 6)
+    summary["mean_latency_ms"] = round(
+        aggregate["latency_ms"] / calls, 1) if calls else None
+    summary["mean_queue_ms"] = round(
+        aggregate["queue_ms"] / calls, 1) if calls else None
+    # Over the most recent calls only
+    summary["p50_latency_ms"] = _percentile(latencies, 0.5)
+    summary["p95_latency_ms"] = _percentile(latencies, 0.95)
+    return summary
+
+
+class LlmTelemetry:
+    """Per-call LLM telemetry, aggregated per agent, per endpoint and per analysis run.
+
+    Every agent invocation goes through invoke_async, which runs it on the shared scheduler and
+    records model, prompt version, token usage (as reported by the provider, estimated when it
+    reports none), latency, retries, outcome and cost. Totals are kept in memory since startup.
+    """
+
+    def __init__(self, max_runs: Optional[int] = None, recent_size: Optional[int] = None, input_price: Optional[float] = None, output_price: Optional[float] = None, cache_read_price: Optional[float] = None, cache_write_price: Optional[float] = None):
+        self.max_runs = max_runs or int(
+            os.getenv("LLM_TELEMETRY_MAX_RUNS", "100"))
+        self.recent_size = recent_size or int(
+            os.getenv("LLM_TELEMETRY_RECENT_CALLS", "500"))
+        # USD per million tokens
+        self.input_price = input_price if input_price is not None else float(
+            os.getenv("LLM_PRICE_INPUT_PER_MTOK", "3"))
+        self.output_price = output_price if output_price is not None else float(
+            os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "15"))
+        self.cache_read_price = cache_read_price if cache_read_price is not None else float(
+            os.getenv("LLM_PRICE_CACHE_READ_PER_MTOK", "0.3"))
+        self.cache_write_price = cache_write_price if cache_write_price is not None else float(
+            os.getenv("LLM_PRICE_CACHE_WRITE_PER_MTOK", "3.75"))
+        # Prices of other models, like a cheaper screening model, as JSON:
+        # {"<model>": {"input": 0.8, "output": 4, "cache_read": 0.08, "cache_write": 1}}
+        self.model_prices: Dict[str, Dict[str, float]] = json.loads(
+            os.getenv("LLM_MODEL_PRICES") or "{}")
+
+        self._agents: Dict[str, dict] = {}
+        self._endpoints: Dict[str, dict] = {}
+        # run id -> {"started_at", "totals", "agents"}, oldest evicted first
+        self._runs: "OrderedDict[str, dict]" = OrderedDict()
+        self._recent_calls: Deque[LlmCallRecord] = deque(
+            maxlen=self.recent_size)
+
+    def cost_usd(self, model: str, input_tokens: int, cached_input_tokens: int, cache_creation_input_tokens: int, output_tokens: int) -> float:
+        prices = self.model_prices.get(model, {})
+        return (input_tokens * prices.get("input", self.input_price) +
+                cached_input_tokens * prices.get("cache_read", self.cache_read_price) +
+                cache_creation_input_tokens * prices.get("cache_write", self.cache_write_price) +
+                output_tokens * prices.get("output", self.output_price)) / 1_000_000
+
+    @contextmanager
+    def track_run(self, run_id: str) -> Iterator[str]:
+        """Attribute the calls made in this context, tasks started from it included, to an analysis run"""
+        self._get_run(run_id)
+        token = current_run_id.set(run_id)
+        try:
+            yield run_id
+        finally:
+            current_run_id.reset(token)
+
+    @contextmanager
+    def collect(self) -> Iterator[LlmUsage]:
+        """Totals of the calls made in this context, for example the calls behind one audit report"""
+        usage = LlmUsage()
+        token = _collectors.set(_collectors.get() + (usage,))
+        try:
+            yield usage
+        finally:
+            _collectors.reset(token)
+
+    def _get_run(self, run_id: str) -> dict:
+        run = self._runs.get(run_id)
+        if run is None:
+            run = {"started_at": datetime.utcnow(), "totals": _new_aggregate(self.recent_size),
+                   "agents": {}}
+            self._runs[run_id] = run
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        return run
+
+    @staticmethod
+    def _add(aggregate: dict, record: LlmCallRecord):
+        aggregate["calls"] += 1
+        aggregate["failed_calls"] += int(record.outcome != "success")
+        aggregate["rate_limited_calls"] += int(record.outcome == "rate_limited")
+        aggregate["retries"] += record.retries
+        aggregate["input_tokens"] += record.input_tokens
+        aggregate["cached_input_tokens"] += record.cached_input_tokens
+        aggregate["cache_creation_input_tokens"] += record.cache_creation_input_tokens
+        aggregate["output_tokens"] += record.output_tokens
+        aggregate["cost_usd"] += record.cost_usd
+        aggregate["latency_ms"] += record.latency_ms
+        aggregate["queue_ms"] += record.queue_ms
+        aggregate["recent_latencies_ms"].append(record.latency_ms)
+
+    def record(self, record: LlmCallRecord):
+        self._recent_calls.append(record)
+        self._add(self._agents.setdefault(
+            record.agent, _new_aggregate(self.recent_size)), record)
+        self._add(self._endpoints.setdefault(
+            record.endpoint or "background", _new_aggregate(self.recent_size)), record)
+        if record.run_id is not None:
+            run = self._get_run(record.run_id)
+            self._add(run["totals"], record)
+            self._add(run["agents"].setdefault(
+                record.agent, _new_aggregate(self.recent_size)), record)
+
+        for usage in _collectors.get():
+            usage.calls += 1
+            usage.failed_calls += int(record.outcome != "success")
+            usage.input_tokens += record.input_tokens
+            usage.cached_input_tokens += record.cached_input_tokens
+            usage.cache_creation_input_tokens += record.cache_creation_input_tokens
+            usage.output_tokens += record.output_tokens
+            usage.queue_ms = round(usage.queue_ms + record.queue_ms, 1)
+            usage.latency_ms = round(usage.latency_ms + record.latency_ms, 1)
+            usage.retries += record.retries
+            usage.cost_usd = round(usage.cost_usd + record.cost_usd, 6)
+            usage.usage_estimated = usage.usage_estimated or record.usage_estimated
+            if record.model not in usage.models:
+                usage.models.append(record.model)
+            usage.prompt_versions[record.agent] = record.prompt_version
+
+        if record.outcome != "success":
+            print(f"LLM call of {record.agent} failed ({record.outcome}) after {record.retries} retries "
+                  f"and {record.latency_ms:.0f} ms: {record.error}")
+
+    async def invoke_async(self, agent: str, model: str, system_prompt, chain: Runnable, estimated_tokens: int, priority: LlmPriority = LlmPriority.BULK) -> Any:
+        """chain.ainvoke({}) on the shared scheduler, recorded as one call of agent.
+
+        estimated_tokens is the input besides the system prompt, which is added here when the
+        provider cannot cache it.
+        """
+        usage = UsageCallbackHandler()
+        attempts = 0
+        call_ms = 0.0
+
+        async def call():
+            nonlocal attempts, call_ms
+            attempts += 1
+            call_started_at = time.perf_counter()
+            try:
+                return await chain.ainvoke({}, config={"callbacks": [usage]})
+            finally:
+                call_ms += (time.perf_counter() - call_started_at) * 1000
+
+        started_at = time.perf_counter()
+        response = None
+        outcome = "success"
+        error = None
+        try:
+            response = await llm_scheduler.run(
+                call, estimated_tokens + estimate_system_prompt_tokens(model, system_prompt.text), priority, max_output_tokens())
+            return response
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "rate_limited" if is_rate_limited(e) else "error"
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if usage.reported:
+                input_tokens = usage.input_tokens
+                cached_input_tokens = usage.cached_input_tokens
+                cache_creation_input_tokens = usage.cache_creation_input_tokens
+                output_tokens = usage.output_tokens
+            else:
+                # Replay and synthetic providers report nothing, count what would have been sent
+                input_tokens = (estimated_tokens + estimate_tokens(system_prompt.text)) * attempts
+                cached_input_tokens = 0
+                cache_creation_input_tokens = 0
+                output_tokens = estimate_tokens(response.model_dump_json()) if isinstance(
+                    response, BaseModel) else 0
+            self.record(LlmCallRecord(
+                agent=agent,
+                model=model,
+                prompt_version=system_prompt.version,
+                outcome=outcome,
+                error=error,
+                input_tokens=input_tokens,
+                cached_input_tokens=cached_input_tokens,
+                cache_creation_input_tokens=cache_creation_input_tokens,
+                output_tokens=output_tokens,
+                usage_estimated=not usage.reported,
+                queue_ms=round(
+                    max(0.0, (time.perf_counter() - started_at) * 1000 - call_ms), 1),
+                latency_ms=round(call_ms, 1),
+                retries=max(0, attempts - 1),
+                cost_usd=round(self.cost_usd(model, input_tokens, cached_input_tokens,
+                                             cache_creation_input_tokens, output_tokens), 6),
+                endpoint=current_endpoint.get(),
+                run_id=current_run_id.get(),
+                created_at=datetime.utcnow(),
+            ))
+
+    def get_run_stats(self, run_id: str) -> Optional[dict]:
+        run = self._runs.get(run_id)
+        if run is None:
+            return None
+        return {
+            "run_id": run_id,
+            "started_at": run["started_at"].isoformat(),
+            "totals": _summarize(run["totals"]),
+            "agents": {agent: _summarize(aggregate) for agent, aggregate in run["agents"].items()},
+        }
+
+    def get_recent_calls(self, limit: int = 50) -> list:
+        return [record.model_dump(mode="json") for record in list(self._recent_calls)[-limit:]]
+
+    def get_stats(self) -> dict:
+        return {
+            "prices_usd_per_million_tokens": {
+                "input": self.input_price, "output": self.output_price,
+                "cache_read": self.cache_read_price, "cache_write": self.cache_write_price,
+                "models": self.model_prices,
+            },
+            "agents": {agent: _summarize(aggregate) for agent, aggregate in self._agents.items()},
+            "endpoints": {endpoint: _summarize(aggregate) for endpoint, aggregate in self._endpoints.items()},
+            # Most recent last
+            "runs": [{"run_id": run_id, "started_at": run["started_at"].isoformat(), **_summarize(run["totals"])}
+                     for run_id, run in self._runs.items()],
+            "scheduler": llm_scheduler.get_stats(),
+            "provider": get_provider_stats(),
+        }
+
+
+llm_telemetry = LlmTelemetry()
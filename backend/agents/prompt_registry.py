@@ -0,0 +1,113 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import xxhash
+from langchain_core.messages import SystemMessage
+
+AGENTS_DIR = Path(__file__).parent
+TEMPLATES_DIR = AGENTS_DIR / "templates"
+RESOURCES_DIR = AGENTS_DIR / "resources"
+TAGS_PATH = RESOURCES_DIR / "list_of_tags.json"
+# Stands in for the catalog when a pre-classifier has narrowed it down for the call
+SHORTLIST_NOTICE = ("The candidate categories for this input are listed in the message "
+                    "that contains it. They are the provided available_tags list, choose only from them.")
+
+
+def format_tags_for_prompt(tags_data: dict) -> str:
+    """Format JSON tags for prompt injection"""
+    formatted = []
+    for tag in tags_data["regulation_tags"]:
+        formatted.append(
+            f"• **{tag['tag']}** - {tag['name']}\n"
+            f"  Description: {tag['description']}\n"
+            f"  Examples: {', '.join(tag['examples'])}"
+        )
+    return "\n\n".join(formatted)
+
+
+class CompiledPrompt:
+    """A system prompt with its placeholders filled, versioned by the hash of its final text"""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.version = xxhash.xxh3_64_hexdigest(text)
+        # Built once, the same object is reused by every call
+        self.system_message = SystemMessage(content=[{
+            "type": "text",
+            "text": text,
+            # Everything up to here (tool schema and system prompt) is identical across calls,
+            # so the provider can serve it from its prompt cache
+            "cache_control": {"type": "ephemeral"},
+        }])
+
+
+class PromptRegistry:
+    """Compiles agent templates once and recompiles them only when their files change"""
+
+    def __init__(self, reload_interval_seconds: Optional[float] = None):
+        self.reload_interval_seconds = reload_interval_seconds if reload_interval_seconds is not None else float(
+            os.getenv("PROMPT_RELOAD_INTERVAL_SECONDS", "2"))
+        # name -> (compiled prompt, mtimes of the files it was built from, last time they were checked)
+        self._prompts: Dict[str, Tuple[CompiledPrompt,
+                                       Dict[Path, int], float]] = {}
+
+    def _compile(self, name: str, shortlist: bool = False) -> Tuple[CompiledPrompt, Dict[Path, int]]:
+        template_path = TEMPLATES_DIR / f"{name}.md"
+        # Stat before reading, so an edit landing in between is picked up on the next check
+        mtimes = {template_path: template_path.stat().st_mtime_ns}
+        text = template_path.read_text(encoding="utf-8")
+        if shortlist:
+            text = text.replace("{available_tags}", SHORTLIST_NOTICE)
+        elif "{available_tags}" in text:
+            mtimes[TAGS_PATH] = TAGS_PATH.stat().st_mtime_ns
+            with open(TAGS_PATH, "r", encoding="utf-8") as f:
+                available_tags = json.load(f)
+            # Simple string replacement instead of PromptTemplate to avoid curly brace conflicts
+            text = text.replace("{available_tags}",
+                                format_tags_for_prompt(available_tags))
+
+        if shortlist:
+            name = f"{name}:shortlist"
+        prompt = CompiledPrompt(name, text)
+        print(f"Compiled prompt {name} version {prompt.version}")
+        return prompt, mtimes
+
+    def _is_stale(self, mtimes: Dict[Path, int]) -> bool:
+        try:
+            return any(path.stat().st_mtime_ns != mtime for path, mtime in mtimes.items())
+        except FileNotFoundError:
+            return True
+
+    def get_prompt(self, name: str, shortlist: bool = False) -> CompiledPrompt:
+        """Compiled system prompt for templates/<name>.md.
+
+        With shortlist the tag catalog is left out, the caller sends candidate tags with the input.
+        """
+        now = time.monotonic()
+        key = f"{name}:shortlist" if shortlist else name
+        cached = self._prompts.get(key)
+        if cached is not None:
+            prompt, mtimes, checked_at = cached
+            if now - checked_at < self.reload_interval_seconds:
+                return prompt
+            if not self._is_stale(mtimes):
+                self._prompts[key] = (prompt, mtimes, now)
+                return prompt
+            try:
+                # Hot reload after an edit. A half-written or broken file keeps the last good version
+                prompt, mtimes = self._compile(name, shortlist)
+            except (OSError, ValueError) as e:
+                print(f"Error reloading prompt {key}, keeping version {prompt.version}: {e}")
+            self._prompts[key] = (prompt, mtimes, now)
+            return prompt
+
+        prompt, mtimes = self._compile(name, shortlist)
+        self._prompts[key] = (prompt, mtimes, now)
+        return prompt
+
+
+prompt_registry = PromptRegistry()
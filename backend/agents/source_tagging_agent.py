@@ -1,20 +1,22 @@
-import os
 import json
-from pathlib import Path
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
+from agents.llm_provider import create_llm
+from agents.llm_scheduler import LlmPriority, estimate_tokens
+from agents.llm_telemetry import llm_telemetry
+from agents.prompt_registry import prompt_registry
+from agents.tag_pre_classifier import TagPreClassifier
+from agents.llm_cache import LlmCache
+from agents.text_processing import normalize_text
 from model.source import Source
-from model.source_content import SourceContent
+from model.source_content import SourceContent, compute_content_hash
 import dotenv
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 dotenv.load_dotenv()
 
-llm = ChatAnthropic(model=os.getenv("ANTHROPIC_MODEL"),
-                    temperature=0.2,
-                    api_key=os.getenv("ANTHROPIC_API_KEY"))
+llm = create_llm(temperature=0.2)
 
 
 class SourceTaggingAgentResponse(BaseModel):
@@ -22,57 +24,71 @@ class SourceTaggingAgentResponse(BaseModel):
 
 
 class SourceTaggingAgent:
-    def __init__(self):
+    def __init__(self, llm_cache: Optional[LlmCache] = None, tag_pre_classifier: Optional[TagPreClassifier] = None):
         self.structured_llm = llm.with_structured_output(
             SourceTaggingAgentResponse)
+        self.llm_cache = llm_cache
+        self.tag_pre_classifier = tag_pre_classifier
 
-    def _load_available_tags(self) -> dict:
-        """Load and parse the available tags from JSON file"""
-        current_dir = Path(__file__).parent
-        tags_path = current_dir / "resources" / "list_of_tags.json"
-
-        with open(tags_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    def _format_tags_for_prompt(self, tags_data: dict) -> str:
-        """Format JSON tags for prompt injection"""
-        formatted = []
-        for tag in tags_data["regulation_tags"]:
-            formatted.append(
-                f"• **{tag['tag']}** - {tag['name']}\n"
-                f"  Description: {tag['description']}\n"
-                f"  Examples: {', '.join(tag['examples'])}"
-            )
-        return "\n\n".join(formatted)
-
-    async def generate_source_tags(self, source: Source, source_content: SourceContent) -> SourceTaggingAgentResponse:
+    async def generate_source_tags(self, source: Source, source_content: SourceContent, bypass_cache: bool = False) -> SourceTaggingAgentResponse:
         """Generate tags for a given source and source content"""
         try:
-            # Load system prompt template
-            current_dir = Path(__file__).parent
-            template_path = current_dir / "templates" / "feature_tagging.md"
-            system_template_content = template_path.read_text(encoding='utf-8')
-
-            # Load and format available tags
-            available_tags = self._load_available_tags()
-            formatted_tags = self._format_tags_for_prompt(available_tags)
-
-            # Simple string replacement instead of PromptTemplate to avoid curly brace conflicts
-            formatted_system_prompt = system_template_content.replace(
-                "{available_tags}", formatted_tags)
-
-            chain_prompt = ChatPromptTemplate.from_messages([
-                SystemMessage(content=formatted_system_prompt),
-                HumanMessage(content=f"Source: {source}"),
-                HumanMessage(content=f"Source Content: {source_content}"),
-            ])
+            source_text = f"Title: {source_content.title}\n{source_content.content}"
+            # Clear-cut pages are tagged locally, the rest get a shortlist when there is one
+            prediction = None
+            candidates = None
+            if self.tag_pre_classifier is not None:
+                prediction = self.tag_pre_classifier.classify(
+                    "source_tagging", source_text)
+                if prediction.route == "local" and not prediction.shadow:
+                    return SourceTaggingAgentResponse(tags=prediction.tags)
+                if prediction.route == "shortlist":
+                    candidates = prediction.candidates
+
+            # Compiled once with the tag catalog (or without it, for shortlists), and marked for
+            # provider-side prompt caching
+            system_prompt = prompt_registry.get_prompt(
+                "source_tagging", shortlist=candidates is not None)
+
+            messages = [
+                system_prompt.system_message,
+                # Only what the tagger reads, not the whole models with their
+                # fingerprints and signatures
+                HumanMessage(content=f"Source: {source.source_url}"),
+                HumanMessage(content=f"Source Content:\n{source_text}"),
+            ]
+            if candidates is not None:
+                messages.append(HumanMessage(
+                    content=f"Candidate Regulation Categories:\n{self.tag_pre_classifier.format_candidates_for_prompt(candidates)}"))
+            chain_prompt = ChatPromptTemplate.from_messages(messages)
 
             chain = chain_prompt | self.structured_llm
-            response = await chain.ainvoke({
-                "source": source,
-                "source_content": source_content,
-            })
-
+            # Tagging runs in background refreshes, behind user-facing calls
+            estimated_tokens = estimate_tokens(
+                source.source_url) + estimate_tokens(source_content.content or "")
+
+            def invoke():
+                return llm_telemetry.invoke_async("source_tagging", llm.model, system_prompt, chain, estimated_tokens, LlmPriority.BULK)
+
+            if self.llm_cache is None:
+                response = await invoke()
+            else:
+                # Keyed by the content fingerprint, an unchanged page is never tagged twice
+                inputs = {
+                    "source_url": source.source_url,
+                    "title": normalize_text(source_content.title),
+                    "content_hash": source_content.content_hash or compute_content_hash(source_content.title, source_content.content),
+                }
+                if candidates is not None:
+                    inputs["candidates"] = candidates
+                cache_key = self.llm_cache.make_key(
+                    "source_tagging", llm.model, system_prompt.version, inputs)
+                response = await self.llm_cache.get_or_compute_async(
+                    "source_tagging", cache_key, SourceTaggingAgentResponse, invoke, bypass=bypass_cache)
+
+            if prediction is not None:
+                self.tag_pre_classifier.record_llm_tags(
+                    "source_tagging", prediction, response.tags)
             return response
 
         except FileNotFoundError as e:
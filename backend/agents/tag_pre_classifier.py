@@ -0,0 +1,226 @@
+import json
+import math
+import os
+import random
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from agents.prompt_registry import TAGS_PATH, format_tags_for_prompt
+from agents.text_processing import tokenize
+
+# Example phrases are what a feature or regulation actually mentions, so they weigh more
+# than the words of a tag's name and description
+EXAMPLE_WEIGHT = 2
+
+
+def stem(token: str) -> str:
+    """Crude plural folding, enough for "logs" to match "log" """
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def stem_tokens(text: str) -> List[str]:
+    return [stem(token) for token in tokenize(text)]
+
+
+class TagPrediction(BaseModel):
+    # "local": confident, the tags are decided without the LLM
+    # "shortlist": the LLM chooses among candidates
+    # "catalog": nothing scored, the LLM sees the whole catalog
+    route: str
+    tags: List[str] = []
+    candidates: List[str] = []
+    scores: Dict[str, float] = {}
+    # A confident decision also sent to the LLM to measure agreement
+    shadow: bool = False
+
+
+class TagPreClassifier:
+    """TF-IDF and example phrase scoring of text against the regulation tag catalog.
+
+    Decides the tags alone when the scores separate cleanly into clear matches and clear
+    non-matches, otherwise narrows the catalog to a few candidates for the LLM.
+    """
+
+    def __init__(self, accept_score: Optional[float] = None, reject_score: Optional[float] = None, max_candidates: Optional[int] = None, shadow_rate: Optional[float] = None, enabled: Optional[bool] = None):
+        self.accept_score = accept_score or float(
+            os.getenv("TAG_CLASSIFIER_ACCEPT_SCORE", "0.35"))
+        self.reject_score = reject_score or float(
+            os.getenv("TAG_CLASSIFIER_REJECT_SCORE", "0.12"))
+        self.max_candidates = max_candidates or int(
+            os.getenv("TAG_CLASSIFIER_MAX_CANDIDATES", "6"))
+        self.shadow_rate = shadow_rate if shadow_rate is not None else float(
+            os.getenv("TAG_CLASSIFIER_SHADOW_RATE", "0.05"))
+        self.enabled = enabled if enabled is not None else os.getenv(
+            "TAG_CLASSIFIER_ENABLED", "true").lower() == "true"
+        self.max_tags = 5
+
+        self._catalog_mtime: Optional[int] = None
+        self._tag_catalog: Dict[str, dict] = {}
+        self._idf: Dict[str, float] = {}
+        self._tag_vectors: Dict[str, Dict[str, float]] = {}
+        self._postings: Dict[str, List[Tuple[str, float]]] = {}
+        self._tag_phrases: Dict[str, List[List[str]]] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._load_catalog()
+
+    def _load_catalog(self):
+        catalog_mtime = TAGS_PATH.stat().st_mtime_ns
+        if catalog_mtime == self._catalog_mtime:
+            return
+        with open(TAGS_PATH, "r", encoding="utf-8") as f:
+            tags_data = json.load(f)
+
+        tag_terms: Dict[str, Counter] = {}
+        tag_phrases: Dict[str, List[List[str]]] = {}
+        for tag_data in tags_data["regulation_tags"]:
+            terms = Counter(stem_tokens(
+                f"{tag_data['tag']} {tag_data['name']} {tag_data['description']}"))
+            phrases = [stem_tokens(example) for example in tag_data["examples"]]
+            for phrase in phrases:
+                for token in phrase:
+                    terms[token] += EXAMPLE_WEIGHT
+            tag_terms[tag_data["tag"]] = terms
+            tag_phrases[tag_data["tag"]] = [phrase for phrase in phrases if phrase]
+
+        document_frequencies = Counter(
+            term for terms in tag_terms.values() for term in terms)
+        idf = {term: math.log(1 + len(tag_terms) / frequency)
+               for term, frequency in document_frequencies.items()}
+
+        self._tag_catalog = {tag_data["tag"]: tag_data
+                             for tag_data in tags_data["regulation_tags"]}
+        self._idf = idf
+        self._tag_vectors = {tag: self._normalize({term: (1 + math.log(count)) * idf[term] for term, count in terms.items()})
+                             for tag, terms in tag_terms.items()}
+        self._postings = {}
+        for tag, tag_vector in self._tag_vectors.items():
+            for term, weight in tag_vector.items():
+                self._postings.setdefault(term, []).append((tag, weight))
+        self._tag_phrases = tag_phrases
+        self._catalog_mtime = catalog_mtime
+
+    @staticmethod
+    def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    @staticmethod
+    def _contains_phrase(tokens: List[str], phrase: List[str]) -> bool:
+        length = len(phrase)
+        return any(tokens[i:i + length] == phrase for i in range(len(tokens) - length + 1))
+
+    def _score_tokens(self, tokens: List[str]) -> Tuple[Dict[str, float], Dict[str, int]]:
+        counts = Counter(token for token in tokens if token in self._idf)
+        query_vector = self._normalize({term: (1 + math.log(count)) * self._idf[term]
+                                        for term, count in counts.items()})
+        scores = dict.fromkeys(self._tag_vectors, 0.0)
+        # Only the tags sharing a term with the text are touched
+        for term, weight in query_vector.items():
+            for tag, tag_weight in self._postings[term]:
+                scores[tag] += weight * tag_weight
+
+        phrase_matches = dict.fromkeys(self._tag_vectors, 0)
+        for tag, phrases in self._tag_phrases.items():
+            phrase_matches[tag] = sum(1 for phrase in phrases
+                                      if len(phrase) > 1 and phrase[0] in counts and self._contains_phrase(tokens, phrase))
+            scores[tag] += 0.2 * min(phrase_matches[tag], 3)
+        return scores, phrase_matches
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Relevance of every tag to the text, cosine similarity plus a bonus per example phrase found"""
+        return self._score_tokens(stem_tokens(text))[0]
+
+    def classify(self, agent: str, text: str) -> TagPrediction:
+        """Route a tagging call: decide locally, shortlist candidates for the LLM, or leave it the whole catalog"""
+        self._load_catalog()
+        if not self.enabled:
+            return TagPrediction(route="catalog")
+
+        scores, phrase_matches = self._score_tokens(stem_tokens(text))
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        accepted = [tag for tag, score in ranked if score >= self.accept_score]
+        ambiguous = [tag for tag, score in ranked
+                     if self.reject_score <= score < self.accept_score]
+        rounded_scores = {tag: round(score, 4)
+                          for tag, score in ranked if score > 0}
+        # On short texts one shared rare word gives a high cosine, so deciding alone also needs
+        # every accepted tag to match one of its example phrases verbatim
+        grounded = all(phrase_matches[tag] > 0 for tag in accepted)
+
+        if accepted and grounded and not ambiguous and len(accepted) <= self.max_tags:
+            prediction = TagPrediction(route="local", tags=accepted,
+                                       candidates=accepted, scores=rounded_scores)
+            # A small sample of confident decisions still goes to the LLM, to keep measuring agreement
+            prediction.shadow = random.random() < self.shadow_rate
+        else:
+            # Padded to the full shortlist size, a tag the LLM would pick but that is missing
+            # here could not be chosen at all
+            candidates = [tag for tag, score in ranked[:self.max_candidates]
+                          if score > 0] if ranked and ranked[0][1] >= self.reject_score else []
+            prediction = TagPrediction(route="shortlist" if candidates else "catalog",
+                                       tags=accepted[:self.max_tags], candidates=candidates, scores=rounded_scores)
+
+        self._count(agent, prediction.route)
+        if prediction.route == "local" and not prediction.shadow:
+            self._count(agent, "llm_calls_avoided")
+        return prediction
+
+    def format_candidates_for_prompt(self, candidates: List[str]) -> str:
+        """Catalog entries of the candidate tags, in the same format as the full catalog in the system prompt"""
+        return format_tags_for_prompt({"regulation_tags": [self._tag_catalog[tag] for tag in candidates if tag in self._tag_catalog]})
+
+    def _count(self, agent: str, counter: str, amount: float = 1):
+        agent_stats = self._stats.setdefault(agent, {
+            "local": 0, "shortlist": 0, "catalog": 0, "llm_calls_avoided": 0,
+            "compared": 0, "exact_matches": 0, "jaccard_sum": 0.0,
+            "shortlist_compared": 0, "shortlist_jaccard_sum": 0.0,
+        })
+        agent_stats[counter] += amount
+
+    def record_llm_tags(self, agent: str, prediction: TagPrediction, llm_tags: List[str]):
+        """Compare the local prediction with the tags the LLM chose for the same input"""
+        predicted = set(prediction.tags)
+        chosen = set(llm_tags)
+        union = predicted | chosen
+        jaccard = len(predicted & chosen) / len(union) if union else 1.0
+        if prediction.route == "local":
+            self._count(agent, "compared")
+            self._count(agent, "exact_matches", int(predicted == chosen))
+            self._count(agent, "jaccard_sum", jaccard)
+        elif prediction.route == "shortlist":
+            self._count(agent, "shortlist_compared")
+            self._count(agent, "shortlist_jaccard_sum", jaccard)
+
+    def get_stats(self) -> dict:
+        agents = {}
+        for agent, agent_stats in self._stats.items():
+            classified = agent_stats["local"] + \
+                agent_stats["shortlist"] + agent_stats["catalog"]
+            agents[agent] = {
+                "classified": int(classified),
+                "decided_locally": int(agent_stats["local"]),
+                "shortlisted": int(agent_stats["shortlist"]),
+                "full_catalog": int(agent_stats["catalog"]),
+                "llm_calls_avoided": int(agent_stats["llm_calls_avoided"]),
+                # Agreement of confident local decisions with the LLM, from the shadow sample
+                "local_agreement": {
+                    "compared": int(agent_stats["compared"]),
+                    "exact_match_rate": agent_stats["exact_matches"] / agent_stats["compared"] if agent_stats["compared"] else None,
+                    "mean_jaccard": agent_stats["jaccard_sum"] / agent_stats["compared"] if agent_stats["compared"] else None,
+                },
+                # Overlap of the tags that cleared the accept score with what the LLM chose from the shortlist
+                "shortlist_agreement": {
+                    "compared": int(agent_stats["shortlist_compared"]),
+                    "mean_jaccard": agent_stats["shortlist_jaccard_sum"] / agent_stats["shortlist_compared"] if agent_stats["shortlist_compared"] else None,
+                },
+            }
+        return {
+            "enabled": self.enabled,
+            "accept_score": self.accept_score,
+            "reject_score": self.reject_score,
+            "agents": agents,
+        }
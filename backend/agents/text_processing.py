@@ -0,0 +1,18 @@
+import re
+from typing import List
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with",
+}
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of a prompt input, so reformatting alone never misses the cache"""
+    return " ".join(text.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words for lexical matching, without stopwords and single characters"""
+    return [token for token in WORD_PATTERN.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
@@ -2,22 +2,41 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routers import register_routers
+from routers.llm_telemetry import EndpointContextMiddleware
 from repository.feature_repository import FeatureRepositoryAsync
 from services.feature_service import FeatureService
 from repository.source_repository import SourceRepositoryAsync
 from services.source_service import SourceService
 from repository.source_content_repository import SourceContentRepositoryAsync
 from services.source_content_service import SourceContentService
+from repository.compression_dictionary_repository import CompressionDictionaryRepositoryAsync
+from services.content_compression_service import ContentCompressionService
+from repository.source_section_repository import SourceSectionRepositoryAsync
+from services.source_section_service import SourceSectionService
+from services.source_fetch_service import SourceFetchService
+from services.content_similarity_service import ContentSimilarityService
+from services.content_extraction_service import ContentExtractionService
 from services.knowledge_base_service import KnowledgeBaseService
+from repository.refresh_job_repository import RefreshJobRepositoryAsync
+from services.refresh_job_service import RefreshJobService
 from services.compliance_analysis_service import ComplianceAnalysisService
+from repository.analysis_ledger_repository import AnalysisLedgerRepositoryAsync
+from services.analysis_ledger_service import AnalysisLedgerService
+from repository.analysis_job_repository import AnalysisJobRepositoryAsync
+from services.analysis_job_service import AnalysisJobService
 
 from repository.audit_report_repository import AuditReportRepositoryAsync
 from services.audit_report_service import AuditReportService
 from services.compliance_action_service import ComplianceActionService
 
+from repository.llm_cache_repository import LlmCacheRepositoryAsync
+from services.llm_cache_service import LlmCacheService
+
 from agents.compliance_analyzer_agent import ComplianceAnalyzerAgent
 from agents.feature_tagging_agent import FeatureTaggingAgent
 from agents.source_tagging_agent import SourceTaggingAgent
+from agents.tag_pre_classifier import TagPreClassifier
+from agents.llm_telemetry import LlmTelemetry, llm_telemetry
 
 from dotenv import load_dotenv
 
@@ -48,37 +67,58 @@ def create_app():
         allow_headers=["*"],
     )
 
+    # Attributes LLM calls to the endpoint that made them
+    app.add_middleware(EndpointContextMiddleware)
+
     return app
 
 
-def setup_routes(app: FastAPI, feature_service: FeatureService, source_service: SourceService, source_content_service: SourceContentService, knowledge_base_service: KnowledgeBaseService, compliance_analysis_service: ComplianceAnalysisService, audit_report_service: AuditReportService, compliance_action_service: ComplianceActionService):
+def setup_routes(app: FastAPI, feature_service: FeatureService, source_service: SourceService, source_content_service: SourceContentService, knowledge_base_service: KnowledgeBaseService, refresh_job_service: RefreshJobService, compliance_analysis_service: ComplianceAnalysisService, analysis_job_service: AnalysisJobService, audit_report_service: AuditReportService, compliance_action_service: ComplianceActionService, llm_cache_service: LlmCacheService, tag_pre_classifier: TagPreClassifier, llm_telemetry: LlmTelemetry):
     """Register API routes with their dependencies."""
     register_routers(app, feature_service=feature_service,
                      source_service=source_service,
                      source_content_service=source_content_service,
                      knowledge_base_service=knowledge_base_service,
+                     refresh_job_service=refresh_job_service,
                      compliance_analysis_service=compliance_analysis_service,
+                     analysis_job_service=analysis_job_service,
                      audit_report_service=audit_report_service,
-                     compliance_action_service=compliance_action_service)
+                     compliance_action_service=compliance_action_service,
+                     llm_cache_service=llm_cache_service,
+                     tag_pre_classifier=tag_pre_classifier,
+                     llm_telemetry=llm_telemetry)
 
 
 def create_asgi_app():
     app = create_app()
 
+    llm_cache_repository = LlmCacheRepositoryAsync(
+        db_name="hacktok",
+        collection_name="llm_cache"
+    )
+
+    # Shared by every agent, so identical LLM calls are only paid for once
+    llm_cache_service = LlmCacheService(
+        llm_cache_repository=llm_cache_repository)
+
+    # Shared by both tagging agents, decides clear-cut tags without an LLM call
+    tag_pre_classifier = TagPreClassifier()
+
     feature_repository = FeatureRepositoryAsync(
         db_name="hacktok",
         collection_name="features"
     )
 
     feature_service = FeatureService(
-        feature_repository=feature_repository, feature_tagging_agent=FeatureTaggingAgent())
+        feature_repository=feature_repository, feature_tagging_agent=FeatureTaggingAgent(llm_cache=llm_cache_service, tag_pre_classifier=tag_pre_classifier))
 
     source_repository = SourceRepositoryAsync(
         db_name="hacktok",
         collection_name="sources"
     )
 
-    source_tagging_agent = SourceTaggingAgent()
+    source_tagging_agent = SourceTaggingAgent(
+        llm_cache=llm_cache_service, tag_pre_classifier=tag_pre_classifier)
 
     source_service = SourceService(
         source_repository=source_repository, source_tagging_agent=source_tagging_agent)
@@ -88,14 +128,48 @@ def create_asgi_app():
         collection_name="source_contents"
     )
 
+    compression_dictionary_repository = CompressionDictionaryRepositoryAsync(
+        db_name="hacktok",
+        collection_name="compression_dictionaries"
+    )
+
+    content_compression_service = ContentCompressionService(
+        compression_dictionary_repository=compression_dictionary_repository)
+
     source_content_service = SourceContentService(
-        source_content_repository=source_content_repository)
+        source_content_repository=source_content_repository,
+        content_compression_service=content_compression_service)
+
+    source_section_repository = SourceSectionRepositoryAsync(
+        db_name="hacktok",
+        collection_name="source_sections"
+    )
+
+    source_section_service = SourceSectionService(
+        source_section_repository=source_section_repository)
+
+    source_fetch_service = SourceFetchService()
+    content_extraction_service = ContentExtractionService()
 
     knowledge_base_service = KnowledgeBaseService(
         source_service=source_service,
         source_content_service=source_content_service,
-        source_tagging_agent=source_tagging_agent
+        source_tagging_agent=source_tagging_agent,
+        source_fetch_service=source_fetch_service,
+        content_similarity_service=ContentSimilarityService(),
+        content_extraction_service=content_extraction_service,
+        source_section_service=source_section_service
+    )
+
+    refresh_job_repository = RefreshJobRepositoryAsync(
+        db_name="hacktok",
+        collection_name="refresh_jobs"
+    )
 
+    refresh_job_service = RefreshJobService(
+        refresh_job_repository=refresh_job_repository,
+        knowledge_base_service=knowledge_base_service,
+        source_service=source_service
     )
 
     audit_report_repository = AuditReportRepositoryAsync(
@@ -112,22 +186,69 @@ def create_asgi_app():
         feature_service=feature_service
     )
 
+    analysis_ledger_repository = AnalysisLedgerRepositoryAsync(
+        db_name="hacktok",
+        collection_name="analysis_ledger"
+    )
+
+    # Lets re-analyses skip the (feature, source) pairs whose inputs did not change
+    analysis_ledger_service = AnalysisLedgerService(
+        analysis_ledger_repository=analysis_ledger_repository)
+
     compliance_analysis_service = ComplianceAnalysisService(
         source_service=source_service,
         source_content_service=source_content_service,
+        source_section_service=source_section_service,
         feature_service=feature_service,
         audit_report_service=audit_report_service,
         compliance_action_service=compliance_action_service,
-        compliance_analyzer_agent=ComplianceAnalyzerAgent()
+        compliance_analyzer_agent=ComplianceAnalyzerAgent(llm_cache=llm_cache_service),
+        analysis_ledger_service=analysis_ledger_service
+    )
+
+    analysis_job_repository = AnalysisJobRepositoryAsync(
+        db_name="hacktok",
+        collection_name="analysis_jobs"
+    )
+
+    analysis_job_service = AnalysisJobService(
+        analysis_job_repository=analysis_job_repository,
+        compliance_analysis_service=compliance_analysis_service,
+        audit_report_service=audit_report_service,
+        compliance_action_service=compliance_action_service
     )
 
     setup_routes(app, feature_service=feature_service,
                  source_service=source_service,
                  source_content_service=source_content_service,
                  knowledge_base_service=knowledge_base_service,
+                 refresh_job_service=refresh_job_service,
                  compliance_analysis_service=compliance_analysis_service,
+                 analysis_job_service=analysis_job_service,
                  audit_report_service=audit_report_service,
-                 compliance_action_service=compliance_action_service)
+                 compliance_action_service=compliance_action_service,
+                 llm_cache_service=llm_cache_service,
+                 tag_pre_classifier=tag_pre_classifier,
+                 llm_telemetry=llm_telemetry)
+
+    app.add_event_handler("startup", content_compression_service.load_dictionaries_async)
+    app.add_event_handler("startup", feature_service.ensure_indexes_async)
+    app.add_event_handler("startup", source_service.ensure_indexes_async)
+    app.add_event_handler("startup", source_content_service.ensure_indexes_async)
+    app.add_event_handler("startup", source_section_service.ensure_indexes_async)
+    app.add_event_handler("startup", llm_cache_service.ensure_indexes_async)
+    app.add_event_handler("startup", knowledge_base_service.start_scheduler_async)
+    app.add_event_handler("startup", refresh_job_service.fail_orphaned_refresh_jobs_async)
+    app.add_event_handler("startup", audit_report_service.ensure_indexes_async)
+    app.add_event_handler("startup", analysis_job_service.ensure_indexes_async)
+    app.add_event_handler("startup", analysis_ledger_service.ensure_indexes_async)
+    app.add_event_handler("startup", analysis_job_service.start_workers_async)
+    app.add_event_handler("shutdown", knowledge_base_service.stop_scheduler_async)
+    app.add_event_handler("shutdown", analysis_job_service.stop_workers_async)
+
+    # Release pooled connections and extraction workers when the worker stops
+    app.add_event_handler("shutdown", source_fetch_service.close_async)
+    app.add_event_handler("shutdown", content_extraction_service.shutdown)
 
     return app
 
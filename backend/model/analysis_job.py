@@ -0,0 +1,72 @@
+from enum import Enum
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+
+class AnalysisJobKind(str, Enum):
+    # Features related to the given sources, like POST /compliance/analyze-sources
+    SOURCES = "sources"
+    # One feature against the sources sharing its tags, like POST /compliance/analyze-feature
+    FEATURE = "feature"
+
+
+class AnalysisJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class AnalysisJobStepStatus(str, Enum):
+    PENDING = "pending"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class AnalysisJobStep(BaseModel):
+    """The analysis of one feature against the job's sources, recorded as one audit report"""
+    feature_id: str
+    status: AnalysisJobStepStatus = AnalysisJobStepStatus.PENDING
+    audit_report_id: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class AnalysisJob(BaseModel):
+    id: Optional[str] = None
+    kind: AnalysisJobKind
+    status: AnalysisJobStatus = AnalysisJobStatus.PENDING
+    # The sources to analyze, or for a feature job the sources found by its tags once planned
+    source_ids: List[str] = []
+    feature_id: Optional[str] = None
+    bypass_cache: bool = False
+    # Analyze the features already analyzed against the same source versions too
+    force: bool = False
+    # Most features to analyze, the service's feature budget when None
+    max_features: Optional[int] = Field(None, ge=1)
+    # Planned on the first attempt, retries only redo the steps not completed
+    planned: bool = False
+    steps: List[AnalysisJobStep] = []
+    # Features left out when planning, their last analysis is still up to date
+    up_to_date_feature_ids: List[str] = []
+    # Related features left out when planning because the budget was spent on more relevant ones
+    over_budget_feature_ids: List[str] = []
+    total: int = 0
+    completed: int = 0
+    # Steps failed in the current attempt
+    failed: int = 0
+    # One analysis run per attempt, see GET /llm-telemetry/runs/{run_id}
+    run_ids: List[str] = []
+    attempts: int = 0
+    max_attempts: int = 3
+    # Not claimed before this time, pushed back after a failed attempt
+    available_at: datetime
+    # Worker holding the job and until when, an expired lease is claimed by another worker
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
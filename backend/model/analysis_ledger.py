@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+
+class AnalysisLedgerEntry(BaseModel):
+    """The last completed analysis of a feature against one source, and the inputs it was made from"""
+    id: Optional[str] = None
+    feature_id: str
+    source_url: str
+    # Fingerprints of the feature as analyzed, of the source version, and of the prompts and models
+    feature_revision: str
+    source_content_hash: str
+    analysis_version: str
+    audit_report_id: str
+    analyzed_at: datetime
@@ -1,10 +1,18 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class AnalyzeSourcesRequest(BaseModel):
     source_ids: List[str]
+    # Re-run every LLM call instead of reusing cached results, fresh results still refill the cache
+    bypass_cache: bool = False
+    # Analyze every feature again, including those already analyzed against the same source versions
+    force: bool = False
+    # Most features to analyze, the most relevant to the sources first. COMPLIANCE_FEATURE_BUDGET by default
+    max_features: Optional[int] = Field(None, ge=1)
 
 
 class AnalyzeFeatureRequest(BaseModel):
     feature_id: str
+    bypass_cache: bool = False
+    force: bool = False
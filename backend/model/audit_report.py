@@ -1,6 +1,7 @@
 from enum import Enum
 from pydantic import BaseModel
 from model.feature import FeatureStatus
+from model.llm_telemetry import LlmUsage
 from datetime import datetime
 from typing import List, Optional
 
@@ -20,6 +21,17 @@ class AuditReport(BaseModel):
     status_change_to: FeatureStatus
     reason: str
     confidence: float
+    # Ids of the source sections cited as evidence in the reason
+    section_ids: List[str] = []
+    # Analysis run that produced the report, see GET /llm-telemetry/runs/{run_id}
+    run_id: Optional[str] = None
+    # LLM calls behind this report, none when it was served from the result cache
+    llm_usage: Optional[LlmUsage] = None
+    # Model tier whose verdict this is, "screening" or "analysis" (escalated), and its model
+    decided_by_tier: Optional[str] = None
+    decided_by_model: Optional[str] = None
+    # Background analysis job that recorded the report, see GET /compliance/jobs/{job_id}
+    analysis_job_id: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     status: AuditReportStatus = AuditReportStatus.PENDING
@@ -33,6 +45,12 @@ class AuditReportCreateRequest(BaseModel):
     status_change_to: FeatureStatus
     reason: str
     confidence: float
+    section_ids: List[str] = []
+    run_id: Optional[str] = None
+    llm_usage: Optional[LlmUsage] = None
+    decided_by_tier: Optional[str] = None
+    decided_by_model: Optional[str] = None
+    analysis_job_id: Optional[str] = None
 
 
 class AuditReportUpdateRequest(BaseModel):
@@ -21,11 +21,25 @@ class Feature(BaseModel):
     updated_at: Optional[datetime] = None
 
 
+class RankedFeature(BaseModel):
+    """A feature related to a set of sources and how relevant it is to them"""
+    feature: Feature
+    matched_tags: int
+    # BM25 similarity of the feature to the sources, scaled to [0, 1] among the candidates
+    lexical_score: float
+    score: float
+
+
 class FeatureCreateRequest(BaseModel):
     name: str = Field(..., description="Name of the feature")
     description: str = Field(..., description="Description of the feature")
 
 
+class FeatureBulkCreateRequest(BaseModel):
+    features: List[FeatureCreateRequest] = Field(
+        ..., description="Features to create, tagged together in batches")
+
+
 class FeatureUpdateRequest(BaseModel):
     name: Optional[str] = Field(None, description="Name of the feature")
     description: Optional[str] = Field(
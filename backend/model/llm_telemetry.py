@@ -0,0 +1,48 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class LlmCallRecord(BaseModel):
+    """One agent invocation, its retries included"""
+    agent: str
+    model: str
+    prompt_version: str
+    # "success", "rate_limited" (retries exhausted) or "error"
+    outcome: str
+    error: Optional[str] = None
+    # Input tokens billed at the full rate, read from and written to the provider's prompt cache
+    input_tokens: int
+    cached_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    output_tokens: int
+    # True when the provider reported no usage (replay and synthetic providers) and tokens were estimated
+    usage_estimated: bool = False
+    # Admission wait in the scheduler, and time spent in provider calls across all attempts
+    queue_ms: float
+    latency_ms: float
+    retries: int = 0
+    cost_usd: float
+    endpoint: Optional[str] = None
+    run_id: Optional[str] = None
+    created_at: datetime
+
+
+class LlmUsage(BaseModel):
+    """LLM usage totals of a set of calls, such as the calls behind one audit report"""
+    calls: int = 0
+    failed_calls: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    output_tokens: int = 0
+    queue_ms: float = 0.0
+    latency_ms: float = 0.0
+    retries: int = 0
+    cost_usd: float = 0.0
+    usage_estimated: bool = False
+    models: List[str] = []
+    # Agent name -> prompt version used
+    prompt_versions: Dict[str, str] = {}
+    # Features whose analysis shared these calls, in "group" analysis mode
+    shared_by_features: int = 1
@@ -0,0 +1,34 @@
+from enum import Enum
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+
+class RefreshJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class RefreshJob(BaseModel):
+    id: Optional[str] = None
+    status: RefreshJobStatus = RefreshJobStatus.PENDING
+    # None means every source in the knowledge base
+    source_ids: Optional[List[str]] = None
+    total: int = 0
+    fetched: int = 0
+    unchanged: int = 0
+    changed: int = 0
+    failed: int = 0
+    changed_source_ids: List[str] = []
+    errors: List[dict] = []
+    error: Optional[str] = None
+    # Process running the job
+    worker_id: Optional[str] = None
+    # Renewed while the job runs, a stale one means its process is gone
+    heartbeat_at: Optional[datetime] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -7,6 +7,15 @@ class Source(BaseModel):
     id: Optional[str] = None
     source_url: str
     tags: Optional[List[str]] = None
+    # HTTP validators from the last successful fetch, used for conditional refreshes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+    # Fingerprint of the latest stored source content, see SourceContentService.compute_content_hash
+    content_hash: Optional[str] = None
+    # Adaptive refresh schedule, see KnowledgeBaseService
+    refresh_interval_seconds: Optional[int] = None
+    next_refresh_at: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -18,6 +27,12 @@ class SourceCreateRequest(BaseModel):
 
 class SourceUpdateRequest(BaseModel):
     tags: Optional[List[str]] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+    content_hash: Optional[str] = None
+    refresh_interval_seconds: Optional[int] = None
+    next_refresh_at: Optional[datetime] = None
 
 
 class SourceIdsRequest(BaseModel):
@@ -1,13 +1,29 @@
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import xxhash
+
+
+def compute_content_hash(title: str, content: str) -> str:
+    """Fast non-cryptographic fingerprint of an extracted title + content"""
+    hasher = xxhash.xxh3_64()
+    hasher.update(title.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(content.encode("utf-8"))
+    return hasher.hexdigest()
 
 
 class SourceContent(BaseModel):
     id: Optional[str] = None
     source_url: str
     title: str
-    content: str
+    # Stored zstd compressed. None when the content was not requested, see SourceContentService
+    content: Optional[str] = None
+    # Size of the uncompressed content in bytes
+    content_size: Optional[int] = None
+    content_hash: Optional[str] = None
+    # MinHash signature used for near-duplicate detection, see ContentSimilarityService
+    minhash_signature: Optional[List[int]] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -16,6 +32,7 @@ class SourceContentCreateRequest(BaseModel):
     source_url: str
     title: str
     content: str
+    minhash_signature: Optional[List[int]] = None
 
 
 class SourceContentUpdate(BaseModel):
@@ -23,3 +40,12 @@ class SourceContentUpdate(BaseModel):
     source_url: str
     title: str
     content: str
+    extraction_ms: Optional[float] = None
+
+
+class ExtractedSourceContent(BaseModel):
+    title: str
+    content: str
+    # Time spent inside Readability, and end to end including the wait for a worker
+    extraction_ms: float
+    total_ms: float
@@ -0,0 +1,22 @@
+from enum import Enum
+from pydantic import BaseModel
+from typing import Dict, Optional
+from model.source_content import SourceContentUpdate
+
+
+class SourceRefreshOutcome(str, Enum):
+    CHANGED = "changed"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+
+class SourceRefreshResult(BaseModel):
+    source_id: str
+    source_url: str
+    outcome: SourceRefreshOutcome
+    # True once the page was retrieved (including a 304), regardless of what happened after
+    fetched: bool = False
+    update: Optional[SourceContentUpdate] = None
+    error: Optional[str] = None
+    # Wall time spent in each pipeline stage: fetch, extract, diff, persist and tag
+    stage_ms: Dict[str, float] = {}
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class SourceSection(BaseModel):
+    id: Optional[str] = None
+    # Stable, citable id of the form "<source_content_id>-s<position>"
+    section_id: str
+    source_content_id: str
+    source_url: str
+    position: int
+    heading: Optional[str] = None
+    text: str
+    created_at: datetime
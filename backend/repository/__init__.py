@@ -1,9 +1,15 @@
 from .feature_repository import FeatureRepositoryAsync
 from .source_repository import SourceRepositoryAsync
 from .source_content_repository import SourceContentRepositoryAsync
+from .source_section_repository import SourceSectionRepositoryAsync
+from .compression_dictionary_repository import CompressionDictionaryRepositoryAsync
 from .audit_report_repository import AuditReportRepositoryAsync
+from .refresh_job_repository import RefreshJobRepositoryAsync
 
 __all__ = ["FeatureRepositoryAsync",
            "SourceRepositoryAsync",
            "SourceContentRepositoryAsync",
-           "AuditReportRepositoryAsync"]
+           "SourceSectionRepositoryAsync",
+           "CompressionDictionaryRepositoryAsync",
+           "AuditReportRepositoryAsync",
+           "RefreshJobRepositoryAsync"]
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+from typing import Dict, Optional
+import dotenv
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, AsyncMongoClient, ReturnDocument
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv("MONGO_URI")
+
+
+class AnalysisJobRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def ensure_indexes_async(self):
+        try:
+            await self.collection.create_index([("status", ASCENDING), ("available_at", ASCENDING)])
+            await self.collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        except Exception as e:
+            print(f"Error creating analysis job indexes: {e}")
+
+    async def create_analysis_job_async(self, analysis_job) -> str:
+        new_analysis_job = {**analysis_job}
+        if analysis_job.get("id"):
+            new_analysis_job["_id"] = ObjectId(analysis_job["id"])
+        new_analysis_job.pop("id", None)
+        result = await self.collection.insert_one(new_analysis_job)
+        return str(result.inserted_id)
+
+    async def get_analysis_job_async(self, analysis_job_id: str) -> Optional[dict]:
+        analysis_job = await self.collection.find_one({"_id": ObjectId(analysis_job_id)})
+        if analysis_job:
+            analysis_job["id"] = str(analysis_job.pop("_id"))
+        return analysis_job
+
+    async def claim_analysis_job_async(self, worker_id: str, now: datetime, lease_expires_at: datetime) -> Optional[dict]:
+        """Lease the oldest available job: a pending one that is due, or a running one whose lease expired.
+
+        A single atomic update, so one job is never claimed by two workers at once.
+        """
+        try:
+            analysis_job = await self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ]},
+                {
+                    "$set": {
+                        "status": "running",
+                        "lease_owner": worker_id,
+                        "lease_expires_at": lease_expires_at,
+                        "updated_at": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("available_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if analysis_job:
+                analysis_job["id"] = str(analysis_job.pop("_id"))
+            return analysis_job
+        except Exception as e:
+            print(f"Error claiming analysis job: {e}")
+            return None
+
+    async def update_leased_analysis_job_async(self, analysis_job_id: str, worker_id: str, attempts: int, update_data: dict) -> bool:
+        """Update a job only while the worker still holds the lease of this attempt. False once the lease was lost.
+
+        Fenced on attempts too, every claim bumps them, so a worker whose lease expired and whose job
+        was claimed again (even by itself) cannot touch the newer attempt. Mongo errors are raised,
+        they say nothing about the lease.
+        """
+        result = await self.collection.update_one(
+            {"_id": ObjectId(analysis_job_id), "status": "running",
+             "lease_owner": worker_id, "attempts": attempts},
+            {"$set": update_data},
+        )
+        return result.matched_count > 0
+
+    async def record_step_result_async(self, analysis_job_id: str, feature_id: str, step_data: dict, increments: Dict[str, int], update_data: dict) -> bool:
+        """Record the outcome of a step not completed yet and bump the job's counters in the same update.
+
+        A completed step is never recorded twice, so retried and concurrent workers cannot double count.
+        """
+        try:
+            result = await self.collection.update_one(
+                {"_id": ObjectId(analysis_job_id), "steps": {"$elemMatch": {
+                    "feature_id": feature_id, "status": {"$ne": "completed"}}}},
+                {
+                    "$set": {**{f"steps.$.{key}": value for key, value in step_data.items()}, **update_data},
+                    "$inc": {"steps.$.attempts": 1, **increments},
+                },
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error recording analysis job step: {e}")
+            return False
@@ -0,0 +1,49 @@
+import os
+from typing import List
+import dotenv
+from pymongo import ASCENDING, AsyncMongoClient, UpdateOne
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv("MONGO_URI")
+
+
+class AnalysisLedgerRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def ensure_indexes_async(self):
+        try:
+            await self.collection.create_index(
+                [("feature_id", ASCENDING), ("source_url", ASCENDING)], unique=True)
+        except Exception as e:
+            print(f"Error creating analysis ledger indexes: {e}")
+
+    async def get_entries_async(self, feature_ids: List[str], source_urls: List[str]) -> List[dict]:
+        entries = await self.collection.find(
+            {"feature_id": {"$in": feature_ids}, "source_url": {"$in": source_urls}}
+        ).to_list(length=None)
+        for entry in entries:
+            if "_id" in entry:
+                entry["id"] = str(entry.pop("_id"))
+        return entries
+
+    async def upsert_entries_async(self, entries: List[dict]) -> bool:
+        """One entry per (feature, source url), replacing the previous analysis' entry"""
+        try:
+            if not entries:
+                return True
+            await self.collection.bulk_write([
+                UpdateOne(
+                    {"feature_id": entry["feature_id"],
+                        "source_url": entry["source_url"]},
+                    {"$set": {key: value for key, value in entry.items() if key != "id"}},
+                    upsert=True,
+                )
+                for entry in entries
+            ], ordered=False)
+            return True
+        except Exception as e:
+            print(f"Error recording analysis ledger entries: {e}")
+            return False
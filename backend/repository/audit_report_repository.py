@@ -2,7 +2,7 @@ import os
 import dotenv
 from typing import Any, AsyncGenerator, Dict
 from bson.objectid import ObjectId
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, AsyncMongoClient
 
 from model.audit_report import AuditReportStatus
 
@@ -16,6 +16,12 @@ class AuditReportRepositoryAsync:
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    async def ensure_indexes_async(self):
+        try:
+            await self.collection.create_index([("analysis_job_id", ASCENDING), ("feature_id", ASCENDING)])
+        except Exception as e:
+            print(f"Error creating audit report indexes: {e}")
+
     async def get_audit_reports_async(self) -> list[dict]:
         try:
             audit_reports = (
@@ -91,6 +97,15 @@ class AuditReportRepositoryAsync:
             print(f"Error getting audit reports by source: {e}")
             return []
 
+    async def get_audit_reports_by_analysis_job_async(self, analysis_job_id: str) -> list[dict]:
+        # Errors propagate, an empty result would make a retried job analyze features twice
+        audit_reports = await self.collection.find(
+            {"analysis_job_id": analysis_job_id}).to_list(length=None)
+        for audit_report in audit_reports:
+            if "_id" in audit_report:
+                audit_report["id"] = str(audit_report.pop("_id"))
+        return audit_reports
+
     async def stream_audit_reports(self) -> AsyncGenerator[Dict[str, Any], None]:
         try:
             # Pipeline to match insert, update, replace, and delete operations
@@ -0,0 +1,34 @@
+import os
+from typing import List, Optional
+import dotenv
+from pymongo import DESCENDING, AsyncMongoClient
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv("MONGO_URI")
+
+
+class CompressionDictionaryRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def get_compression_dictionaries_async(self) -> List[dict]:
+        compression_dictionaries = await self.collection.find().sort("created_at", DESCENDING).to_list(length=None)
+        for compression_dictionary in compression_dictionaries:
+            compression_dictionary.pop("_id", None)
+        return compression_dictionaries
+
+    async def add_compression_dictionary_async(self, compression_dictionary: dict) -> Optional[int]:
+        try:
+            # The zstd dictionary id doubles as the document id, so a retrained
+            # dictionary with identical content is never stored twice
+            await self.collection.replace_one(
+                {"_id": compression_dictionary["dict_id"]},
+                {"_id": compression_dictionary["dict_id"], **compression_dictionary},
+                upsert=True,
+            )
+            return compression_dictionary["dict_id"]
+        except Exception as e:
+            print(f"Error adding compression dictionary: {e}")
+            return None
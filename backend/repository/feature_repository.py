@@ -2,7 +2,7 @@ import os
 from typing import Any, AsyncGenerator, Dict, List
 import dotenv
 from bson.objectid import ObjectId
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, AsyncMongoClient
 
 dotenv.load_dotenv()
 mongodb_uri = os.getenv('MONGO_URI')
@@ -14,6 +14,12 @@ class FeatureRepositoryAsync:
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    async def ensure_indexes_async(self):
+        try:
+            await self.collection.create_index([("tags", ASCENDING)])
+        except Exception as e:
+            print(f"Error creating feature indexes: {e}")
+
     async def get_features_async(self) -> list[dict]:
         features = await self.collection.find().to_list(length=None)
         for feature in features:
@@ -35,6 +41,24 @@ class FeatureRepositoryAsync:
                 feature["id"] = str(feature.pop("_id"))
         return features
 
+    async def get_features_by_tag_overlap_async(self, tags: List[str], limit: int) -> List[dict]:
+        """Up to limit features with ANY of the given tags, most tags matched first.
+
+        The number of tags each one matches is counted by Mongo, as matched_tag_count.
+        """
+        pipeline = [
+            {"$match": {"tags": {"$in": tags}}},
+            {"$addFields": {"matched_tag_count": {"$size": {"$filter": {
+                "input": "$tags", "as": "tag", "cond": {"$in": ["$$tag", tags]}}}}}},
+            {"$sort": {"matched_tag_count": -1, "_id": 1}},
+            {"$limit": limit},
+        ]
+        features = await (await self.collection.aggregate(pipeline)).to_list(length=None)
+        for feature in features:
+            if "_id" in feature:
+                feature["id"] = str(feature.pop("_id"))
+        return features
+
     async def add_feature_async(self, feature) -> str:
         new_feature = {**feature}
         if feature.get("id"):
@@ -43,6 +67,19 @@ class FeatureRepositoryAsync:
         result = await self.collection.insert_one(new_feature)
         return str(result.inserted_id)
 
+    async def add_features_async(self, features: List[dict]) -> List[str]:
+        if not features:
+            return []
+        new_features = []
+        for feature in features:
+            new_feature = {**feature}
+            if feature.get("id"):
+                new_feature["_id"] = ObjectId(feature["id"])
+            new_feature.pop("id", None)
+            new_features.append(new_feature)
+        result = await self.collection.insert_many(new_features)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
     async def stream_features(self) -> AsyncGenerator[Dict[str, Any], None]:
         try:
             pipeline = [
@@ -0,0 +1,36 @@
+import os
+from typing import Optional
+import dotenv
+from pymongo import ASCENDING, AsyncMongoClient
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv("MONGO_URI")
+
+
+class LlmCacheRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def ensure_indexes_async(self):
+        try:
+            # Mongo removes entries itself once expires_at has passed
+            await self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        except Exception as e:
+            print(f"Error creating llm cache indexes: {e}")
+
+    async def get_llm_cache_entry_async(self, key: str) -> Optional[dict]:
+        try:
+            return await self.collection.find_one({"_id": key})
+        except Exception as e:
+            print(f"Error getting llm cache entry: {e}")
+            return None
+
+    async def set_llm_cache_entry_async(self, key: str, entry: dict) -> bool:
+        try:
+            await self.collection.replace_one({"_id": key}, {"_id": key, **entry}, upsert=True)
+            return True
+        except Exception as e:
+            print(f"Error setting llm cache entry: {e}")
+            return False
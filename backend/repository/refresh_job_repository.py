@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+import dotenv
+from bson.objectid import ObjectId
+from pymongo import AsyncMongoClient
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv("MONGO_URI")
+
+
+class RefreshJobRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def create_refresh_job_async(self, refresh_job) -> str:
+        new_refresh_job = {**refresh_job}
+        if refresh_job.get("id"):
+            new_refresh_job["_id"] = ObjectId(refresh_job["id"])
+        new_refresh_job.pop("id", None)
+        result = await self.collection.insert_one(new_refresh_job)
+        return str(result.inserted_id)
+
+    async def get_refresh_job_async(self, refresh_job_id: str) -> Optional[dict]:
+        refresh_job = await self.collection.find_one({"_id": ObjectId(refresh_job_id)})
+        if refresh_job:
+            refresh_job["id"] = str(refresh_job.pop("_id"))
+        return refresh_job
+
+    async def update_refresh_job_async(self, refresh_job_id: str, update_data: dict) -> bool:
+        try:
+            result = await self.collection.update_one(
+                {"_id": ObjectId(refresh_job_id)}, {"$set": update_data}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error updating refresh job: {e}")
+            return False
+
+    async def record_refresh_result_async(self, refresh_job_id: str, increments: Dict[str, int], pushes: Dict[str, Any], update_data: dict) -> bool:
+        """Atomically bump counters and append to lists, so concurrent sources never lose updates"""
+        try:
+            update = {"$inc": increments, "$set": update_data}
+            if pushes:
+                update["$push"] = pushes
+            result = await self.collection.update_one({"_id": ObjectId(refresh_job_id)}, update)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error recording refresh result: {e}")
+            return False
+
+    async def fail_stale_refresh_jobs_async(self, stale_before: datetime, update_data: dict) -> int:
+        """Fail unfinished jobs whose heartbeat stopped before stale_before, whichever process ran them"""
+        try:
+            result = await self.collection.update_many(
+                {"status": {"$in": ["pending", "running"]}, "$or": [
+                    {"heartbeat_at": {"$lt": stale_before}},
+                    # Jobs created before heartbeats existed
+                    {"heartbeat_at": None, "created_at": {"$lt": stale_before}},
+                ]},
+                {"$set": update_data},
+            )
+            return result.modified_count
+        except Exception as e:
+            print(f"Error failing unfinished refresh jobs: {e}")
+            return 0
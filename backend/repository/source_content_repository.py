@@ -1,8 +1,8 @@
 import os
-from typing import List
+from typing import AsyncGenerator, List, Optional
 import dotenv
 from bson.objectid import ObjectId
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient
 
 dotenv.load_dotenv()
 mongodb_uri = os.getenv('MONGO_URI')
@@ -14,27 +14,102 @@ class SourceContentRepositoryAsync:
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
-    async def get_source_contents_async(self) -> list[dict]:
-        source_contents = await self.collection.find().to_list(length=None)
+    async def ensure_indexes_async(self):
+        try:
+            # Serves the "latest version of a url" lookup used by change detection
+            await self.collection.create_index([("source_url", ASCENDING), ("created_at", DESCENDING)])
+        except Exception as e:
+            print(f"Error creating source content indexes: {e}")
+
+    async def get_source_contents_async(self, projection: Optional[dict] = None) -> list[dict]:
+        source_contents = await self.collection.find(None, projection).to_list(length=None)
         for source_content in source_contents:
             if "_id" in source_content:
                 source_content["id"] = str(source_content.pop("_id"))
         return source_contents
 
-    async def get_source_content_by_source_url_async(self, source_url: str) -> List[dict]:
-        source_contents = await self.collection.find({"source_url": source_url}).to_list(length=None)
+    async def get_source_content_by_source_url_async(self, source_url: str, projection: Optional[dict] = None) -> List[dict]:
+        source_contents = await self.collection.find({"source_url": source_url}, projection).to_list(length=None)
         for source_content in source_contents:
             if "_id" in source_content:
                 source_content["id"] = str(source_content.pop("_id"))
         return source_contents
 
-    async def get_source_content_by_source_urls_async(self, source_urls: List[str]) -> List[dict]:
-        source_contents = await self.collection.find({"source_url": {"$in": source_urls}}).to_list(length=None)
+    async def get_source_content_by_source_urls_async(self, source_urls: List[str], projection: Optional[dict] = None) -> List[dict]:
+        source_contents = await self.collection.find({"source_url": {"$in": source_urls}}, projection).to_list(length=None)
         for source_content in source_contents:
             if "_id" in source_content:
                 source_content["id"] = str(source_content.pop("_id"))
         return source_contents
 
+    async def get_latest_source_content_by_source_url_async(self, source_url: str, projection: Optional[dict] = None) -> Optional[dict]:
+        source_content = await self.collection.find_one(
+            {"source_url": source_url}, projection, sort=[("created_at", DESCENDING)])
+        if source_content and "_id" in source_content:
+            source_content["id"] = str(source_content.pop("_id"))
+        return source_content
+
+    async def get_latest_source_contents_by_source_urls_async(self, source_urls: List[str], projection: Optional[dict] = None) -> List[dict]:
+        """The latest version of each url.
+
+        Only the ids are grouped, from the (source_url, created_at) index, then the winners are
+        fetched. Long histories add index keys to walk, never full documents.
+        """
+        pipeline = [
+            {"$match": {"source_url": {"$in": source_urls}}},
+            {"$sort": {"source_url": ASCENDING, "created_at": DESCENDING}},
+            {"$group": {"_id": "$source_url", "latest_id": {"$first": "$_id"}}},
+        ]
+        latest = await (await self.collection.aggregate(pipeline)).to_list(length=None)
+        if not latest:
+            return []
+        source_contents = await self.collection.find(
+            {"_id": {"$in": [group["latest_id"] for group in latest]}}, projection
+        ).to_list(length=None)
+        for source_content in source_contents:
+            if "_id" in source_content:
+                source_content["id"] = str(source_content.pop("_id"))
+        return source_contents
+
+    async def iterate_source_contents_async(self, projection: Optional[dict] = None, limit: int = 0) -> AsyncGenerator[dict, None]:
+        """Newest first, one document at a time so the whole history is never held in memory"""
+        async for source_content in self.collection.find(None, projection).sort("created_at", DESCENDING).limit(limit):
+            source_content["id"] = str(source_content.pop("_id"))
+            yield source_content
+
+    async def update_source_content_async(self, source_content_id: str, update_data: dict, unset_fields: Optional[List[str]] = None) -> bool:
+        try:
+            update = {"$set": update_data}
+            if unset_fields:
+                update["$unset"] = {field: "" for field in unset_fields}
+            result = await self.collection.update_one({"_id": ObjectId(source_content_id)}, update)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error updating source content: {e}")
+            return False
+
+    async def get_storage_stats_async(self) -> dict:
+        """Raw vs stored content bytes, computed server side so no content is transferred"""
+        try:
+            is_compressed = {"$eq": [{"$type": "$content_zstd"}, "binData"]}
+            plain_bytes = {"$strLenBytes": {"$ifNull": ["$content", ""]}}
+            stats = await (await self.collection.aggregate([
+                {"$group": {
+                    "_id": None,
+                    "documents": {"$sum": 1},
+                    "compressed_documents": {"$sum": {"$cond": [is_compressed, 1, 0]}},
+                    "raw_bytes": {"$sum": {"$cond": [is_compressed, "$content_size", plain_bytes]}},
+                    "stored_bytes": {"$sum": {"$cond": [is_compressed, {"$binarySize": "$content_zstd"}, plain_bytes]}},
+                }},
+            ])).to_list(length=None)
+            if not stats:
+                return {"documents": 0, "compressed_documents": 0, "raw_bytes": 0, "stored_bytes": 0}
+            stats[0].pop("_id", None)
+            return stats[0]
+        except Exception as e:
+            print(f"Error getting source content storage stats: {e}")
+            return {"documents": 0, "compressed_documents": 0, "raw_bytes": 0, "stored_bytes": 0}
+
     async def add_source_content_async(self, source_content) -> str:
         new_source_content = {**source_content}
         if source_content.get("id"):
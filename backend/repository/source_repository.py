@@ -1,8 +1,9 @@
 import os
-from typing import Any, AsyncGenerator, Dict, List
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List, Optional
 import dotenv
 from bson.objectid import ObjectId
-from pymongo import AsyncMongoClient
+from pymongo import ASCENDING, AsyncMongoClient
 
 dotenv.load_dotenv()
 mongodb_uri = os.getenv("MONGO_URI")
@@ -14,6 +15,15 @@ class SourceRepositoryAsync:
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
 
+    async def ensure_indexes_async(self):
+        try:
+            # Multikey index behind the tag to source lookup of feature-centric analysis
+            await self.collection.create_index([("tags", ASCENDING)])
+            # Due sources for the refresh scheduler, in the order they fall due
+            await self.collection.create_index([("next_refresh_at", ASCENDING)])
+        except Exception as e:
+            print(f"Error creating source indexes: {e}")
+
     async def get_sources(self) -> list[dict]:
         sources = await self.collection.find().to_list(length=None)
         for source in sources:
@@ -30,6 +40,31 @@ class SourceRepositoryAsync:
                 source["id"] = str(source.pop("_id"))
         return sources
 
+    async def get_sources_by_tags(self, tags: List[str]) -> list[dict]:
+        # Sources that have ANY of the given tags
+        sources = await self.collection.find({"tags": {"$in": tags}}).to_list(length=None)
+        for source in sources:
+            if "_id" in source:
+                source["id"] = str(source.pop("_id"))
+        return sources
+
+    async def get_due_sources(self, now: datetime, limit: int) -> list[dict]:
+        """Up to limit sources due for a refresh, never refreshed ones first, then the most overdue"""
+        sources = await self.collection.find(
+            {"$or": [{"next_refresh_at": {"$lte": now}}, {"next_refresh_at": None}]}
+        ).sort("next_refresh_at", ASCENDING).limit(limit).to_list(length=None)
+        for source in sources:
+            if "_id" in source:
+                source["id"] = str(source.pop("_id"))
+        return sources
+
+    async def get_next_due_source(self) -> Optional[dict]:
+        """The source that falls due first, a never refreshed one if any"""
+        source = await self.collection.find_one({}, sort=[("next_refresh_at", ASCENDING)])
+        if source and "_id" in source:
+            source["id"] = str(source.pop("_id"))
+        return source
+
     async def add_source(self, source) -> str:
         new_source = {**source}
         if source.get("id"):
@@ -0,0 +1,44 @@
+import os
+from typing import List
+import dotenv
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, AsyncMongoClient
+
+dotenv.load_dotenv()
+mongodb_uri = os.getenv('MONGO_URI')
+
+
+class SourceSectionRepositoryAsync:
+    def __init__(self, db_name: str, collection_name: str):
+        self.client = AsyncMongoClient(mongodb_uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+
+    async def ensure_indexes_async(self):
+        try:
+            await self.collection.create_index([("source_content_id", ASCENDING), ("position", ASCENDING)])
+            await self.collection.create_index("section_id", unique=True)
+        except Exception as e:
+            print(f"Error creating source section indexes: {e}")
+
+    async def get_source_sections_by_source_content_ids_async(self, source_content_ids: List[str]) -> List[dict]:
+        source_sections = await self.collection.find(
+            {"source_content_id": {"$in": source_content_ids}}
+        ).sort([("source_content_id", ASCENDING), ("position", ASCENDING)]).to_list(length=None)
+        for source_section in source_sections:
+            if "_id" in source_section:
+                source_section["id"] = str(source_section.pop("_id"))
+        return source_sections
+
+    async def add_source_sections_async(self, source_sections: List[dict]) -> List[str]:
+        new_source_sections = []
+        for source_section in source_sections:
+            new_source_section = {**source_section}
+            if source_section.get("id"):
+                new_source_section["_id"] = ObjectId(source_section["id"])
+            new_source_section.pop("id", None)
+            new_source_sections.append(new_source_section)
+        if not new_source_sections:
+            return []
+        result = await self.collection.insert_many(new_source_sections, ordered=False)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
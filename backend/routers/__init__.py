@@ -13,6 +13,9 @@ from .chat import chat_router
 from .compliance import compliance_router
 from .audit_report import audit_report_router
 from .scripts import scripts_router
+from .llm_cache import llm_cache_router
+from .tag_classifier import tag_classifier_router
+from .llm_telemetry import llm_telemetry_router
 
 
 def register_routers(app: FastAPI, **services):
@@ -34,12 +37,14 @@ def register_routers(app: FastAPI, **services):
     source_router.source_service = services["source_service"]
     source_router.source_content_service = services["source_content_service"]
     source_router.knowledge_base_service = services["knowledge_base_service"]
+    source_router.refresh_job_service = services["refresh_job_service"]
     app.include_router(source_router)
 
     # Register compliance routes
     compliance_router.compliance_analysis_service = services[
         "compliance_analysis_service"
     ]
+    compliance_router.analysis_job_service = services["analysis_job_service"]
     app.include_router(compliance_router)
 
     # Register audit report routes
@@ -49,6 +54,18 @@ def register_routers(app: FastAPI, **services):
     ]
     app.include_router(audit_report_router)
 
+    # Register llm cache routes
+    llm_cache_router.llm_cache_service = services["llm_cache_service"]
+    app.include_router(llm_cache_router)
+
+    # Register tag pre-classifier routes
+    tag_classifier_router.tag_pre_classifier = services["tag_pre_classifier"]
+    app.include_router(tag_classifier_router)
+
+    # Register llm telemetry routes
+    llm_telemetry_router.llm_telemetry = services["llm_telemetry"]
+    app.include_router(llm_telemetry_router)
+
     # Register chat routes with dependencies
     app.include_router(chat_router)
 
@@ -5,6 +5,7 @@ This module contains routes for compliance analysis.
 """
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from model.analysis_requests import AnalyzeSourcesRequest, AnalyzeFeatureRequest
 
 # Create router for health-related routes
@@ -19,21 +20,151 @@ async def analyze_sources(request: AnalyzeSourcesRequest):
     try:
         compliance_analysis_service = compliance_router.compliance_analysis_service
         audit_report_ids = await compliance_analysis_service.analyze_sources_impact_async(
-            request.source_ids)
+            request.source_ids, bypass_cache=request.bypass_cache, force=request.force, max_features=request.max_features)
         return {"success": True, "audit_report_ids": audit_report_ids}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@compliance_router.post("/analyze-sources/stream")
+async def analyze_sources_stream(request: AnalyzeSourcesRequest):
+    """
+    Compliance analysis streamed with Server-Sent Events (SSE).
+
+    Each feature's audit report is created, actioned and sent as soon as its own analysis
+    completes, so the first result arrives after one LLM call rather than after all of them.
+
+    Events:
+    - analysis_started: source ids, the number of related features to analyze and the ids of
+      those already analyzed against the same source versions (skipped unless force is set)
+    - audit_report_created: feature id, audit report id and the audit report
+    - feature_failed: feature id and the error, the other features carry on
+    - feature_skipped: feature id, no source section to analyze it against
+    - analysis_completed: all audit report ids, failed, skipped, up to date and over budget feature ids
+
+    Related features share a tag with any of the sources. The most relevant ones, by tags shared
+    and wording, are analyzed up to max_features (COMPLIANCE_FEATURE_BUDGET by default), the ids
+    of the others are in over_budget_feature_ids. Only the FEATURE_RANK_CANDIDATE_LIMIT features
+    sharing the most tags are ranked, those beyond it are dropped and not listed.
+    """
+    try:
+        compliance_analysis_service = compliance_router.compliance_analysis_service
+
+        async def generate_sse_stream():
+            async for sse_message in compliance_analysis_service.stream_sources_impact_async(
+                    request.source_ids, bypass_cache=request.bypass_cache, force=request.force, max_features=request.max_features):
+                yield sse_message
+
+        return StreamingResponse(
+            generate_sse_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS, HEAD",
+                "Access-Control-Allow-Headers": "*",
+                "Access-Control-Max-Age": "3600",
+            },
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to stream compliance analysis: {str(e)}")
+
+
 @compliance_router.post("/analyze-feature")
 async def analyze_feature(request: AnalyzeFeatureRequest):
     """
-    Basic compliance analysis endpoint.
+    Analyze one feature, e.g. after it was created or edited, against the latest content of every
+    source sharing one of its tags. Returns the ids of the audit reports created.
     """
     try:
         compliance_analysis_service = compliance_router.compliance_analysis_service
-        await compliance_analysis_service.analyze_feature_impact_async(
-            request.feature_id)
-        return {"success": True}
+        audit_report_ids = await compliance_analysis_service.analyze_feature_impact_async(
+            request.feature_id, bypass_cache=request.bypass_cache, force=request.force)
+        return {"success": True, "audit_report_ids": audit_report_ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@compliance_router.post("/jobs/analyze-sources")
+async def enqueue_sources_analysis(request: AnalyzeSourcesRequest):
+    """
+    Queue the analysis of the given sources as a background job and return at once.
+
+    The job survives client disconnects and server restarts, see /compliance/jobs/{job_id} for progress.
+    """
+    try:
+        analysis_job_service = compliance_router.analysis_job_service
+        analysis_job_id = await analysis_job_service.enqueue_sources_analysis_async(
+            request.source_ids, bypass_cache=request.bypass_cache, force=request.force, max_features=request.max_features)
+        return {"success": True, "job_id": analysis_job_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@compliance_router.post("/jobs/analyze-feature")
+async def enqueue_feature_analysis(request: AnalyzeFeatureRequest):
+    """
+    Queue the analysis of one feature against the sources sharing its tags as a background job.
+    """
+    try:
+        analysis_job_service = compliance_router.analysis_job_service
+        analysis_job_id = await analysis_job_service.enqueue_feature_analysis_async(
+            request.feature_id, bypass_cache=request.bypass_cache, force=request.force)
+        return {"success": True, "job_id": analysis_job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@compliance_router.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """
+    Retrieve the state of an analysis job.
+
+    Lists each feature's step with its audit report id once recorded, plus the completed and
+    failed counts, the attempts so far and the analysis run id of each attempt.
+    """
+    try:
+        analysis_job_service = compliance_router.analysis_job_service
+        analysis_job = await analysis_job_service.get_analysis_job_async(job_id)
+        if analysis_job is None:
+            raise HTTPException(
+                status_code=404, detail=f"Analysis job {job_id} not found")
+        return {"success": True, "analysis_job": analysis_job}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@compliance_router.get("/jobs/{job_id}/stream")
+async def stream_analysis_job(job_id: str):
+    """
+    Stream analysis job progress using Server-Sent Events (SSE).
+
+    Sends the current job state followed by an update whenever a step is recorded or the job
+    changes status, and closes once the job has completed or failed.
+    """
+    try:
+        analysis_job_service = compliance_router.analysis_job_service
+
+        async def generate_sse_stream():
+            async for sse_message in analysis_job_service.stream_analysis_job_async(job_id):
+                yield sse_message
+
+        return StreamingResponse(
+            generate_sse_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS, HEAD",
+                "Access-Control-Allow-Headers": "*",
+                "Access-Control-Max-Age": "3600",
+            },
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to stream analysis job: {str(e)}")
@@ -0,0 +1,22 @@
+"""
+LLM result cache routes.
+
+This module contains routes for inspecting the agent result cache.
+"""
+
+from fastapi import APIRouter, HTTPException
+
+# Create router for llm cache routes
+llm_cache_router = APIRouter(prefix="/llm-cache", tags=["llm-cache"])
+
+
+@llm_cache_router.get("/stats")
+async def get_llm_cache_stats():
+    """
+    Hit and miss counters of the agent result cache, per agent, since startup.
+    """
+    try:
+        llm_cache_service = llm_cache_router.llm_cache_service
+        return {"success": True, "stats": llm_cache_service.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,87 @@
+"""
+LLM telemetry routes.
+
+This module contains routes for inspecting LLM call telemetry: tokens, latency, retries and
+cost per agent, per endpoint and per analysis run.
+"""
+
+from fastapi import APIRouter, HTTPException
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from agents.llm_telemetry import current_endpoint
+
+# Create router for llm telemetry routes
+llm_telemetry_router = APIRouter(prefix="/llm-telemetry", tags=["llm-telemetry"])
+
+
+class EndpointContextMiddleware:
+    """Tags the LLM calls made while serving a request with its route, like "POST /features/"
+
+    Plain ASGI, so streamed responses and the tasks they start keep the route too.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = f"{scope['method']} {scope['path']}"
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                # The route template, so paths with ids are counted together
+                endpoint = f"{scope['method']} {route.path}"
+                break
+        token = current_endpoint.set(endpoint)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_endpoint.reset(token)
+
+
+@llm_telemetry_router.get("/stats")
+async def get_llm_telemetry_stats():
+    """
+    LLM call totals since startup per agent, per endpoint and per recent analysis run: calls,
+    failures, retries, input, cached and output tokens, cost, and latency percentiles. Also the
+    shared scheduler's state and the provider's counters.
+    """
+    try:
+        llm_telemetry = llm_telemetry_router.llm_telemetry
+        return {"success": True, "stats": llm_telemetry.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@llm_telemetry_router.get("/runs/{run_id}")
+async def get_llm_telemetry_run(run_id: str):
+    """
+    LLM call totals of one analysis run, overall and per agent. Audit reports carry their run id.
+    """
+    try:
+        llm_telemetry = llm_telemetry_router.llm_telemetry
+        run_stats = llm_telemetry.get_run_stats(run_id)
+        if run_stats is None:
+            raise HTTPException(
+                status_code=404, detail=f"Analysis run {run_id} not found")
+        return {"success": True, "run": run_stats}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@llm_telemetry_router.get("/calls")
+async def get_llm_telemetry_calls(limit: int = 50):
+    """
+    The most recent LLM calls, one record each, most recent last.
+    """
+    try:
+        llm_telemetry = llm_telemetry_router.llm_telemetry
+        return {"success": True, "calls": llm_telemetry.get_recent_calls(limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
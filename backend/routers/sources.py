@@ -145,27 +145,55 @@ async def get_source_count():
 
 
 @source_router.get("/contents")
-async def get_source_contents():
+async def get_source_contents(include_content: bool = True):
     """
-    Retrieve all source contents.
+    Retrieve all source contents. Pass include_content=false to list versions without
+    reading and decompressing their content.
     """
     try:
         source_content_service = source_router.source_content_service
-        source_contents = await source_content_service.get_source_contents_async()
+        source_contents = await source_content_service.get_source_contents_async(include_content)
         return {"success": True, "source_contents": source_contents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@source_router.get("/contents/storage")
+async def get_source_contents_storage():
+    """
+    Report how much space stored source content takes compared to uncompressed.
+    """
+    try:
+        source_content_service = source_router.source_content_service
+        storage_report = await source_content_service.get_storage_report_async()
+        return {"success": True, "storage": storage_report}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@source_router.post("/contents/compact")
+async def compact_source_contents(train_dictionary: bool = True):
+    """
+    Recompress all stored source content, by default with a dictionary freshly trained
+    on the newest versions. Returns storage ratios and compression overhead.
+    """
+    try:
+        source_content_service = source_router.source_content_service
+        compaction_report = await source_content_service.compact_source_contents_async(train_dictionary)
+        return {"success": True, "compaction": compaction_report}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @source_router.get("/content")
-async def get_source_content(url: str):
+async def get_source_content(url: str, include_content: bool = True):
     """
     Retrieve source content by source URL.
     """
     try:
         source_content_service = source_router.source_content_service
         source_contents = (
-            await source_content_service.get_source_content_by_source_url_async(url)
+            await source_content_service.get_source_content_by_source_url_async(url, include_content)
         )
         return {"success": True, "url": url, "source_contents": source_contents}
     except Exception as e:
@@ -190,14 +218,14 @@ async def create_source_content(source_content_request: SourceContentCreateReque
 @source_router.post("/refresh-all")
 async def refresh_all_sources():
     """
-    Refresh all sources.
+    Start a background job refreshing all sources.
+
+    Returns immediately with a job id, see /sources/refresh-jobs/{job_id} for progress.
     """
     try:
-        knowledge_base_service = source_router.knowledge_base_service
-        source_contents_updates = (
-            await knowledge_base_service.refresh_all_sources_content_async()
-        )
-        return {"success": True, "source_contents_updates": source_contents_updates}
+        refresh_job_service = source_router.refresh_job_service
+        refresh_job_id = await refresh_job_service.start_refresh_job_async()
+        return {"success": True, "job_id": refresh_job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -205,18 +233,70 @@ async def refresh_all_sources():
 @source_router.post("/refresh")
 async def refresh_given_sources(sources: List[Source]):
     """
-    Refresh given sources.
+    Start a background job refreshing the given sources.
     """
     try:
-        knowledge_base_service = source_router.knowledge_base_service
-        source_contents_updates = (
-            await knowledge_base_service.refresh_given_sources_content_async(sources)
-        )
-        return {"success": True, "source_contents_updates": source_contents_updates}
+        refresh_job_service = source_router.refresh_job_service
+        refresh_job_id = await refresh_job_service.start_refresh_job_async(sources)
+        return {"success": True, "job_id": refresh_job_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@source_router.get("/refresh-jobs/{job_id}")
+async def get_refresh_job(job_id: str):
+    """
+    Retrieve the state of a refresh job.
+
+    Counts sources fetched, unchanged, changed and failed so far, plus the ids of
+    changed sources once they are known.
+    """
+    try:
+        refresh_job_service = source_router.refresh_job_service
+        refresh_job = await refresh_job_service.get_refresh_job_async(job_id)
+        if refresh_job is None:
+            raise HTTPException(
+                status_code=404, detail=f"Refresh job {job_id} not found")
+        return {"success": True, "refresh_job": refresh_job}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@source_router.get("/refresh-jobs/{job_id}/stream")
+async def stream_refresh_job(job_id: str):
+    """
+    Stream refresh job progress using Server-Sent Events (SSE).
+
+    Sends the current job state followed by an update whenever its counters change,
+    and closes once the job has completed or failed.
+    """
+    try:
+        refresh_job_service = source_router.refresh_job_service
+
+        async def generate_sse_stream():
+            async for sse_message in refresh_job_service.stream_refresh_job_async(job_id):
+                yield sse_message
+
+        return StreamingResponse(
+            generate_sse_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS, HEAD",
+                "Access-Control-Allow-Headers": "*",
+                "Access-Control-Max-Age": "3600",
+            },
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to stream refresh job: {str(e)}"
+        )
+
+
 @source_router.get("/stream")
 async def stream_sources():
     """
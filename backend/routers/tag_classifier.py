@@ -0,0 +1,27 @@
+"""
+Tag pre-classifier routes.
+
+This module contains routes for inspecting the local regulation tag pre-classifier.
+"""
+
+from fastapi import APIRouter, HTTPException
+
+# Create router for tag classifier routes
+tag_classifier_router = APIRouter(prefix="/tag-classifier", tags=["tag-classifier"])
+
+
+@tag_classifier_router.get("/stats")
+async def get_tag_classifier_stats():
+    """
+    How tagging calls were routed since startup, per agent: decided locally, shortlisted or
+    sent with the whole catalog, the LLM calls avoided, and agreement with the LLM.
+
+    Local agreement is measured on the sampled confident decisions that are also sent to the
+    LLM (TAG_CLASSIFIER_SHADOW_RATE).
+    """
+    try:
+        tag_pre_classifier = tag_classifier_router.tag_pre_classifier
+        return {"success": True, "stats": tag_pre_classifier.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
@@ -0,0 +1,184 @@
+import asyncio
+import random
+import re
+import socket
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import uvicorn
+import xxhash
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+from starlette.routing import Route
+
+SYNTHETIC_TERMS = [
+    "personal data", "minors", "parental consent", "age verification", "recommender system",
+    "targeted advertising", "transparency report", "risk assessment", "notice and action",
+    "data retention", "cross-border transfer", "supervisory authority", "penalty", "geolocation",
+    "content moderation", "algorithmic feed", "profiling", "data protection officer",
+]
+
+
+def slugify_url(url: str) -> str:
+    """File name a saved copy of a url is expected under in the corpus directory"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", url).strip("_")[:150] + ".html"
+
+
+def synthetic_page(url: str, paragraphs: int = 40) -> str:
+    """Deterministic regulation-like page for urls without a saved copy"""
+    rng = random.Random(url)
+    body = []
+    for article in range(1, paragraphs + 1):
+        if article % 8 == 1:
+            body.append(f"<h2>Chapter {article // 8 + 1}</h2>")
+        sentence = " ".join(
+            f"The provider shall ensure {rng.choice(SYNTHETIC_TERMS)} obligations regarding {rng.choice(SYNTHETIC_TERMS)}."
+            for _ in range(rng.randint(3, 8)))
+        body.append(f"<p>Article {article}. {sentence}</p>")
+    return (
+        "<html><head><title>Regulation fixture for " + url + "</title></head><body>"
+        "<nav><a href='/'>Home</a> | <a href='/legislation'>Legislation</a> | <a href='/contact'>Contact</a></nav>"
+        "<main><article><h1>Regulation fixture</h1>" + "".join(body) + "</article></main>"
+        "<footer>Cookie settings | Accessibility | Privacy notice</footer></body></html>"
+    )
+
+
+class FixturePage:
+    def __init__(self, url: str, html: str):
+        self.url = url
+        self.base_html = html
+        self.revision = 0
+        self.html = html
+        self.etag = self._compute_etag()
+
+    def _compute_etag(self) -> str:
+        return f'"{xxhash.xxh3_64_hexdigest(self.html)}"'
+
+    def change(self, amended_fraction: float = 0.1):
+        """Publish a new revision with an amendments block, like a regulator editing a page.
+
+        The block is sized relative to the page so the change is material, a one line edit
+        would rightly be discarded as a near-duplicate by the pipeline.
+        """
+        self.revision += 1
+        rng = random.Random(f"{self.url}#{self.revision}")
+        sentences = max(int(len(self.base_html) * amended_fraction / 120), 3)
+        amendment = "".join(
+            f"<p>Amendment {self.revision}.{i}. From {2025 + self.revision}-01-01 the provider shall also "
+            f"address {rng.choice(SYNTHETIC_TERMS)} for {rng.choice(SYNTHETIC_TERMS)}.</p>"
+            for i in range(1, sentences + 1))
+        for closing_tag in ("</article>", "</main>", "</body>"):
+            if closing_tag in self.base_html:
+                self.html = self.base_html.replace(
+                    closing_tag, amendment + closing_tag, 1)
+                break
+        else:
+            self.html = self.base_html + amendment
+        self.etag = self._compute_etag()
+
+
+class FixtureServer:
+    """Serves a corpus of regulatory pages over local HTTP with injected latency, errors and changes.
+
+    Pages are spread over several loopback addresses (127.0.0.1, 127.0.0.2, ...) so per-host
+    politeness in the fetch service behaves as it would against several real domains.
+    """
+
+    def __init__(self, source_urls: List[str], corpus_dir: Optional[Path] = None, hosts: int = 4, latency_ms: float = 50.0, latency_jitter_ms: float = 25.0, error_rate: float = 0.0, seed: int = 0):
+        self.hosts = max(hosts, 1)
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.port: Optional[int] = None
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+
+        self.pages: List[FixturePage] = []
+        self.saved_pages = 0
+        for source_url in source_urls:
+            saved_path = corpus_dir / \
+                slugify_url(source_url) if corpus_dir else None
+            if saved_path is not None and saved_path.exists():
+                html = saved_path.read_text(encoding="utf-8", errors="replace")
+                self.saved_pages += 1
+            else:
+                html = synthetic_page(source_url)
+            self.pages.append(FixturePage(source_url, html))
+
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def fixture_url(self, index: int) -> str:
+        return f"http://127.0.0.{index % self.hosts + 1}:{self.port}/pages/{index}"
+
+    def change_pages(self, change_rate: float) -> int:
+        """Change each page with the given probability. Returns how many changed"""
+        changed = 0
+        for page in self.pages:
+            if self.random.random() < change_rate:
+                page.change()
+                changed += 1
+        return changed
+
+    async def _serve_page(self, request: Request) -> Response:
+        self.requests += 1
+        delay_ms = max(self.random.gauss(
+            self.latency_ms, self.latency_jitter_ms), 0)
+        await asyncio.sleep(delay_ms / 1000)
+
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return Response("Service Unavailable", status_code=503)
+
+        index = int(request.path_params["index"])
+        if index >= len(self.pages):
+            return Response("Not Found", status_code=404)
+        page = self.pages[index]
+
+        if request.headers.get("if-none-match") == page.etag:
+            self.not_modified += 1
+            return Response(status_code=304, headers={"ETag": page.etag})
+        return HTMLResponse(page.html, headers={"ETag": page.etag})
+
+    async def start_async(self):
+        # One socket per loopback address, all sharing the first free port
+        sockets = []
+        for host in range(1, self.hosts + 1):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((f"127.0.0.{host}", self.port or 0))
+            except OSError:
+                # Only 127.0.0.1 is routable on some platforms (macOS without aliases)
+                sock.close()
+                print(
+                    f"Could not bind 127.0.0.{host}, serving from {len(sockets)} host(s)")
+                break
+            self.port = sock.getsockname()[1]
+            sockets.append(sock)
+        self.hosts = len(sockets)
+
+        app = Starlette(
+            routes=[Route("/pages/{index:int}", self._serve_page)])
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, log_level="warning", access_log=False, lifespan="off"))
+        self._task = asyncio.create_task(self._server.serve(sockets=sockets))
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+
+    async def stop_async(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "not_modified": self.not_modified,
+            "saved_pages": self.saved_pages,
+            "synthetic_pages": len(self.pages) - self.saved_pages,
+        }
@@ -0,0 +1,130 @@
+"""Speed, cost and agreement report of the screening cascade against the main model alone.
+
+The related features of each source (or the given ones) are analyzed twice against the same
+retrieved sections: by the main model alone, then screened by the cheaper model with escalation
+to the main model. The report shows how many verdicts the screening model decided, how often
+those agree with the main model's, and the wall time and cost of both runs. Both runs call the
+LLM, no cache is used and nothing is written.
+
+Run from the backend directory:
+
+    python -m scripts.compliance_cascade_report --screening-model claude-3-5-haiku-latest --escalation-confidences 0.7 0.8 0.9
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import List
+
+import dotenv
+
+dotenv.load_dotenv()
+
+from agents.compliance_analyzer_agent import ComplianceAnalyzerAgent  # noqa: E402
+from agents.llm_telemetry import llm_telemetry  # noqa: E402
+from scripts.compliance_group_report import load_runs  # noqa: E402
+
+
+async def analyze_runs(agent: ComplianceAnalyzerAgent, runs: List[dict]) -> dict:
+    """Verdicts per run, with the wall time and LLM cost of analyzing all of them"""
+    run_id = uuid.uuid4().hex
+    started_at = time.perf_counter()
+    with llm_telemetry.track_run(run_id):
+        results = await asyncio.gather(*[
+            agent.analyze_compliance(run["source_contents"], run["features"],
+                                     run["feature_sections"], bypass_cache=True)
+            for run in runs])
+    totals = llm_telemetry.get_run_stats(run_id)["totals"]
+    return {
+        "results": results,
+        "seconds": time.perf_counter() - started_at,
+        "cost_usd": totals["cost_usd"],
+        "calls": totals["calls"],
+    }
+
+
+async def evaluate(runs: List[dict], baseline: dict, screening_model: str, escalation_confidence: float) -> dict:
+    cascade_agent = ComplianceAnalyzerAgent(
+        screening_model=screening_model, escalation_confidence=escalation_confidence)
+    cascade = await analyze_runs(cascade_agent, runs)
+
+    features = 0
+    screening_decided = 0
+    screening_agreements = 0
+    for baseline_results, cascade_results in zip(baseline["results"], cascade["results"]):
+        for baseline_result, cascade_result in zip(baseline_results, cascade_results):
+            features += 1
+            if cascade_result.tier == "screening":
+                screening_decided += 1
+                # Screening verdicts are all "no change", the main model should agree
+                screening_agreements += int(
+                    not baseline_result.needs_action and baseline_result.status_change_to == cascade_result.status_change_to)
+
+    return {
+        "escalation_confidence": escalation_confidence,
+        "features": features,
+        "screening_decided_rate": screening_decided / features if features else None,
+        "screening_agreement_rate": screening_agreements / screening_decided if screening_decided else None,
+        "baseline": {"calls": baseline["calls"], "seconds": round(baseline["seconds"], 2), "cost_usd": baseline["cost_usd"]},
+        "cascade": {"calls": cascade["calls"], "seconds": round(cascade["seconds"], 2), "cost_usd": cascade["cost_usd"]},
+        "speedup": baseline["seconds"] / cascade["seconds"] if cascade["seconds"] else None,
+        "cost_ratio": baseline["cost_usd"] / cascade["cost_usd"] if cascade["cost_usd"] else None,
+    }
+
+
+def format_rate(value) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+
+def format_ratio(value) -> str:
+    return "-" if value is None else f"{value:.2f}x"
+
+
+def print_report(rows: List[dict]):
+    print(f"{'conf':>5} {'feats':>6} {'screened':>9} {'agree':>7} {'calls':>11} {'seconds':>15} {'cost usd':>19} {'faster':>7} {'cheaper':>8}")
+    for row in rows:
+        print(f"{row['escalation_confidence']:>5.2f} {row['features']:>6} {format_rate(row['screening_decided_rate']):>9} "
+              f"{format_rate(row['screening_agreement_rate']):>7} "
+              f"{row['baseline']['calls']:>5}/{row['cascade']['calls']:<5} "
+              f"{row['baseline']['seconds']:>7}/{row['cascade']['seconds']:<7} "
+              f"{row['baseline']['cost_usd']:>9.4f}/{row['cascade']['cost_usd']:<9.4f} "
+              f"{format_ratio(row['speedup']):>7} {format_ratio(row['cost_ratio']):>8}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-name", default="hacktok")
+    parser.add_argument("--source-ids", nargs="+", default=None,
+                        help="Sources to analyze, every tagged source by default")
+    parser.add_argument("--screening-model", default=os.getenv("COMPLIANCE_SCREENING_MODEL"),
+                        required=not os.getenv("COMPLIANCE_SCREENING_MODEL"))
+    parser.add_argument("--escalation-confidences", type=float, nargs="+",
+                        default=[float(os.getenv("COMPLIANCE_ESCALATION_CONFIDENCE", "0.8"))])
+    parser.add_argument("--json-out", default=None,
+                        help="Write the report as JSON, for comparing runs")
+    return parser.parse_args()
+
+
+async def run(args):
+    runs = await load_runs(args.db_name, args.source_ids)
+    # The main model alone, once for every threshold
+    baseline_agent = ComplianceAnalyzerAgent()
+    baseline_agent.screening_tier = None
+    baseline = await analyze_runs(baseline_agent, runs)
+
+    rows = [await evaluate(runs, baseline, args.screening_model, escalation_confidence)
+            for escalation_confidence in args.escalation_confidences]
+    print_report(rows)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+def main():
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Agreement and input token report of grouped compliance analysis against per-feature analysis.
+
+For each source (or the given ones) the related features are analyzed twice against the same
+retrieved sections: one call per feature, then in groups sharing one copy of the source context.
+The report shows how often the grouped verdicts agree with the per-feature ones and how many
+input tokens grouping saves. Both runs call the LLM, no cache is used and nothing is written.
+
+Run from the backend directory:
+
+    python -m scripts.compliance_group_report --group-max-features 4 8
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import List, Optional
+
+import dotenv
+
+dotenv.load_dotenv()
+
+from agents.compliance_analyzer_agent import ComplianceAnalyzerAgent  # noqa: E402
+from model.feature import Feature  # noqa: E402
+from repository.compression_dictionary_repository import CompressionDictionaryRepositoryAsync  # noqa: E402
+from repository.feature_repository import FeatureRepositoryAsync  # noqa: E402
+from repository.source_repository import SourceRepositoryAsync  # noqa: E402
+from repository.source_content_repository import SourceContentRepositoryAsync  # noqa: E402
+from repository.source_section_repository import SourceSectionRepositoryAsync  # noqa: E402
+from services.content_compression_service import ContentCompressionService  # noqa: E402
+from services.feature_service import FeatureService  # noqa: E402
+from services.source_content_service import SourceContentService  # noqa: E402
+from services.source_section_service import SourceSectionService  # noqa: E402
+
+
+async def load_runs(db_name: str, source_ids: Optional[List[str]]) -> List[dict]:
+    """(source contents, related features, their retrieved sections) per source, as an analysis run sees them"""
+    source_repository = SourceRepositoryAsync(
+        db_name=db_name, collection_name="sources")
+    content_compression_service = ContentCompressionService(
+        compression_dictionary_repository=CompressionDictionaryRepositoryAsync(
+            db_name=db_name, collection_name="compression_dictionaries"))
+    await content_compression_service.load_dictionaries_async()
+    source_content_service = SourceContentService(
+        source_content_repository=SourceContentRepositoryAsync(
+            db_name=db_name, collection_name="source_contents"),
+        content_compression_service=content_compression_service)
+    source_section_service = SourceSectionService(
+        source_section_repository=SourceSectionRepositoryAsync(
+            db_name=db_name, collection_name="source_sections"))
+    # Only reads features, no tagging agent is needed
+    feature_service = FeatureService(
+        feature_repository=FeatureRepositoryAsync(
+            db_name=db_name, collection_name="features"),
+        feature_tagging_agent=None)
+
+    runs = []
+    for source in await source_repository.get_sources():
+        if source_ids and source["id"] not in source_ids:
+            continue
+        if not source.get("tags"):
+            continue
+        source_content = await source_content_service.get_latest_source_content_async(source["source_url"])
+        if source_content is None:
+            continue
+        features: List[Feature] = await feature_service.get_features_by_tags_async(source["tags"])
+        if not features:
+            continue
+        feature_sections = await source_section_service.retrieve_sections_async([source_content], [
+            f"{feature.name} {feature.description} {' '.join(feature.tags)}" for feature in features
+        ])
+        runs.append({"source_url": source["source_url"], "source_contents": [source_content],
+                     "features": features, "feature_sections": feature_sections})
+    return runs
+
+
+def input_tokens(agent: ComplianceAnalyzerAgent) -> int:
+    return sum(agent_stats["input_tokens"] for agent_stats in agent.get_stats()["agents"].values())
+
+
+def llm_calls(agent: ComplianceAnalyzerAgent) -> int:
+    return sum(agent_stats["calls"] for agent_stats in agent.get_stats()["agents"].values())
+
+
+async def evaluate(runs: List[dict], group_max_features: int, context_token_budget: Optional[int]) -> dict:
+    feature_agent = ComplianceAnalyzerAgent(
+        context_token_budget=context_token_budget, analysis_mode="feature")
+    group_agent = ComplianceAnalyzerAgent(context_token_budget=context_token_budget,
+                                          analysis_mode="group", group_max_features=group_max_features)
+    features = 0
+    groups = 0
+    action_agreements = 0
+    status_agreements = 0
+    confidence_difference_sum = 0.0
+    for run in runs:
+        groups += len(group_agent.plan_feature_groups(
+            run["source_contents"], run["features"], run["feature_sections"]))
+        feature_responses, group_responses = await asyncio.gather(
+            feature_agent.analyze_compliance(
+                run["source_contents"], run["features"], run["feature_sections"], bypass_cache=True),
+            group_agent.analyze_compliance(
+                run["source_contents"], run["features"], run["feature_sections"], bypass_cache=True))
+        for feature_response, group_response in zip(feature_responses, group_responses):
+            features += 1
+            action_agreements += int(feature_response.needs_action ==
+                                     group_response.needs_action)
+            status_agreements += int(feature_response.status_change_to ==
+                                     group_response.status_change_to)
+            confidence_difference_sum += abs(
+                feature_response.confidence - group_response.confidence)
+
+    feature_tokens = input_tokens(feature_agent)
+    group_tokens = input_tokens(group_agent)
+    return {
+        "group_max_features": group_max_features,
+        "runs": len(runs),
+        "features": features,
+        "mean_group_size": features / groups if groups else None,
+        "feature_mode": {"calls": llm_calls(feature_agent), "input_tokens": feature_tokens},
+        "group_mode": {"calls": llm_calls(group_agent), "input_tokens": group_tokens},
+        "input_token_savings_rate": 1 - group_tokens / feature_tokens if feature_tokens else None,
+        "needs_action_agreement_rate": action_agreements / features if features else None,
+        "status_agreement_rate": status_agreements / features if features else None,
+        "mean_confidence_difference": confidence_difference_sum / features if features else None,
+    }
+
+
+def format_rate(value) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+
+def print_report(rows: List[dict]):
+    print(f"{'max':>4} {'feats':>6} {'size':>5} {'calls':>11} {'input tokens':>21} {'saved':>7} {'action':>7} {'status':>7} {'conf':>6}")
+    for row in rows:
+        mean_size = "-" if row["mean_group_size"] is None else f"{row['mean_group_size']:.1f}"
+        mean_confidence = "-" if row["mean_confidence_difference"] is None else f"{row['mean_confidence_difference']:.2f}"
+        print(f"{row['group_max_features']:>4} {row['features']:>6} {mean_size:>5} "
+              f"{row['feature_mode']['calls']:>5}/{row['group_mode']['calls']:<5} "
+              f"{row['feature_mode']['input_tokens']:>10}/{row['group_mode']['input_tokens']:<10} "
+              f"{format_rate(row['input_token_savings_rate']):>7} {format_rate(row['needs_action_agreement_rate']):>7} "
+              f"{format_rate(row['status_agreement_rate']):>7} {mean_confidence:>6}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-name", default="hacktok")
+    parser.add_argument("--source-ids", nargs="+", default=None,
+                        help="Sources to analyze, every tagged source by default")
+    parser.add_argument("--group-max-features", type=int, nargs="+",
+                        default=[int(os.getenv("COMPLIANCE_GROUP_MAX_FEATURES", "8"))])
+    parser.add_argument("--context-token-budget", type=int, default=None)
+    parser.add_argument("--json-out", default=None,
+                        help="Write the report as JSON, for comparing runs")
+    return parser.parse_args()
+
+
+async def run(args):
+    runs = await load_runs(args.db_name, args.source_ids)
+    rows = [await evaluate(runs, group_max_features, args.context_token_budget)
+            for group_max_features in args.group_max_features]
+    print_report(rows)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+def main():
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Offline benchmark of the source refresh pipeline (fetch -> extract -> diff -> persist -> tag).
+
+Serves a corpus of regulatory pages from a local fixture server, runs KnowledgeBaseService
+against it with a stubbed tagging agent, and reports throughput, per-stage latency and peak
+memory. Persistence goes to a throwaway Mongo database (MONGO_URI, default localhost) that is
+cleared at the start of every run.
+
+Run from the backend directory:
+
+    python -m scripts.refresh_benchmark --rounds 3 --change-rate 0.2 --error-rate 0.05
+
+Saved pages are read from --corpus-dir (see --save-corpus), any url without a saved copy is
+served as a synthetic page.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import dotenv
+
+dotenv.load_dotenv()
+# The agent modules build their LLM clients at import time. Nothing is called, tagging is stubbed.
+os.environ.setdefault("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+from agents.source_tagging_agent import SourceTaggingAgentResponse  # noqa: E402
+from scripts.benchmark_fixture_server import FixtureServer, slugify_url  # noqa: E402
+from model.source import Source  # noqa: E402
+from model.source_refresh import SourceRefreshResult  # noqa: E402
+from repository.compression_dictionary_repository import CompressionDictionaryRepositoryAsync  # noqa: E402
+from repository.source_content_repository import SourceContentRepositoryAsync  # noqa: E402
+from repository.source_repository import SourceRepositoryAsync  # noqa: E402
+from repository.source_section_repository import SourceSectionRepositoryAsync  # noqa: E402
+from services.content_compression_service import ContentCompressionService  # noqa: E402
+from services.content_extraction_service import ContentExtractionService  # noqa: E402
+from services.content_similarity_service import ContentSimilarityService  # noqa: E402
+from services.knowledge_base_service import KnowledgeBaseService  # noqa: E402
+from services.source_content_service import SourceContentService  # noqa: E402
+from services.source_fetch_service import SourceFetchService  # noqa: E402
+from services.source_section_service import SourceSectionService  # noqa: E402
+from services.source_service import SourceService  # noqa: E402
+
+STAGES = ["fetch", "extract", "diff", "persist", "tag"]
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class StubSourceTaggingAgent:
+    """Stands in for SourceTaggingAgent with a simulated LLM round trip"""
+
+    def __init__(self, latency_ms: float, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.random = random.Random(seed)
+        tags_path = BACKEND_DIR / "agents" / "resources" / "list_of_tags.json"
+        with open(tags_path, "r", encoding="utf-8") as f:
+            self.available_tags = [tag["tag"]
+                                   for tag in json.load(f)["regulation_tags"]]
+
+    async def generate_source_tags(self, source, source_content) -> SourceTaggingAgentResponse:
+        await asyncio.sleep(max(self.random.gauss(self.latency_ms, self.latency_ms / 4), 0) / 1000)
+        picker = random.Random(source_content.content_hash)
+        return SourceTaggingAgentResponse(tags=picker.sample(self.available_tags, k=min(3, len(self.available_tags))))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize_stages(results: List[SourceRefreshResult]) -> Dict[str, dict]:
+    summary = {}
+    for stage in STAGES:
+        values = [result.stage_ms[stage]
+                  for result in results if stage in result.stage_ms]
+        summary[stage] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50),
+            "p99_ms": percentile(values, 99),
+            "mean_ms": sum(values) / len(values) if values else None,
+        }
+    return summary
+
+
+def load_source_urls(sources_csv: Path, count: Optional[int]) -> List[str]:
+    with open(sources_csv, newline="", encoding="utf-8") as f:
+        rows = [row[0].strip() for row in csv.reader(f) if row]
+    # Skip the header and anything that is not a url, same as the bulk upload endpoint
+    source_urls = [row for row in rows if row.startswith("http")]
+    if count:
+        source_urls = [source_urls[i % len(source_urls)]
+                       for i in range(count)]
+    return source_urls
+
+
+async def save_corpus_async(source_urls: List[str], corpus_dir: Path):
+    """Download every url once, so later runs are fully offline and reproducible"""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    source_fetch_service = SourceFetchService()
+    results = await asyncio.gather(*[source_fetch_service.fetch_async(source_url) for source_url in set(source_urls)])
+    for result in results:
+        if result.ok:
+            (corpus_dir / slugify_url(result.source_url)
+             ).write_text(result.text, encoding="utf-8")
+            print(f"Saved {result.source_url}")
+        else:
+            print(f"Failed {result.source_url}: {result.error}")
+    await source_fetch_service.close_async()
+
+
+def format_ms(value: Optional[float]) -> str:
+    return f"{value:9.1f}" if value is not None else "        -"
+
+
+def print_round(report: dict):
+    print(
+        f"\nRound {report['round']}: {report['sources']} sources in {report['seconds']:.2f}s "
+        f"({report['sources_per_second']:.1f} sources/s), pages changed {report['pages_changed']}, "
+        f"outcomes {report['outcomes']}")
+    print(f"  {'stage':<8} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for stage, stats in report["stages"].items():
+        print(
+            f"  {stage:<8} {stats['count']:>6} {format_ms(stats['p50_ms'])} {format_ms(stats['p99_ms'])} {format_ms(stats['mean_ms'])}")
+
+
+async def run_benchmark_async(args) -> dict:
+    source_urls = load_source_urls(Path(args.sources_csv), args.sources)
+    fixture_server = FixtureServer(
+        source_urls,
+        corpus_dir=Path(args.corpus_dir) if args.corpus_dir else None,
+        hosts=args.hosts,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    await fixture_server.start_async()
+
+    source_repository = SourceRepositoryAsync(
+        db_name=args.db_name, collection_name="sources")
+    source_content_repository = SourceContentRepositoryAsync(
+        db_name=args.db_name, collection_name="source_contents")
+    source_section_repository = SourceSectionRepositoryAsync(
+        db_name=args.db_name, collection_name="source_sections")
+    compression_dictionary_repository = CompressionDictionaryRepositoryAsync(
+        db_name=args.db_name, collection_name="compression_dictionaries")
+    # Start from an empty database so every run measures the same work
+    await source_repository.client.drop_database(args.db_name)
+
+    source_tagging_agent = StubSourceTaggingAgent(
+        args.tag_latency_ms, seed=args.seed)
+    source_service = SourceService(
+        source_repository=source_repository, source_tagging_agent=source_tagging_agent)
+    source_content_service = SourceContentService(
+        source_content_repository=source_content_repository,
+        content_compression_service=ContentCompressionService(compression_dictionary_repository=compression_dictionary_repository))
+    source_section_service = SourceSectionService(
+        source_section_repository=source_section_repository)
+    await source_content_service.ensure_indexes_async()
+    await source_section_service.ensure_indexes_async()
+
+    source_fetch_service = SourceFetchService(
+        max_concurrency=args.fetch_max_concurrency,
+        max_per_host=args.fetch_max_per_host,
+        min_host_interval_seconds=args.fetch_min_host_interval,
+    )
+    content_extraction_service = ContentExtractionService(
+        max_workers=args.extraction_workers)
+    knowledge_base_service = KnowledgeBaseService(
+        source_service=source_service,
+        source_content_service=source_content_service,
+        source_tagging_agent=source_tagging_agent,
+        source_fetch_service=source_fetch_service,
+        content_similarity_service=ContentSimilarityService(),
+        content_extraction_service=content_extraction_service,
+        source_section_service=source_section_service,
+    )
+
+    for i in range(len(source_urls)):
+        await source_repository.add_source(Source(source_url=fixture_server.fixture_url(i), tags=[], created_at=datetime.utcnow()).model_dump())
+
+    tracemalloc.start()
+    rounds = []
+    all_results: List[SourceRefreshResult] = []
+    started_at = time.perf_counter()
+    try:
+        for round_number in range(1, args.rounds + 1):
+            # The first round ingests everything, later rounds see a changed subset
+            pages_changed = fixture_server.change_pages(
+                args.change_rate) if round_number > 1 else len(source_urls)
+            # Re-read so stored validators and fingerprints from the last round are used
+            sources = await source_service.get_sources_async()
+
+            round_started_at = time.perf_counter()
+            results = await knowledge_base_service.refresh_sources_async(sources)
+            seconds = time.perf_counter() - round_started_at
+            all_results.extend(results)
+
+            outcomes: Dict[str, int] = {}
+            for result in results:
+                outcomes[result.outcome.value] = outcomes.get(
+                    result.outcome.value, 0) + 1
+            report = {
+                "round": round_number,
+                "sources": len(results),
+                "seconds": seconds,
+                "sources_per_second": len(results) / seconds if seconds else None,
+                "pages_changed": pages_changed,
+                "outcomes": outcomes,
+                "stages": summarize_stages(results),
+            }
+            rounds.append(report)
+            print_round(report)
+    finally:
+        total_seconds = time.perf_counter() - started_at
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await fixture_server.stop_async()
+        await source_fetch_service.close_async()
+        content_extraction_service.shutdown()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "config": vars(args),
+        "sources": len(source_urls),
+        "total_seconds": total_seconds,
+        "sources_per_second": len(all_results) / total_seconds if total_seconds else None,
+        "stages": summarize_stages(all_results),
+        "rounds": rounds,
+        "memory": {
+            "python_heap_peak_bytes": traced_peak,
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit,
+            "extraction_workers_peak_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit,
+        },
+        "fixture_server": fixture_server.stats(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the source refresh pipeline against a local fixture server")
+    parser.add_argument("--sources-csv", default=str(BACKEND_DIR.parent / "raw_data.csv"),
+                        help="CSV of source urls, one per row")
+    parser.add_argument("--sources", type=int, default=None,
+                        help="Number of sources, urls from the CSV are repeated to reach it")
+    parser.add_argument("--corpus-dir", default=None,
+                        help="Directory of saved pages, see --save-corpus")
+    parser.add_argument("--save-corpus", action="store_true",
+                        help="Download the CSV urls into --corpus-dir and exit (needs network)")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--change-rate", type=float, default=0.2,
+                        help="Probability a page changes between rounds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Probability a request is answered with a 503")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=25.0)
+    parser.add_argument("--hosts", type=int, default=4,
+                        help="Loopback addresses to spread pages over, one per simulated domain")
+    parser.add_argument("--tag-latency-ms", type=float, default=800.0,
+                        help="Simulated latency of the tagging LLM call")
+    parser.add_argument("--fetch-max-concurrency", type=int, default=None)
+    parser.add_argument("--fetch-max-per-host", type=int, default=None)
+    parser.add_argument("--fetch-min-host-interval", type=float, default=None,
+                        help="Seconds between requests to one host, defaults to the production setting")
+    parser.add_argument("--extraction-workers", type=int, default=None)
+    parser.add_argument("--db-name", default="hacktok_benchmark",
+                        help="Mongo database to use, it is dropped at the start of the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", default=None,
+                        help="Write the full report as JSON, for comparing runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.db_name == "hacktok":
+        raise SystemExit("Refusing to benchmark against the application database")
+
+    if args.save_corpus:
+        if not args.corpus_dir:
+            raise SystemExit("--save-corpus needs --corpus-dir")
+        asyncio.run(save_corpus_async(load_source_urls(
+            Path(args.sources_csv), None), Path(args.corpus_dir)))
+        return
+
+    report = asyncio.run(run_benchmark_async(args))
+    memory = report["memory"]
+    print(
+        f"\nOverall: {report['sources_per_second']:.1f} sources/s over {report['total_seconds']:.2f}s, "
+        f"python heap peak {memory['python_heap_peak_bytes'] / 2**20:.1f} MiB, "
+        f"process peak RSS {memory['process_peak_rss_bytes'] / 2**20:.1f} MiB, "
+        f"extraction worker peak RSS {memory['extraction_workers_peak_rss_bytes'] / 2**20:.1f} MiB")
+    print(f"Fixture server: {report['fixture_server']}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Offline agreement report of the tag pre-classifier against LLM-assigned tags.
+
+Every stored feature and source was tagged by the LLM, so their tags are the reference. For a
+range of accept scores the report shows how many items the pre-classifier would decide alone,
+how often it agrees with the LLM on those, and how often the LLM's tags fall inside the
+shortlist it would send for the rest. Nothing is written and no LLM is called.
+
+Run from the backend directory:
+
+    python -m scripts.tag_classifier_report --accept-scores 0.3 0.35 0.45 0.6
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import dotenv
+
+dotenv.load_dotenv()
+
+from agents.tag_pre_classifier import TagPreClassifier  # noqa: E402
+from repository.compression_dictionary_repository import CompressionDictionaryRepositoryAsync  # noqa: E402
+from repository.feature_repository import FeatureRepositoryAsync  # noqa: E402
+from repository.source_content_repository import SourceContentRepositoryAsync  # noqa: E402
+from repository.source_repository import SourceRepositoryAsync  # noqa: E402
+from services.content_compression_service import ContentCompressionService  # noqa: E402
+from services.source_content_service import SourceContentService  # noqa: E402
+
+
+async def load_labelled_items(db_name: str) -> Dict[str, List[Tuple[str, List[str]]]]:
+    """(text, LLM tags) of every tagged feature and source, as the tagging agents would see them"""
+    feature_repository = FeatureRepositoryAsync(
+        db_name=db_name, collection_name="features")
+    source_repository = SourceRepositoryAsync(
+        db_name=db_name, collection_name="sources")
+    content_compression_service = ContentCompressionService(
+        compression_dictionary_repository=CompressionDictionaryRepositoryAsync(
+            db_name=db_name, collection_name="compression_dictionaries"))
+    await content_compression_service.load_dictionaries_async()
+    source_content_service = SourceContentService(
+        source_content_repository=SourceContentRepositoryAsync(
+            db_name=db_name, collection_name="source_contents"),
+        content_compression_service=content_compression_service)
+
+    features = [(f"{feature['name']} {feature['description']}", feature.get("tags", []))
+                for feature in await feature_repository.get_features_async() if feature.get("tags")]
+
+    sources = []
+    for source in await source_repository.get_sources():
+        if not source.get("tags"):
+            continue
+        source_content = await source_content_service.get_latest_source_content_async(source["source_url"])
+        if source_content is not None:
+            sources.append(
+                (f"Title: {source_content.title}\n{source_content.content}", source["tags"]))
+
+    return {"feature_tagging": features, "source_tagging": sources}
+
+
+def evaluate(items: List[Tuple[str, List[str]]], accept_score: float, reject_score: float, max_candidates: int) -> dict:
+    tag_pre_classifier = TagPreClassifier(accept_score=accept_score, reject_score=reject_score,
+                                          max_candidates=max_candidates, shadow_rate=0.0, enabled=True)
+    routes = {"local": 0, "shortlist": 0, "catalog": 0}
+    exact_matches = 0
+    jaccard_sum = 0.0
+    shortlist_covered = 0
+    elapsed = 0.0
+    for text, llm_tags in items:
+        started_at = time.perf_counter()
+        prediction = tag_pre_classifier.classify("report", text)
+        elapsed += time.perf_counter() - started_at
+        routes[prediction.route] += 1
+
+        chosen = set(llm_tags)
+        if prediction.route == "local":
+            predicted = set(prediction.tags)
+            exact_matches += int(predicted == chosen)
+            jaccard_sum += len(predicted & chosen) / len(predicted | chosen)
+        elif prediction.route == "shortlist":
+            # The LLM can only pick from the shortlist, tags outside it would be lost
+            shortlist_covered += int(chosen <= set(prediction.candidates))
+
+    return {
+        "accept_score": accept_score,
+        "items": len(items),
+        "routes": routes,
+        "llm_calls_avoided_rate": routes["local"] / len(items) if items else None,
+        "local_exact_match_rate": exact_matches / routes["local"] if routes["local"] else None,
+        "local_mean_jaccard": jaccard_sum / routes["local"] if routes["local"] else None,
+        "shortlist_coverage_rate": shortlist_covered / routes["shortlist"] if routes["shortlist"] else None,
+        "mean_classify_us": elapsed / len(items) * 1e6 if items else None,
+    }
+
+
+def format_rate(value) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+
+def print_report(report: dict):
+    for agent, rows in report.items():
+        print(f"\n{agent}")
+        print(f"{'accept':>8} {'items':>6} {'local':>6} {'short':>6} {'full':>6} {'avoided':>8} {'exact':>7} {'jaccard':>8} {'covered':>8} {'us':>8}")
+        for row in rows:
+            mean_us = "-" if row["mean_classify_us"] is None else f"{row['mean_classify_us']:.0f}"
+            print(f"{row['accept_score']:>8.2f} {row['items']:>6} {row['routes']['local']:>6} {row['routes']['shortlist']:>6} "
+                  f"{row['routes']['catalog']:>6} {format_rate(row['llm_calls_avoided_rate']):>8} "
+                  f"{format_rate(row['local_exact_match_rate']):>7} {format_rate(row['local_mean_jaccard']):>8} "
+                  f"{format_rate(row['shortlist_coverage_rate']):>8} {mean_us:>8}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-name", default="hacktok")
+    parser.add_argument("--accept-scores", type=float, nargs="+",
+                        default=[0.3, 0.35, 0.45, 0.6, 0.8])
+    parser.add_argument("--reject-score", type=float,
+                        default=float(os.getenv("TAG_CLASSIFIER_REJECT_SCORE", "0.12")))
+    parser.add_argument("--max-candidates", type=int,
+                        default=int(os.getenv("TAG_CLASSIFIER_MAX_CANDIDATES", "6")))
+    parser.add_argument("--json-out", default=None,
+                        help="Write the report as JSON, for comparing runs")
+    return parser.parse_args()
+
+
+async def run(args):
+    labelled_items = await load_labelled_items(args.db_name)
+    report = {
+        agent: [evaluate(items, accept_score, args.reject_score, args.max_candidates)
+                for accept_score in args.accept_scores]
+        for agent, items in labelled_items.items()
+    }
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
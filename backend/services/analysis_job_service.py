@@ -0,0 +1,339 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, List, Optional, Set
+from model.analysis_job import AnalysisJob, AnalysisJobKind, AnalysisJobStatus, AnalysisJobStep, AnalysisJobStepStatus
+from repository.analysis_job_repository import AnalysisJobRepositoryAsync
+from services.audit_report_service import AuditReportService
+from services.compliance_action_service import ComplianceActionService
+from services.compliance_analysis_service import ComplianceAnalysisService
+
+TERMINAL_STATUSES = {AnalysisJobStatus.COMPLETED.value,
+                     AnalysisJobStatus.FAILED.value}
+
+
+class LeaseLostError(Exception):
+    """The job's lease expired and another worker may have claimed it"""
+
+
+class AnalysisJobService:
+    """Durable queue of compliance analysis jobs in Mongo, drained by a pool of async workers.
+
+    Every replica runs its own workers. A job is leased by one worker at a time and the lease is
+    renewed while it runs, so a job cut off by a crash or restart is claimed again once its lease
+    expires. Each feature is a step recorded as one audit report tagged with the job, so a retry
+    only analyzes the features that have none yet.
+    """
+
+    def __init__(self, analysis_job_repository: AnalysisJobRepositoryAsync, compliance_analysis_service: ComplianceAnalysisService, audit_report_service: AuditReportService, compliance_action_service: ComplianceActionService, worker_count: Optional[int] = None, lease_seconds: Optional[float] = None, poll_seconds: Optional[float] = None, max_attempts: Optional[int] = None, retry_backoff_seconds: Optional[float] = None, stream_poll_seconds: float = 1.0):
+        self.analysis_job_repository = analysis_job_repository
+        self.compliance_analysis_service = compliance_analysis_service
+        self.audit_report_service = audit_report_service
+        self.compliance_action_service = compliance_action_service
+        self.worker_count = worker_count if worker_count is not None else int(
+            os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+        self.lease_seconds = lease_seconds or float(
+            os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "120"))
+        self.poll_seconds = poll_seconds or float(
+            os.getenv("ANALYSIS_JOB_POLL_SECONDS", "5"))
+        self.max_attempts = max_attempts or int(
+            os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+        self.retry_backoff_seconds = retry_backoff_seconds or float(
+            os.getenv("ANALYSIS_JOB_RETRY_BACKOFF_SECONDS", "30"))
+        self.stream_poll_seconds = stream_poll_seconds
+        # Unique per process, replicas on one host and restarts never share a lease. Each worker
+        # appends its own number, so two workers of a process never hold the same lease
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._worker_tasks: Set[asyncio.Task] = set()
+        self._worker_number = 0
+        # One per worker, all set on enqueue so idle local workers start at once instead of at
+        # their next poll. A shared event cleared by one worker would swallow its siblings' wakeup
+        self._wakeups: Set[asyncio.Event] = set()
+
+    async def ensure_indexes_async(self):
+        await self.analysis_job_repository.ensure_indexes_async()
+
+    async def _enqueue_async(self, analysis_job: AnalysisJob) -> str:
+        try:
+            analysis_job_id = await self.analysis_job_repository.create_analysis_job_async(analysis_job.model_dump())
+            for wakeup in self._wakeups:
+                wakeup.set()
+            return analysis_job_id
+        except Exception as e:
+            raise e
+
+    async def enqueue_sources_analysis_async(self, source_ids: List[str], bypass_cache: bool = False, force: bool = False, max_features: Optional[int] = None) -> str:
+        """Queue the analysis of the features related to the sources"""
+        return await self._enqueue_async(AnalysisJob(
+            kind=AnalysisJobKind.SOURCES,
+            source_ids=source_ids,
+            bypass_cache=bypass_cache,
+            force=force,
+            max_features=max_features,
+            max_attempts=self.max_attempts,
+            available_at=datetime.utcnow(),
+            created_at=datetime.utcnow(),
+        ))
+
+    async def enqueue_feature_analysis_async(self, feature_id: str, bypass_cache: bool = False, force: bool = False) -> str:
+        """Queue the analysis of one feature against the sources sharing its tags"""
+        return await self._enqueue_async(AnalysisJob(
+            kind=AnalysisJobKind.FEATURE,
+            feature_id=feature_id,
+            bypass_cache=bypass_cache,
+            force=force,
+            max_attempts=self.max_attempts,
+            available_at=datetime.utcnow(),
+            created_at=datetime.utcnow(),
+        ))
+
+    async def get_analysis_job_async(self, analysis_job_id: str) -> Optional[AnalysisJob]:
+        try:
+            analysis_job_data = await self.analysis_job_repository.get_analysis_job_async(analysis_job_id)
+            if analysis_job_data is None:
+                return None
+            return AnalysisJob(**analysis_job_data)
+        except Exception as e:
+            raise e
+
+    async def start_workers_async(self):
+        """Start the worker pool, none with ANALYSIS_JOB_WORKERS=0 (e.g. on API-only replicas)"""
+        for _ in range(self.worker_count - len(self._worker_tasks)):
+            self._worker_number += 1
+            task = asyncio.create_task(self._run_worker_async(
+                f"{self.worker_id}:{self._worker_number}"))
+            self._worker_tasks.add(task)
+            task.add_done_callback(self._worker_tasks.discard)
+
+    async def stop_workers_async(self):
+        """Stop the workers. Jobs they were running keep their lease until it expires, then are claimed again"""
+        for task in list(self._worker_tasks):
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    async def _run_worker_async(self, worker_id: str):
+        wakeup = asyncio.Event()
+        self._wakeups.add(wakeup)
+        try:
+            while True:
+                try:
+                    # Cleared before claiming, so a job enqueued after an empty claim still wakes it
+                    wakeup.clear()
+                    now = datetime.utcnow()
+                    analysis_job_data = await self.analysis_job_repository.claim_analysis_job_async(
+                        worker_id, now, now + timedelta(seconds=self.lease_seconds))
+                    if analysis_job_data is None:
+                        try:
+                            await asyncio.wait_for(wakeup.wait(), timeout=self.poll_seconds)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    await self._run_leased_job_async(worker_id, AnalysisJob(**analysis_job_data))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error in analysis job worker: {e}")
+                    await asyncio.sleep(self.poll_seconds)
+        finally:
+            self._wakeups.discard(wakeup)
+
+    async def _run_leased_job_async(self, worker_id: str, analysis_job: AnalysisJob):
+        """Run one attempt of a claimed job while renewing its lease, then finish, retry or fail it"""
+        run_task = asyncio.create_task(
+            self._run_attempt_async(worker_id, analysis_job))
+        try:
+            while not run_task.done():
+                await asyncio.wait({run_task}, timeout=self.lease_seconds / 3)
+                if run_task.done():
+                    break
+                try:
+                    renewed = await self.analysis_job_repository.update_leased_analysis_job_async(analysis_job.id, worker_id, analysis_job.attempts, {
+                        "lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                    })
+                except Exception as e:
+                    # Not a lost lease, it is still held until it expires. Renewed at the next tick
+                    print(
+                        f"Error renewing the lease of analysis job {analysis_job.id}: {e}")
+                    continue
+                if not renewed:
+                    # Another worker owns it now, steps already recorded are kept
+                    run_task.cancel()
+                    await asyncio.gather(run_task, return_exceptions=True)
+                    print(
+                        f"Lost the lease of analysis job {analysis_job.id}, stopped")
+                    return
+            error = run_task.result()
+        except LeaseLostError:
+            print(f"Lost the lease of analysis job {analysis_job.id}, stopped")
+            return
+        except asyncio.CancelledError:
+            run_task.cancel()
+            raise
+        except Exception as e:
+            print(f"Error running analysis job {analysis_job.id}: {e}")
+            error = str(e)
+
+        now = datetime.utcnow()
+        if error is None:
+            update_data = {
+                "status": AnalysisJobStatus.COMPLETED.value,
+                "error": None,
+                "finished_at": now,
+            }
+        elif analysis_job.attempts < analysis_job.max_attempts:
+            # Back off exponentially, the next attempt only redoes the steps not completed
+            update_data = {
+                "status": AnalysisJobStatus.PENDING.value,
+                "error": error,
+                "available_at": now + timedelta(seconds=self.retry_backoff_seconds * 2 ** (analysis_job.attempts - 1)),
+            }
+        else:
+            update_data = {
+                "status": AnalysisJobStatus.FAILED.value,
+                "error": error,
+                "finished_at": now,
+            }
+        await self.analysis_job_repository.update_leased_analysis_job_async(analysis_job.id, worker_id, analysis_job.attempts, {
+            **update_data,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "updated_at": now,
+        })
+
+    async def _update_leased_job_async(self, worker_id: str, analysis_job: AnalysisJob, update_data: dict):
+        if not await self.analysis_job_repository.update_leased_analysis_job_async(analysis_job.id, worker_id, analysis_job.attempts, update_data):
+            raise LeaseLostError(analysis_job.id)
+
+    async def _run_attempt_async(self, worker_id: str, analysis_job: AnalysisJob) -> Optional[str]:
+        """Analyze the steps not completed yet. Returns why the attempt failed, None when every step is done"""
+        if analysis_job.attempts > analysis_job.max_attempts:
+            # Its last attempt was cut off, e.g. a worker crash that keeps recurring on this job
+            return analysis_job.error or "Attempts exhausted"
+
+        run_id = uuid.uuid4().hex
+        if analysis_job.kind == AnalysisJobKind.SOURCES:
+            source_ids = analysis_job.source_ids
+            source_contents, features = await self.compliance_analysis_service.plan_sources_analysis_async(source_ids)
+        else:
+            source_ids, source_contents, feature = await self.compliance_analysis_service.plan_feature_analysis_async(analysis_job.feature_id)
+            features = [feature] if source_contents else []
+
+        update_data = {
+            "failed": 0,
+            "run_ids": [*analysis_job.run_ids, run_id],
+            "updated_at": datetime.utcnow(),
+        }
+        if analysis_job.started_at is None:
+            update_data["started_at"] = datetime.utcnow()
+        if not analysis_job.planned:
+            # The features to analyze are fixed by the first attempt, the most relevant within the
+            # budget that are not up to date
+            features, up_to_date_features, over_budget_features = await self.compliance_analysis_service.select_features_to_analyze_async(
+                source_contents, features, analysis_job.force, analysis_job.max_features)
+            analysis_job.steps = [AnalysisJobStep(
+                feature_id=feature.id) for feature in features]
+            update_data.update({
+                "planned": True,
+                "up_to_date_feature_ids": [feature.id for feature in up_to_date_features],
+                "over_budget_feature_ids": [feature.id for feature in over_budget_features],
+                "source_ids": source_ids,
+                "steps": [step.model_dump() for step in analysis_job.steps],
+                "total": len(analysis_job.steps),
+            })
+        await self._update_leased_job_async(worker_id, analysis_job, update_data)
+
+        remaining_feature_ids = {
+            step.feature_id for step in analysis_job.steps if step.status != AnalysisJobStepStatus.COMPLETED}
+        if not remaining_feature_ids:
+            return None
+
+        # Steps whose audit report was recorded before the previous attempt was cut off are
+        # completed without calling the LLM again, their action is applied again (it is idempotent)
+        for audit_report in await self.audit_report_service.get_audit_reports_by_analysis_job_async(analysis_job.id):
+            if audit_report["feature_id"] in remaining_feature_ids:
+                await self.compliance_action_service.execute_audit_report_action_async(audit_report["id"])
+                await self._record_step_async(analysis_job.id, audit_report["feature_id"], audit_report["id"], None)
+                remaining_feature_ids.discard(audit_report["feature_id"])
+
+        # Features deleted since planning can no longer be analyzed
+        features_by_id = {feature.id: feature for feature in features}
+        for feature_id in remaining_feature_ids - features_by_id.keys():
+            await self._record_step_async(analysis_job.id, feature_id, None, "Feature not found")
+        remaining_features = [
+            features_by_id[feature_id] for feature_id in remaining_feature_ids if feature_id in features_by_id]
+
+        failed_steps = len(remaining_feature_ids) - len(remaining_features)
+        async for event in self.compliance_analysis_service.analyze_features_events_async(
+                run_id, source_ids, source_contents, remaining_features, analysis_job.bypass_cache, analysis_job_id=analysis_job.id):
+            if event["type"] == "audit_report_created":
+                await self._record_step_async(analysis_job.id, event["data"]["feature_id"], event["data"]["audit_report_id"], None)
+            elif event["type"] == "feature_skipped":
+                # Nothing to analyze it against, done without an audit report
+                await self._record_step_async(analysis_job.id, event["data"]["feature_id"], None, None)
+            elif event["type"] == "feature_failed":
+                failed_steps += 1
+                await self._record_step_async(analysis_job.id, event["data"]["feature_id"], None, event["data"]["message"])
+
+        if failed_steps:
+            return f"Analysis failed for {failed_steps} of {analysis_job.total or len(analysis_job.steps)} features"
+        return None
+
+    async def _record_step_async(self, analysis_job_id: str, feature_id: str, audit_report_id: Optional[str], error: Optional[str]):
+        if error is None:
+            step_data = {"status": AnalysisJobStepStatus.COMPLETED.value,
+                         "audit_report_id": audit_report_id, "error": None}
+            increments = {"completed": 1}
+        else:
+            step_data = {
+                "status": AnalysisJobStepStatus.FAILED.value, "error": error}
+            increments = {"failed": 1}
+        await self.analysis_job_repository.record_step_result_async(
+            analysis_job_id, feature_id, step_data, increments, {"updated_at": datetime.utcnow()})
+
+    async def stream_analysis_job_async(self, analysis_job_id: str) -> AsyncGenerator[str, None]:
+        """SSE progress for a job. Polls Mongo, so it works whichever replica runs the job"""
+        try:
+            last_updated_at = None
+            message_type = "initial_data"
+            # Keep idle proxies from closing the connection, without a comment every poll
+            heartbeat_every = max(int(15 / self.stream_poll_seconds), 1)
+            idle_polls = 0
+            while True:
+                analysis_job = await self.get_analysis_job_async(analysis_job_id)
+                if analysis_job is None:
+                    error_message = {
+                        "type": "error",
+                        "data": {"message": f"Analysis job {analysis_job_id} not found"},
+                    }
+                    yield f"data: {json.dumps(error_message)}\n\n"
+                    return
+
+                if message_type == "initial_data" or analysis_job.updated_at != last_updated_at:
+                    last_updated_at = analysis_job.updated_at
+                    progress_message = {
+                        "type": message_type,
+                        "data": {"analysis_job": analysis_job.model_dump(mode="json")},
+                    }
+                    yield f"data: {json.dumps(progress_message)}\n\n"
+                    message_type = "analysis_job_update"
+                    idle_polls = 0
+                else:
+                    idle_polls += 1
+                    if idle_polls % heartbeat_every == 0:
+                        yield f": heartbeat\n\n"
+
+                if analysis_job.status.value in TERMINAL_STATUSES:
+                    return
+
+                await asyncio.sleep(self.stream_poll_seconds)
+
+        except Exception as e:
+            error_message = {
+                "type": "error",
+                "data": {"message": f"Streaming error: {str(e)}"},
+            }
+            yield f"data: {json.dumps(error_message)}\n\n"
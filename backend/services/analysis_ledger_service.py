@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import List, Tuple
+from model.analysis_ledger import AnalysisLedgerEntry
+from model.feature import Feature
+from model.source_content import SourceContent
+from repository.analysis_ledger_repository import AnalysisLedgerRepositoryAsync
+from services.feature_service import FeatureService
+from services.source_content_service import SourceContentService
+
+
+class AnalysisLedgerService:
+    """Remembers what each (feature, source) pair was last analyzed from, to skip pairs that did not change.
+
+    A pair is dirty when it was never analyzed, or when the feature's revision, the source's latest
+    content hash or the analysis version (prompts and models) differ from its last analysis.
+    """
+
+    def __init__(self, analysis_ledger_repository: AnalysisLedgerRepositoryAsync):
+        self.analysis_ledger_repository = analysis_ledger_repository
+
+    async def ensure_indexes_async(self):
+        await self.analysis_ledger_repository.ensure_indexes_async()
+
+    @staticmethod
+    def _source_content_hash(source_content: SourceContent) -> str:
+        return source_content.content_hash or SourceContentService.compute_content_hash(
+            source_content.title, source_content.content)
+
+    async def split_dirty_features_async(self, source_contents: List[SourceContent], features: List[Feature], analysis_version: str) -> Tuple[List[Feature], List[Feature]]:
+        """(features with at least one dirty pair, features whose pairs are all up to date)"""
+        try:
+            if not features or not source_contents:
+                return features, []
+            entries = await self.analysis_ledger_repository.get_entries_async(
+                [feature.id for feature in features], [source_content.source_url for source_content in source_contents])
+            entries_by_pair = {
+                (entry["feature_id"], entry["source_url"]): entry for entry in entries}
+
+            source_content_hashes = {
+                source_content.source_url: self._source_content_hash(source_content) for source_content in source_contents}
+            dirty_features = []
+            up_to_date_features = []
+            for feature in features:
+                feature_revision = FeatureService.compute_feature_revision(
+                    feature)
+                is_up_to_date = all(
+                    (entry := entries_by_pair.get((feature.id, source_url))) is not None
+                    and entry["feature_revision"] == feature_revision
+                    and entry["source_content_hash"] == source_content_hash
+                    and entry["analysis_version"] == analysis_version
+                    for source_url, source_content_hash in source_content_hashes.items()
+                )
+                if is_up_to_date:
+                    up_to_date_features.append(feature)
+                else:
+                    dirty_features.append(feature)
+            return dirty_features, up_to_date_features
+        except Exception as e:
+            raise e
+
+    async def record_analysis_async(self, source_contents: List[SourceContent], feature: Feature, analysis_version: str, audit_report_id: str):
+        """Mark every pair of the feature with these sources as analyzed from their current inputs"""
+        feature_revision = FeatureService.compute_feature_revision(feature)
+        entries = [
+            AnalysisLedgerEntry(
+                feature_id=feature.id,
+                source_url=source_content.source_url,
+                feature_revision=feature_revision,
+                source_content_hash=self._source_content_hash(source_content),
+                analysis_version=analysis_version,
+                audit_report_id=audit_report_id,
+                analyzed_at=datetime.utcnow(),
+            ).model_dump(exclude={"id"})
+            for source_content in source_contents
+        ]
+        # A pair left unrecorded is only analyzed again, so a failed write is not an error
+        await self.analysis_ledger_repository.upsert_entries_async(entries)
@@ -14,6 +14,9 @@ class AuditReportService:
     def __init__(self, audit_report_repository: AuditReportRepositoryAsync):
         self.audit_report_repository = audit_report_repository
 
+    async def ensure_indexes_async(self):
+        await self.audit_report_repository.ensure_indexes_async()
+
     async def get_audit_reports_async(self):
         try:
             audit_reports = await self.audit_report_repository.get_audit_reports_async()
@@ -31,6 +34,12 @@ class AuditReportService:
                 status_change_to=audit_report.status_change_to,
                 reason=audit_report.reason,
                 confidence=audit_report.confidence,
+                section_ids=audit_report.section_ids,
+                run_id=audit_report.run_id,
+                llm_usage=audit_report.llm_usage,
+                decided_by_tier=audit_report.decided_by_tier,
+                decided_by_model=audit_report.decided_by_model,
+                analysis_job_id=audit_report.analysis_job_id,
                 created_at=datetime.utcnow(),
                 updated_at=None,
                 status=AuditReportStatus.PENDING,
@@ -92,6 +101,14 @@ class AuditReportService:
         except Exception as e:
             raise e
 
+    async def get_audit_reports_by_analysis_job_async(self, analysis_job_id: str):
+        try:
+            audit_reports = await self.audit_report_repository.get_audit_reports_by_analysis_job_async(
+                analysis_job_id)
+            return audit_reports
+        except Exception as e:
+            raise e
+
     async def stream_audit_reports_async(self) -> AsyncGenerator[str, None]:
         try:
             initial_audit_reports = await self.get_audit_reports_async()
@@ -1,64 +1,316 @@
-from typing import List
-from agents.compliance_analyzer_agent import ComplianceAnalyzerAgent
+import asyncio
+import json
+import os
+import uuid
+import xxhash
+from typing import AsyncGenerator, List, Optional, Set, Tuple
+from agents.compliance_analyzer_agent import ComplianceAnalyzerAgent, ComplianceAnalyzerAgentResult
+from agents.llm_telemetry import llm_telemetry
 from services.source_service import SourceService
 from services.source_content_service import SourceContentService
+from services.source_section_service import SourceSectionService
 from services.feature_service import FeatureService
 from services.audit_report_service import AuditReportService
 from services.compliance_action_service import ComplianceActionService
+from services.analysis_ledger_service import AnalysisLedgerService
 from model.audit_report import AuditReportCreateRequest
+from model.feature import Feature
+from model.llm_telemetry import LlmUsage
+from model.source_content import SourceContent
+from model.source_section import SourceSection
 
 
 class ComplianceAnalysisService:
-    def __init__(self, source_service: SourceService, source_content_service: SourceContentService, feature_service: FeatureService, audit_report_service: AuditReportService, compliance_action_service: ComplianceActionService, compliance_analyzer_agent: ComplianceAnalyzerAgent):
+    def __init__(self, source_service: SourceService, source_content_service: SourceContentService, source_section_service: SourceSectionService, feature_service: FeatureService, audit_report_service: AuditReportService, compliance_action_service: ComplianceActionService, compliance_analyzer_agent: ComplianceAnalyzerAgent, analysis_ledger_service: AnalysisLedgerService, feature_budget: Optional[int] = None):
         self.source_service = source_service
         self.source_content_service = source_content_service
+        self.source_section_service = source_section_service
         self.feature_service = feature_service
         self.audit_report_service = audit_report_service
         self.compliance_action_service = compliance_action_service
         self.compliance_analyzer_agent = compliance_analyzer_agent
+        self.analysis_ledger_service = analysis_ledger_service
+        # Most features one source analysis may analyze, the most relevant ones are picked
+        self.feature_budget = feature_budget or int(
+            os.getenv("COMPLIANCE_FEATURE_BUDGET", "50"))
+        # Recordings still running after their analysis was cancelled
+        self._recording_tasks: Set[asyncio.Task] = set()
 
-    # Priority 1
-    async def analyze_sources_impact_async(self, source_ids: List[str]):
+    def analysis_version(self) -> str:
+        """The agent's analysis version plus the section retrieval settings, which decide the
+        source text each feature is shown"""
+        return xxhash.xxh3_64_hexdigest(
+            f"{self.compliance_analyzer_agent.analysis_version()}\0"
+            f"{self.source_section_service.top_k}\0{self.source_section_service.max_section_chars}")
+
+    async def _record_analysis_async(self, source_ids: List[str], feature: Feature, source_sections: List[SourceSection], response: ComplianceAnalyzerAgentResult, run_id: Optional[str] = None, llm_usage: Optional[LlmUsage] = None, analysis_job_id: Optional[str] = None) -> Tuple[str, AuditReportCreateRequest]:
+        """Persist one feature's result as an audit report and apply its action"""
+        # Keep only citations of sections the feature was actually shown
+        provided_section_ids = {
+            source_section.section_id for source_section in source_sections}
+        section_ids = [
+            section_id for section_id in response.cited_section_ids if section_id in provided_section_ids]
+
+        # Create AuditReportCreateRequest
+        audit_report_request = AuditReportCreateRequest(
+            feature_id=feature.id,
+            source_ids=source_ids,
+            needs_action=response.needs_action,
+            original_status=response.original_status,
+            status_change_to=response.status_change_to,
+            reason=response.reason,
+            confidence=response.confidence,
+            section_ids=section_ids,
+            run_id=run_id,
+            llm_usage=llm_usage,
+            decided_by_tier=response.tier,
+            decided_by_model=response.model,
+            analysis_job_id=analysis_job_id
+        )
+
+        # Create audit report via service
+        audit_report_id = await self.audit_report_service.create_audit_report_async(audit_report_request)
+        await self.compliance_action_service.execute_audit_report_action_async(audit_report_id)
+        return audit_report_id, audit_report_request
+
+    async def _analyze_and_record_group_async(self, run_id: str, source_ids: List[str], source_contents: List[SourceContent], features: List[Feature], feature_sections: List[List[SourceSection]], bypass_cache: bool, analysis_job_id: Optional[str] = None) -> List[dict]:
+        """Analyze features together (a single feature outside "group" mode) and record each result"""
+        # Taken before the calls, a prompt reloaded meanwhile leaves these pairs dirty
+        analysis_version = self.analysis_version()
+        try:
+            # Each task has its own context, so the usage collected is this group's alone
+            with llm_telemetry.track_run(run_id), llm_telemetry.collect() as llm_usage:
+                responses = await self.compliance_analyzer_agent.analyze_feature_group_compliance(
+                    source_contents, features, feature_sections, bypass_cache=bypass_cache)
+            llm_usage.shared_by_features = len(features)
+        except Exception as e:
+            print(
+                f"Error analyzing features {', '.join(feature.id for feature in features)}: {e}")
+            return [{
+                "type": "feature_failed",
+                "data": {"feature_id": feature.id, "message": str(e)},
+            } for feature in features]
+
+        # Once the calls are paid for, a cancelled run (e.g. a closed stream) still records and
+        # actions every verdict instead of stopping between an audit report and its action
+        record_task = asyncio.create_task(self._record_group_results_async(
+            run_id, source_ids, source_contents, features, feature_sections, responses, llm_usage, analysis_version, analysis_job_id))
+        # Held until done, the loop only keeps weak references to tasks
+        self._recording_tasks.add(record_task)
+        record_task.add_done_callback(self._recording_tasks.discard)
+        return await asyncio.shield(record_task)
+
+    async def _record_group_results_async(self, run_id: str, source_ids: List[str], source_contents: List[SourceContent], features: List[Feature], feature_sections: List[List[SourceSection]], responses: List[ComplianceAnalyzerAgentResult], llm_usage: LlmUsage, analysis_version: str, analysis_job_id: Optional[str] = None) -> List[dict]:
+        # Grouped features were shown the sections of the whole group
+        shown_sections = [
+            source_section for source_sections in feature_sections for source_section in source_sections]
+        events = []
+        for feature, response in zip(features, responses):
+            try:
+                audit_report_id, audit_report_request = await self._record_analysis_async(
+                    source_ids, feature, shown_sections, response, run_id, llm_usage if llm_usage.calls else None, analysis_job_id)
+                await self.analysis_ledger_service.record_analysis_async(
+                    source_contents, feature, analysis_version, audit_report_id)
+                events.append({
+                    "type": "audit_report_created",
+                    "data": {
+                        "feature_id": feature.id,
+                        "audit_report_id": audit_report_id,
+                        "audit_report": audit_report_request.model_dump(mode="json"),
+                    },
+                })
+            except Exception as e:
+                print(f"Error recording analysis of feature {feature.id}: {e}")
+                events.append({
+                    "type": "feature_failed",
+                    "data": {"feature_id": feature.id, "message": str(e)},
+                })
+        return events
+
+    async def plan_sources_analysis_async(self, source_ids: List[str]) -> Tuple[List[SourceContent], List[Feature]]:
+        """The latest content of the sources and the features related to them, most relevant first"""
         # Retrieve the source content
         sources = await self.source_service.get_sources_via_ids_async(source_ids)
 
         source_urls = [source.source_url for source in sources]
 
-        source_contents = await self.source_content_service.get_source_content_by_source_urls_async(source_urls)
+        # Only the latest version of each source is current regulation
+        source_contents = await self.source_content_service.get_latest_source_contents_async(source_urls)
+
+        # Features sharing a tag with any of the sources, ranked by the tags they share and how
+        # close their wording is to the sources' text. The terms come from the sections cached
+        # for retrieval, so the HTML is not tokenized again on the event loop
+        tags = sorted({tag for source in sources for tag in source.tags or []})
+        context_terms = await self.source_section_service.get_source_terms_async(source_contents)
+        ranked_features = await self.feature_service.rank_features_by_tags_async(tags, context_terms)
+        return source_contents, [ranked_feature.feature for ranked_feature in ranked_features]
+
+    async def plan_feature_analysis_async(self, feature_id: str) -> Tuple[List[str], List[SourceContent], Feature]:
+        """The sources sharing a tag with the feature that have content, their latest content, and the feature"""
+        feature = await self.feature_service.get_feature_async(feature_id)
+
+        # Tag to source lookup on the sources' tags index, then the latest version of each
+        sources = await self.source_service.get_sources_by_tags_async(feature.tags)
+        source_contents = await self.source_content_service.get_latest_source_contents_async(
+            [source.source_url for source in sources])
+        analyzed_urls = {
+            source_content.source_url for source_content in source_contents}
+        source_ids = [
+            source.id for source in sources if source.source_url in analyzed_urls]
+        return source_ids, source_contents, feature
+
+    async def select_features_to_analyze_async(self, source_contents: List[SourceContent], features: List[Feature], force: bool = False, max_features: Optional[int] = None) -> Tuple[List[Feature], List[Feature], List[Feature]]:
+        """(features to analyze, features already analyzed from the same feature revision, source
+        versions and analysis version, features over the budget). With force, every feature is
+        analyzed again.
+
+        Features are taken in the given order, most relevant first, up to max_features (the
+        service's feature budget by default) of those not up to date.
+        """
+        if force:
+            dirty_features, up_to_date_features = features, []
+        else:
+            dirty_features, up_to_date_features = await self.analysis_ledger_service.split_dirty_features_async(
+                source_contents, features, self.analysis_version())
+        if max_features is None:
+            max_features = self.feature_budget
+        return dirty_features[:max_features], up_to_date_features, dirty_features[max_features:]
+
+    async def analyze_features_events_async(self, run_id: str, source_ids: List[str], source_contents: List[SourceContent], features: List[Feature], bypass_cache: bool = False, heartbeat_seconds: Optional[float] = None, analysis_job_id: Optional[str] = None) -> AsyncGenerator[dict, None]:
+        """An audit_report_created, feature_failed or feature_skipped event per feature, each as soon as it is persisted and actioned.
+
+        Features without any source section to analyze against are skipped, never sent to the LLM.
 
-        # TODO: Refactor this later
-        related_features = await self.feature_service.get_features_by_tags_async(sources[0].tags)
+        With heartbeat_seconds, a heartbeat event is yielded whenever no call finished for that long.
+        """
+        if not features:
+            return
 
-        # Truncate related_features to a maximum of 5
-        # NOTE: Truncating to avoid rate limiting error from LLM API
-        truncated_features = related_features[:5]
-        agent_response = await self.compliance_analyzer_agent.analyze_compliance(source_contents, truncated_features)
+        # Send each feature only the sections most relevant to it rather than every full source
+        feature_sections = await self.source_section_service.retrieve_sections_async(source_contents, [
+            f"{feature.name} {feature.description} {' '.join(feature.tags)}" for feature in features
+        ])
+
+        # A verdict on empty regulatory content would still be recorded and actioned
+        for feature, source_sections in zip(features, feature_sections):
+            if not source_sections:
+                yield {"type": "feature_skipped", "data": {"feature_id": feature.id, "message": "No relevant source content"}}
+        analyzed = [i for i, source_sections in enumerate(
+            feature_sections) if source_sections]
+        features = [features[i] for i in analyzed]
+        feature_sections = [feature_sections[i] for i in analyzed]
+        if not features:
+            return
+
+        # Every feature is analyzed, the shared LLM scheduler paces the calls to the rate limits.
+        # Each one is recorded as soon as its own call (or its group's) is done
+        groups = self.compliance_analyzer_agent.plan_feature_groups(
+            source_contents, features, feature_sections)
+        pending = {
+            asyncio.create_task(self._analyze_and_record_group_async(
+                run_id, source_ids, source_contents, [features[i] for i in group], [feature_sections[i] for i in group], bypass_cache, analysis_job_id))
+            for group in groups
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=heartbeat_seconds, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    yield {"type": "heartbeat"}
+                for task in done:
+                    for event in task.result():
+                        yield event
+        finally:
+            # The consumer went away (a closed stream), analyses already recorded are kept and
+            # those whose calls are done finish recording
+            for task in pending:
+                task.cancel()
+
+    async def _analyze_sources_events_async(self, source_ids: List[str], bypass_cache: bool = False, heartbeat_seconds: Optional[float] = None, force: bool = False, max_features: Optional[int] = None) -> AsyncGenerator[dict, None]:
+        """Analysis events, each feature's as soon as it is persisted and actioned.
+
+        With heartbeat_seconds, a heartbeat event is yielded whenever no call finished for that long.
+        """
+        source_contents, related_features = await self.plan_sources_analysis_async(source_ids)
+        # Only the features whose feature, source version or analysis version changed since their last analysis
+        related_features, up_to_date_features, over_budget_features = await self.select_features_to_analyze_async(
+            source_contents, related_features, force, max_features)
+        up_to_date_feature_ids = [feature.id for feature in up_to_date_features]
+        over_budget_feature_ids = [feature.id for feature in over_budget_features]
+
+        # LLM usage of the whole run is at GET /llm-telemetry/runs/{run_id}
+        run_id = uuid.uuid4().hex
+        yield {"type": "analysis_started", "data": {"run_id": run_id, "source_ids": source_ids, "feature_count": len(related_features), "up_to_date_feature_ids": up_to_date_feature_ids, "over_budget_feature_ids": over_budget_feature_ids}}
 
-        # Create audit reports for each compliance analysis response
         audit_report_ids = []
-        for i, response in enumerate(agent_response):
-            # Get corresponding feature (assumes responses map to features by index)
-            corresponding_feature = related_features[i]
-
-            # Create AuditReportCreateRequest
-            audit_report_request = AuditReportCreateRequest(
-                feature_id=corresponding_feature.id,
-                source_ids=source_ids,
-                needs_action=response.needs_action,
-                original_status=response.original_status,
-                status_change_to=response.status_change_to,
-                reason=response.reason,
-                confidence=response.confidence
-            )
-
-            # Create audit report via service
-            audit_report_id = await self.audit_report_service.create_audit_report_async(audit_report_request)
-            await self.compliance_action_service.execute_audit_report_action_async(audit_report_id)
-            audit_report_ids.append(audit_report_id)
+        failed_feature_ids = []
+        skipped_feature_ids = []
+        async for event in self.analyze_features_events_async(run_id, source_ids, source_contents, related_features, bypass_cache, heartbeat_seconds):
+            if event["type"] == "audit_report_created":
+                audit_report_ids.append(event["data"]["audit_report_id"])
+            elif event["type"] == "feature_failed":
+                failed_feature_ids.append(event["data"]["feature_id"])
+            elif event["type"] == "feature_skipped":
+                skipped_feature_ids.append(event["data"]["feature_id"])
+            yield event
+
+        run_stats = llm_telemetry.get_run_stats(run_id)
+        yield {"type": "analysis_completed", "data": {
+            "run_id": run_id,
+            "audit_report_ids": audit_report_ids,
+            "failed_feature_ids": failed_feature_ids,
+            "skipped_feature_ids": skipped_feature_ids,
+            "up_to_date_feature_ids": up_to_date_feature_ids,
+            "over_budget_feature_ids": over_budget_feature_ids,
+            "llm_usage": run_stats["totals"] if run_stats else None,
+        }}
 
+    # Priority 1
+    async def analyze_sources_impact_async(self, source_ids: List[str], bypass_cache: bool = False, force: bool = False, max_features: Optional[int] = None):
+        audit_report_ids = []
+        async for event in self._analyze_sources_events_async(source_ids, bypass_cache=bypass_cache, force=force, max_features=max_features):
+            if event["type"] == "analysis_completed":
+                audit_report_ids = event["data"]["audit_report_ids"]
+                if event["data"]["failed_feature_ids"]:
+                    raise RuntimeError(
+                        f"Analysis failed for features {', '.join(event['data']['failed_feature_ids'])}, "
+                        f"{len(audit_report_ids)} audit reports were created")
         return audit_report_ids
 
+    async def stream_sources_impact_async(self, source_ids: List[str], bypass_cache: bool = False, force: bool = False, max_features: Optional[int] = None) -> AsyncGenerator[str, None]:
+        """SSE of an analysis run: an audit report per feature as it completes, then a summary"""
+        try:
+            async for event in self._analyze_sources_events_async(source_ids, bypass_cache=bypass_cache, heartbeat_seconds=15, force=force, max_features=max_features):
+                if event["type"] == "heartbeat":
+                    yield f": heartbeat\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+
+        except Exception as e:
+            error_message = {
+                "type": "error",
+                "data": {"message": f"Streaming error: {str(e)}"},
+            }
+            yield f"data: {json.dumps(error_message)}\n\n"
+
     # Priority 2
-    async def analyze_feature_impact_async(self, feature_id: str):
-        # TODO: Implement
-        pass
+    async def analyze_feature_impact_async(self, feature_id: str, bypass_cache: bool = False, force: bool = False) -> List[str]:
+        """Analyze one feature against the sources sharing any of its tags, e.g. after it was created or edited.
+
+        Returns the id of the audit report, or no ids when no source with content shares a tag or
+        the feature was already analyzed against the same versions of them.
+        """
+        source_ids, source_contents, feature = await self.plan_feature_analysis_async(feature_id)
+        features, _, _ = await self.select_features_to_analyze_async(source_contents, [feature], force)
+        if not source_contents or not features:
+            return []
+
+        # Paced by the shared LLM scheduler like every other analysis
+        run_id = uuid.uuid4().hex
+        audit_report_ids = []
+        async for event in self.analyze_features_events_async(run_id, source_ids, source_contents, [feature], bypass_cache):
+            if event["type"] == "feature_failed":
+                raise RuntimeError(
+                    f"Analysis failed for feature {feature_id}: {event['data']['message']}")
+            if event["type"] == "audit_report_created":
+                audit_report_ids.append(event["data"]["audit_report_id"])
+        return audit_report_ids
@@ -0,0 +1,103 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import zstandard
+
+from repository.compression_dictionary_repository import CompressionDictionaryRepositoryAsync
+
+
+class ContentCompressionService:
+    """zstd compression of stored source content, optionally with a dictionary trained on the corpus.
+
+    Regulatory pages share a lot of boilerplate markup and legal phrasing, which a trained
+    dictionary captures far better than per-document compression can on its own.
+    """
+
+    def __init__(self, compression_dictionary_repository: CompressionDictionaryRepositoryAsync, level: Optional[int] = None, dictionary_size: Optional[int] = None, max_training_samples: Optional[int] = None):
+        self.compression_dictionary_repository = compression_dictionary_repository
+        self.level = level or int(
+            os.getenv("SOURCE_CONTENT_COMPRESSION_LEVEL", "10"))
+        self.dictionary_size = dictionary_size or int(
+            os.getenv("SOURCE_CONTENT_DICTIONARY_SIZE", str(112 * 1024)))
+        self.max_training_samples = max_training_samples or int(
+            os.getenv("SOURCE_CONTENT_DICTIONARY_MAX_SAMPLES", "2000"))
+
+        # Every dictionary ever used stays loaded, older versions still reference theirs
+        self._dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self._decompressors: Dict[Optional[int], zstandard.ZstdDecompressor] = {
+            None: zstandard.ZstdDecompressor()}
+        self.current_dict_id: Optional[int] = None
+        self._compressor = zstandard.ZstdCompressor(level=self.level)
+
+    def _use_dictionary(self, dict_id: int, dictionary_data: bytes):
+        dictionary = zstandard.ZstdCompressionDict(dictionary_data)
+        self._dictionaries[dict_id] = dictionary
+        self._decompressors[dict_id] = zstandard.ZstdDecompressor(
+            dict_data=dictionary)
+
+    def _set_current_dictionary(self, dict_id: Optional[int]):
+        self.current_dict_id = dict_id
+        if dict_id is None:
+            self._compressor = zstandard.ZstdCompressor(level=self.level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dictionaries[dict_id])
+
+    async def load_dictionaries_async(self):
+        """Load stored dictionaries, the most recently trained one compresses new content"""
+        try:
+            compression_dictionaries = await self.compression_dictionary_repository.get_compression_dictionaries_async()
+            for compression_dictionary in compression_dictionaries:
+                self._use_dictionary(
+                    compression_dictionary["dict_id"], compression_dictionary["data"])
+            if compression_dictionaries:
+                self._set_current_dictionary(
+                    compression_dictionaries[0]["dict_id"])
+        except Exception as e:
+            print(f"Error loading compression dictionaries: {e}")
+
+    async def train_dictionary_async(self, samples: List[str]) -> Optional[int]:
+        """Train a dictionary on sample contents and make it current. Returns None when there is too little data"""
+        encoded_samples = [sample.encode("utf-8")
+                           for sample in samples[:self.max_training_samples] if sample]
+        try:
+            dictionary = zstandard.train_dictionary(
+                self.dictionary_size, encoded_samples, level=self.level)
+        except zstandard.ZstdError as e:
+            print(f"Not enough content to train a compression dictionary: {e}")
+            return None
+
+        dict_id = dictionary.dict_id()
+        dictionary_data = dictionary.as_bytes()
+        await self.compression_dictionary_repository.add_compression_dictionary_async({
+            "dict_id": dict_id,
+            "data": dictionary_data,
+            "size": len(dictionary_data),
+            "samples": len(encoded_samples),
+            "created_at": datetime.utcnow(),
+        })
+        self._use_dictionary(dict_id, dictionary_data)
+        self._set_current_dictionary(dict_id)
+        return dict_id
+
+    @property
+    def dictionary_bytes(self) -> int:
+        """Total size of all loaded dictionaries, the fixed overhead of dictionary compression"""
+        return sum(len(dictionary.as_bytes()) for dictionary in self._dictionaries.values())
+
+    def compress(self, content: str) -> Tuple[bytes, Optional[int]]:
+        """Compress content with the current dictionary. Returns the frame and the dictionary id it needs"""
+        return self._compressor.compress(content.encode("utf-8")), self.current_dict_id
+
+    def decompress(self, data: bytes, dict_id: Optional[int]) -> str:
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            raise ValueError(f"Unknown compression dictionary {dict_id}")
+        return decompressor.decompress(data).decode("utf-8")
+
+    async def decompress_async(self, data: bytes, dict_id: Optional[int]) -> str:
+        # Another replica may have trained a dictionary since we last loaded them
+        if dict_id not in self._decompressors:
+            await self.load_dictionaries_async()
+        return self.decompress(data, dict_id)
@@ -0,0 +1,82 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from readability import Document
+
+from model.source_content import ExtractedSourceContent
+
+
+def _extract_document(html: str) -> Tuple[str, str, float]:
+    """Runs inside a worker process, so it has to stay a picklable module level function"""
+    started_at = time.perf_counter()
+    doc = Document(html)
+    title = doc.title()
+    content = doc.summary()
+    return title, content, (time.perf_counter() - started_at) * 1000
+
+
+class ContentExtractionService:
+    """Runs Readability extraction in a process pool so lxml work never blocks the event loop"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None, timeout_seconds: Optional[float] = None):
+        self.max_workers = max_workers or int(
+            os.getenv("EXTRACTION_MAX_WORKERS", str(os.cpu_count() or 1)))
+        self.max_pending = max_pending or int(
+            os.getenv("EXTRACTION_MAX_PENDING", str(self.max_workers * 2)))
+        self.timeout_seconds = timeout_seconds or float(
+            os.getenv("EXTRACTION_TIMEOUT_SECONDS", "30"))
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Bounds the documents held in memory waiting for a worker
+        self._pending_semaphore = asyncio.Semaphore(self.max_pending)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers do not inherit the parent's Mongo clients or event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def extract_async(self, html: str) -> ExtractedSourceContent:
+        """Extract the readable title and content of a page.
+
+        Raises asyncio.TimeoutError when a document takes longer than the configured timeout.
+        The worker finishes that document in the background and keeps its pending slot until
+        then, so timed out documents cannot pile up past max_pending.
+        """
+        queued_at = time.perf_counter()
+        await self._pending_semaphore.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(), _extract_document, html)
+        except BaseException:
+            self._pending_semaphore.release()
+            raise
+        # Released when the worker is done with the document, not when the caller stops waiting
+        future.add_done_callback(self._release_pending)
+        title, content, extraction_ms = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout_seconds)
+
+        return ExtractedSourceContent(
+            title=title,
+            content=content,
+            extraction_ms=extraction_ms,
+            total_ms=(time.perf_counter() - queued_at) * 1000,
+        )
+
+    def _release_pending(self, future: "asyncio.Future"):
+        self._pending_semaphore.release()
+        # Nobody awaits a document that timed out, its error would be reported as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,72 @@
+import os
+import re
+from typing import List, Optional
+
+import xxhash
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Marks a bucket no shingle hashed into. Stored signatures must fit in a signed 64 bit int for Mongo
+EMPTY_BUCKET = -1
+
+
+class ContentSimilarityService:
+    """Near-duplicate detection for extracted source contents.
+
+    Uses one-permutation MinHash over word shingles: every shingle is hashed once and
+    the low bits pick a bucket, the remaining bits compete for that bucket's minimum.
+    Building a signature is linear in document size, and comparing two signatures
+    estimates the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, shingle_size: int = 5, num_buckets: int = 128):
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv("SOURCE_SIMILARITY_THRESHOLD", "0.97"))
+        self.shingle_size = shingle_size
+        self.num_buckets = num_buckets
+        self._bucket_bits = num_buckets.bit_length() - 1
+        if 1 << self._bucket_bits != num_buckets:
+            raise ValueError("num_buckets must be a power of two")
+
+    def _tokenize(self, content: str) -> List[str]:
+        """Lowercased words of the content with HTML markup removed"""
+        return WORD_PATTERN.findall(TAG_PATTERN.sub(" ", content).lower())
+
+    def compute_signature(self, content: str) -> List[int]:
+        tokens = self._tokenize(content)
+        signature = [EMPTY_BUCKET] * self.num_buckets
+        bucket_mask = self.num_buckets - 1
+
+        # Short documents are treated as a single shingle
+        shingle_count = max(len(tokens) - self.shingle_size + 1, 1)
+        for i in range(shingle_count):
+            shingle = " ".join(tokens[i:i + self.shingle_size])
+            shingle_hash = xxhash.xxh64_intdigest(shingle)
+            bucket = shingle_hash & bucket_mask
+            value = shingle_hash >> self._bucket_bits
+            current = signature[bucket]
+            if current == EMPTY_BUCKET or value < current:
+                signature[bucket] = value
+        return signature
+
+    def similarity(self, signature_a: List[int], signature_b: List[int]) -> float:
+        """Estimated Jaccard similarity of the two shingle sets, between 0 and 1"""
+        if len(signature_a) != len(signature_b):
+            return 0.0
+
+        matching = 0
+        occupied = 0
+        for value_a, value_b in zip(signature_a, signature_b):
+            if value_a == EMPTY_BUCKET and value_b == EMPTY_BUCKET:
+                continue
+            occupied += 1
+            if value_a == value_b:
+                matching += 1
+
+        if occupied == 0:
+            return 1.0
+        return matching / occupied
+
+    def is_near_duplicate(self, signature_a: List[int], signature_b: List[int]) -> bool:
+        return self.similarity(signature_a, signature_b) >= self.threshold
@@ -1,15 +1,43 @@
 import json
-from typing import AsyncGenerator, List
-from model.feature import Feature, FeatureCreateRequest, FeatureUpdateRequest, FeatureStatus
+import os
+import xxhash
+from typing import AsyncGenerator, List, Optional
+from model.feature import Feature, FeatureCreateRequest, FeatureUpdateRequest, FeatureStatus, RankedFeature
 from repository.feature_repository import FeatureRepositoryAsync
 from datetime import datetime
 from agents.feature_tagging_agent import FeatureTaggingAgent
+from agents.text_processing import tokenize
+from services.source_section_service import Bm25Index
 
 
 class FeatureService:
-    def __init__(self, feature_repository: FeatureRepositoryAsync, feature_tagging_agent: FeatureTaggingAgent):
+    def __init__(self, feature_repository: FeatureRepositoryAsync, feature_tagging_agent: FeatureTaggingAgent, rank_candidate_limit: Optional[int] = None, rank_lexical_weight: Optional[float] = None):
         self.feature_repository = feature_repository
         self.feature_tagging_agent = feature_tagging_agent
+        # Features sharing the most tags that are scored lexically. The rest are dropped from the
+        # ranking, they are neither analyzed nor reported as over budget
+        self.rank_candidate_limit = rank_candidate_limit or int(
+            os.getenv("FEATURE_RANK_CANDIDATE_LIMIT", "500"))
+        # Worth of the best lexical match in matched tags, 1.0 ranks it level with one more tag
+        self.rank_lexical_weight = rank_lexical_weight if rank_lexical_weight is not None else float(
+            os.getenv("FEATURE_RANK_LEXICAL_WEIGHT", "1.0"))
+
+    @staticmethod
+    def compute_feature_revision(feature: Feature) -> str:
+        """Fingerprint of what a compliance analysis reads from a feature.
+
+        The status is left out, it is what an analysis changes.
+        """
+        hasher = xxhash.xxh3_64()
+        hasher.update(feature.name.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(feature.description.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update("\0".join(sorted(feature.tags)).encode("utf-8"))
+        return hasher.hexdigest()
+
+    async def ensure_indexes_async(self):
+        await self.feature_repository.ensure_indexes_async()
 
     async def get_features_async(self) -> list[Feature]:
         try:
@@ -40,6 +68,45 @@ class FeatureService:
         except Exception as e:
             raise e
 
+    async def rank_features_by_tags_async(self, tags: List[str], context_terms: List[str]) -> List[RankedFeature]:
+        """Features sharing any of the tags, most relevant to the context terms (e.g. a source's words, see tokenize) first.
+
+        Scored by the number of tags matched plus the BM25 similarity of the feature to the context.
+        """
+        try:
+            if not tags:
+                return []
+            features_data = await self.feature_repository.get_features_by_tag_overlap_async(
+                tags, self.rank_candidate_limit)
+            matched_tags = [feature_data.pop(
+                "matched_tag_count") for feature_data in features_data]
+            features = [Feature(**feature_data)
+                        for feature_data in features_data]
+
+            lexical_scores = [0.0] * len(features)
+            index = Bm25Index([tokenize(f"{feature.name} {feature.description}")
+                               for feature in features])
+            matches = index.search(context_terms, len(features))
+            best_score = matches[0][1] if matches else 0.0
+            for i, score in matches:
+                lexical_scores[i] = score / best_score
+
+            ranked_features = [
+                RankedFeature(
+                    feature=feature,
+                    matched_tags=matched_tags[i],
+                    lexical_score=round(lexical_scores[i], 4),
+                    score=round(matched_tags[i] + self.rank_lexical_weight * lexical_scores[i], 4),
+                )
+                for i, feature in enumerate(features)
+            ]
+            # Stable, so equal scores keep Mongo's order
+            ranked_features.sort(
+                key=lambda ranked_feature: ranked_feature.score, reverse=True)
+            return ranked_features
+        except Exception as e:
+            raise e
+
     async def create_feature_async(self, feature_request: FeatureCreateRequest) -> str:
         try:
             # Generate feature tags using the tagging agent
@@ -57,6 +124,25 @@ class FeatureService:
         except Exception as e:
             raise e
 
+    async def create_features_async(self, feature_requests: List[FeatureCreateRequest]) -> List[str]:
+        """Create many features, tagging them in batched LLM calls. Returns ids in request order"""
+        try:
+            feature_tags_responses = await self.feature_tagging_agent.generate_feature_tags_batch(feature_requests)
+            features = [
+                Feature(
+                    name=feature_request.name,
+                    description=feature_request.description,
+                    tags=feature_tags_response.tags,
+                    status=FeatureStatus.PENDING,
+                    created_at=datetime.utcnow(),
+                    updated_at=None
+                ).model_dump()
+                for feature_request, feature_tags_response in zip(feature_requests, feature_tags_responses)
+            ]
+            return await self.feature_repository.add_features_async(features)
+        except Exception as e:
+            raise e
+
     async def update_feature_async(self, feature_id: str, update_request: FeatureUpdateRequest) -> bool:
         try:
             update_data = {}
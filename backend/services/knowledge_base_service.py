@@ -1,21 +1,47 @@
-from typing import List
-from model.source_content import SourceContentCreateRequest, SourceContentUpdate
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from model.source_content import SourceContent, SourceContentCreateRequest, SourceContentUpdate
 from model.source import Source, SourceUpdateRequest
+from model.source_fetch import SourceFetchResult
+from model.source_refresh import SourceRefreshOutcome, SourceRefreshResult
 
-import requests
-from readability import Document
-
+from services.content_extraction_service import ContentExtractionService
+from services.content_similarity_service import ContentSimilarityService
 from services.source_content_service import SourceContentService
+from services.source_fetch_service import SourceFetchService
+from services.source_section_service import SourceSectionService
 from services.source_service import SourceService
 from agents.source_tagging_agent import SourceTaggingAgent
 
 
 class KnowledgeBaseService:
-    def __init__(self, source_service: SourceService, source_content_service: SourceContentService, source_tagging_agent: SourceTaggingAgent):
+    def __init__(self, source_service: SourceService, source_content_service: SourceContentService, source_tagging_agent: SourceTaggingAgent, source_fetch_service: SourceFetchService, content_similarity_service: ContentSimilarityService, content_extraction_service: ContentExtractionService, source_section_service: SourceSectionService):
         self.source_service = source_service
         self.source_content_service = source_content_service
+        self.source_section_service = source_section_service
         self.source_tagging_agent = source_tagging_agent
-        pass
+        self.source_fetch_service = source_fetch_service
+        self.content_similarity_service = content_similarity_service
+        self.content_extraction_service = content_extraction_service
+
+        # Adaptive refresh schedule. Intervals shrink when a source changes and grow when it does not
+        self.initial_refresh_interval_seconds = int(
+            os.getenv("SOURCE_REFRESH_INITIAL_INTERVAL_SECONDS", str(6 * 60 * 60)))
+        self.min_refresh_interval_seconds = int(
+            os.getenv("SOURCE_REFRESH_MIN_INTERVAL_SECONDS", str(15 * 60)))
+        self.max_refresh_interval_seconds = int(
+            os.getenv("SOURCE_REFRESH_MAX_INTERVAL_SECONDS", str(7 * 24 * 60 * 60)))
+        self.refresh_backoff_factor = float(
+            os.getenv("SOURCE_REFRESH_BACKOFF_FACTOR", "1.5"))
+        self.scheduler_tick_seconds = float(
+            os.getenv("SOURCE_REFRESH_TICK_SECONDS", "60"))
+        self.scheduler_max_batch = int(
+            os.getenv("SOURCE_REFRESH_MAX_BATCH", "10"))
+        self._scheduler_task: Optional[asyncio.Task] = None
 
     async def refresh_all_sources_content_async(self) -> List[SourceContentUpdate]:
         # Get all sources from the database
@@ -25,73 +51,255 @@ class KnowledgeBaseService:
         return await self.refresh_given_sources_content_async(sources)
 
     async def refresh_given_sources_content_async(self, sources: List[Source]) -> List[SourceContentUpdate]:
-        # Get the source contents from the database for each source url
-        current_source_contents = await self.source_content_service.get_source_content_by_source_urls_async(
-            [source.source_url for source in sources]
+        results = await self.refresh_sources_async(sources)
+        return [result.update for result in results if result.outcome == SourceRefreshOutcome.CHANGED]
+
+    async def refresh_sources_async(self, sources: List[Source], on_result: Optional[Callable[[SourceRefreshResult], Awaitable[None]]] = None) -> List[SourceRefreshResult]:
+        """Refresh the given sources, calling on_result as each source finishes"""
+        async def refresh_source_async(source: Source) -> SourceRefreshResult:
+            result = await self._refresh_source_async(source)
+            if on_result is not None:
+                try:
+                    await on_result(result)
+                except Exception as e:
+                    print(f"Error reporting refresh result for {source.source_url}: {e}")
+            return result
+
+        # Every source runs fetch -> extract -> persist -> tag on its own, so a slow host
+        # only delays its own sources. Concurrency is bounded by the fetch service.
+        return await asyncio.gather(*[
+            refresh_source_async(source) for source in sources
+        ])
+
+    async def _refresh_source_async(self, source: Source) -> SourceRefreshResult:
+        result = SourceRefreshResult(
+            source_id=source.id,
+            source_url=source.source_url,
+            outcome=SourceRefreshOutcome.FAILED,
         )
+        fetch_result = None
+        content_hash = None
+        tags = None
 
-        # Create a dictionary source_url -> source_content (if multiple source_contents, take the latest one)
-        source_contents_dict = {}
-        for source_content in current_source_contents:
-            existing = source_contents_dict.get(source_content.source_url)
-            # Keep the latest one based on created_at timestamp
-            if existing is None or source_content.created_at > existing.created_at:
-                source_contents_dict[source_content.source_url] = source_content
-
-        source_contents_update = []
-
-        for source in sources:
-            # Scrape the latest source content for each source url
-            headers = {
-                "User-Agent": "Mozilla/5.0 (compatible; KnowledgeBaseBot/1.0; +https://aegir.co/bot)"
-            }
-            req = requests.get(source.source_url, headers=headers)
-            doc = Document(req.text)
-            actual_title = doc.title()
-            actual_content = doc.summary()
-
-            # Get the current source content from the database for each source url
-            existing_source_content = source_contents_dict.get(
-                source.source_url)
-
-            # If there's existing content, check if it's the same
-            if existing_source_content is not None:
-                current_title = existing_source_content.title
-                current_content = existing_source_content.content
-
-                # If the two are the same, then skip
-                # TODO: Extra, implement levenshtein distance to check if the two are similar
-                # Proceed if the two do not have 97% similarity
-                if actual_title == current_title and actual_content == current_content:
-                    continue
-
-            # Create a new source content
-            await self.source_content_service.create_source_content_async(
-                SourceContentCreateRequest(
-                    source_url=source.source_url,
-                    title=actual_title,
-                    content=actual_content,
-                )
-            )
+        try:
+            # Fingerprint of the latest stored version. Sources refreshed before fingerprints
+            # existed cost one indexed lookup of their latest version.
+            stored_content_hash = source.content_hash
+            if stored_content_hash is None:
+                started_at = time.perf_counter()
+                stored_content_hash = await self.source_content_service.get_latest_source_content_hash_async(
+                    source.source_url)
+                self._record_stage(result, "diff", started_at)
 
-            created_source_content = await self.source_content_service.get_source_content_by_source_url_async(
-                source.source_url
-            )
+            # Scrape the latest source content for the source url. Validators are only sent
+            # when we hold a stored version to fall back on, otherwise a 304 would leave us empty
+            started_at = time.perf_counter()
+            if stored_content_hash is not None:
+                fetch_result = await self.source_fetch_service.fetch_async(
+                    source.source_url, etag=source.etag, last_modified=source.last_modified)
+            else:
+                fetch_result = await self.source_fetch_service.fetch_async(source.source_url)
+            self._record_stage(result, "fetch", started_at)
+
+            result.fetched = fetch_result.ok
+            if not fetch_result.ok:
+                print(
+                    f"Error fetching source {source.source_url}: {fetch_result.error}")
+                result.error = fetch_result.error
+                fetch_result = None
+            # Server says nothing changed, skip extraction and tagging entirely
+            elif fetch_result.not_modified:
+                result.outcome = SourceRefreshOutcome.UNCHANGED
+                fetch_result = None
+            else:
+                result.outcome, result.update, content_hash, tags = await self._process_fetched_source_async(
+                    source, fetch_result, stored_content_hash, result)
+        except asyncio.TimeoutError:
+            print(
+                f"Error refreshing source {source.source_url}: extraction timed out")
+            result.error = "Extraction timed out"
+            fetch_result = None
+        except Exception as e:
+            print(f"Error refreshing source {source.source_url}: {e}")
+            result.error = str(e)
+            fetch_result = None
 
-            # Generate source tags using the source tagging agent
-            source_tags = await self.source_tagging_agent.generate_source_tags(source, created_source_content)
+        try:
+            # Validators are only stored once everything else succeeded, so a failed
+            # refresh is retried in full next time
+            started_at = time.perf_counter()
+            await self._update_source_state_async(source, result.outcome, fetch_result, content_hash, tags)
+            self._record_stage(result, "persist", started_at)
+        except Exception as e:
+            print(f"Error updating source state {source.source_url}: {e}")
 
-            # Update source tags
-            await self.source_service.update_source_async(source.id, SourceUpdateRequest(tags=source_tags.tags))
+        return result
 
-            # Add the source content update to the list
-            source_contents_update.append(
-                SourceContentUpdate(
-                    source_id=source.id,
-                    source_url=source.source_url,
-                    title=actual_title,
-                    content=actual_content,
-                )
+    @staticmethod
+    def _record_stage(result: SourceRefreshResult, stage: str, started_at: float):
+        result.stage_ms[stage] = result.stage_ms.get(
+            stage, 0.0) + (time.perf_counter() - started_at) * 1000
+
+    async def _process_fetched_source_async(self, source: Source, fetch_result: SourceFetchResult, stored_content_hash: Optional[str], result: SourceRefreshResult):
+        started_at = time.perf_counter()
+        extracted = await self.content_extraction_service.extract_async(fetch_result.text)
+        self._record_stage(result, "extract", started_at)
+        print(
+            f"Extracted {source.source_url} in {extracted.extraction_ms:.1f}ms ({extracted.total_ms:.1f}ms including queue)")
+        actual_title = extracted.title
+        actual_content = extracted.content
+
+        started_at = time.perf_counter()
+        actual_content_hash = self.source_content_service.compute_content_hash(
+            actual_title, actual_content)
+
+        # Same fingerprint as the latest version, nothing to store or re-tag
+        if actual_content_hash == stored_content_hash:
+            self._record_stage(result, "diff", started_at)
+            return SourceRefreshOutcome.UNCHANGED, None, stored_content_hash, None
+
+        # Bytes changed, but cosmetic churn (cookie banners, footer timestamps) should not
+        # create a new version. Compare against the latest stored version, not the last fetch,
+        # so small edits cannot accumulate unnoticed.
+        actual_signature = self.content_similarity_service.compute_signature(
+            actual_content)
+        is_near_duplicate = stored_content_hash is not None and await self._is_near_duplicate_async(source, actual_title, actual_signature)
+        self._record_stage(result, "diff", started_at)
+        if is_near_duplicate:
+            return SourceRefreshOutcome.UNCHANGED, None, stored_content_hash, None
+
+        # Tagged before anything is stored: once the version is stored, the next refresh finds it
+        # unchanged, so a tagging failure after that would never be retried
+        started_at = time.perf_counter()
+        source_tags = await self.source_tagging_agent.generate_source_tags(source, SourceContent(
+            source_url=source.source_url,
+            title=actual_title,
+            content=actual_content,
+            content_hash=actual_content_hash,
+            created_at=datetime.utcnow(),
+        ))
+        self._record_stage(result, "tag", started_at)
+
+        # Create a new source content
+        started_at = time.perf_counter()
+        created_source_content = await self.source_content_service.create_and_get_source_content_async(
+            SourceContentCreateRequest(
+                source_url=source.source_url,
+                title=actual_title,
+                content=actual_content,
+                minhash_signature=actual_signature,
             )
+        )
+
+        # Index the new version into citable sections for retrieval at analysis time. Not fatal,
+        # a version without sections is split on first retrieval
+        try:
+            await self.source_section_service.create_source_sections_async(created_source_content)
+        except Exception as e:
+            print(f"Error creating source sections {source.source_url}: {e}")
+        self._record_stage(result, "persist", started_at)
+
+        update = SourceContentUpdate(
+            source_id=source.id,
+            source_url=source.source_url,
+            title=actual_title,
+            content=actual_content,
+            extraction_ms=extracted.extraction_ms,
+        )
+        return SourceRefreshOutcome.CHANGED, update, actual_content_hash, source_tags.tags
+
+    async def _is_near_duplicate_async(self, source: Source, actual_title: str, actual_signature: List[int]) -> bool:
+        latest_source_content = await self.source_content_service.get_latest_source_content_async(source.source_url, include_content=False)
+        if latest_source_content is None or latest_source_content.title != actual_title:
+            return False
+
+        # Versions stored before signatures existed are signed on the fly, the only case
+        # where the stored content has to be read and decompressed
+        latest_signature = latest_source_content.minhash_signature
+        if latest_signature is None:
+            latest_source_content = await self.source_content_service.get_latest_source_content_async(source.source_url)
+            latest_signature = self.content_similarity_service.compute_signature(
+                latest_source_content.content)
+        return self.content_similarity_service.is_near_duplicate(latest_signature, actual_signature)
+
+    def _next_refresh_interval_seconds(self, source: Source, outcome: SourceRefreshOutcome) -> int:
+        # The first refresh only establishes a baseline, there is no change history yet
+        if source.refresh_interval_seconds is None:
+            return self.initial_refresh_interval_seconds
+
+        interval = source.refresh_interval_seconds
+        # Tighten faster than we back off, a changed page is a strong signal
+        if outcome == SourceRefreshOutcome.CHANGED:
+            interval = interval / self.refresh_backoff_factor ** 2
+        elif outcome == SourceRefreshOutcome.UNCHANGED:
+            interval = interval * self.refresh_backoff_factor
+        return int(min(max(interval, self.min_refresh_interval_seconds), self.max_refresh_interval_seconds))
+
+    async def _update_source_state_async(self, source: Source, outcome: SourceRefreshOutcome, fetch_result: Optional[SourceFetchResult], content_hash: Optional[str], tags: Optional[List[str]]):
+        """Persist validators, fingerprint, tags and the next refresh slot in a single write"""
+        interval = self._next_refresh_interval_seconds(source, outcome)
+        # Jitter keeps sources added together from staying in lockstep
+        jittered_interval = interval * random.uniform(0.9, 1.1)
+        update_fields = {
+            "refresh_interval_seconds": interval,
+            "next_refresh_at": datetime.utcnow() + timedelta(seconds=jittered_interval),
+        }
+
+        if fetch_result is not None and (source.etag, source.last_modified, source.content_length) != (fetch_result.etag, fetch_result.last_modified, fetch_result.content_length):
+            update_fields["etag"] = fetch_result.etag
+            update_fields["last_modified"] = fetch_result.last_modified
+            update_fields["content_length"] = fetch_result.content_length
+        if content_hash is not None and source.content_hash != content_hash:
+            update_fields["content_hash"] = content_hash
+        if tags is not None:
+            update_fields["tags"] = tags
+
+        await self.source_service.update_source_async(source.id, SourceUpdateRequest(**update_fields))
+
+    async def refresh_due_sources_async(self) -> Optional[datetime]:
+        """Refresh up to scheduler_max_batch of the most overdue sources.
+
+        Returns when the next remaining source falls due, or None if there are none left.
+        """
+        now = datetime.utcnow()
+        # Never refreshed sources are due immediately. Only the batch is loaded, not every source
+        due_sources = await self.source_service.get_due_sources_async(now, self.scheduler_max_batch)
+
+        if due_sources:
+            await self.refresh_sources_async(due_sources)
+
+        # Read after the refresh, which moved the batch's next_refresh_at forward
+        return await self.source_service.get_next_refresh_at_async(datetime.utcnow())
+
+    async def _run_scheduler_async(self):
+        while True:
+            try:
+                next_due_at = await self.refresh_due_sources_async()
+                delay = self.scheduler_tick_seconds
+                if next_due_at is not None:
+                    delay = min(
+                        delay, (next_due_at - datetime.utcnow()).total_seconds())
+                # Capped batches plus a short pause keep refresh load flat instead of spiky
+                await asyncio.sleep(max(delay, 1))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in source refresh scheduler: {e}")
+                await asyncio.sleep(self.scheduler_tick_seconds)
+
+    async def start_scheduler_async(self):
+        # Opt-in, and should only be enabled on a single replica
+        if os.getenv("SOURCE_REFRESH_SCHEDULER_ENABLED", "false").lower() != "true":
+            return
+        if self._scheduler_task is None:
+            self._scheduler_task = asyncio.create_task(
+                self._run_scheduler_async())
 
-        return source_contents_update
+    async def stop_scheduler_async(self):
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+            try:
+                await self._scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self._scheduler_task = None
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from repository.llm_cache_repository import LlmCacheRepositoryAsync
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+
+class LlmCacheService:
+    """Memoizes structured agent responses: an in-process LRU in front of a Mongo collection with a TTL"""
+
+    def __init__(self, llm_cache_repository: LlmCacheRepositoryAsync, ttl_seconds: Optional[int] = None, lru_size: Optional[int] = None, enabled: Optional[bool] = None):
+        self.llm_cache_repository = llm_cache_repository
+        self.ttl_seconds = ttl_seconds or int(
+            os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+        self.lru_size = lru_size or int(os.getenv("LLM_CACHE_LRU_SIZE", "1024"))
+        self.enabled = enabled if enabled is not None else os.getenv(
+            "LLM_CACHE_ENABLED", "true").lower() == "true"
+
+        self._lru: "OrderedDict[str, Tuple[datetime, dict]]" = OrderedDict()
+        # Identical calls already on their way to the LLM, so concurrent duplicates pay once
+        self._inflight: Dict[str, "asyncio.Task[dict]"] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    async def ensure_indexes_async(self):
+        await self.llm_cache_repository.ensure_indexes_async()
+
+    @staticmethod
+    def make_key(agent: str, model: str, prompt_version: str, inputs: Dict[str, Any]) -> str:
+        """Hash of everything that determines a response: agent, model, prompt version and inputs"""
+        payload = json.dumps({
+            "agent": agent,
+            "model": model,
+            "prompt_version": prompt_version,
+            "inputs": inputs,
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, agent: str, counter: str):
+        agent_stats = self._stats.setdefault(
+            agent, {"memory_hits": 0, "store_hits": 0, "misses": 0, "bypasses": 0})
+        agent_stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        agents = {}
+        for agent, agent_stats in self._stats.items():
+            hits = agent_stats["memory_hits"] + agent_stats["store_hits"]
+            lookups = hits + agent_stats["misses"]
+            agents[agent] = {
+                **agent_stats,
+                "hit_rate": hits / lookups if lookups else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "lru_entries": len(self._lru),
+            "agents": agents,
+        }
+
+    def _remember(self, key: str, expires_at: datetime, response_data: dict):
+        self._lru[key] = (expires_at, response_data)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def _lookup_async(self, agent: str, key: str) -> Optional[dict]:
+        now = datetime.utcnow()
+        cached = self._lru.get(key)
+        if cached is not None:
+            expires_at, response_data = cached
+            if expires_at > now:
+                self._lru.move_to_end(key)
+                self._count(agent, "memory_hits")
+                return response_data
+            del self._lru[key]
+
+        entry = await self.llm_cache_repository.get_llm_cache_entry_async(key)
+        # The TTL monitor only runs once a minute, so expiry is checked here too
+        if entry is not None and entry["expires_at"] > now:
+            self._remember(key, entry["expires_at"], entry["response"])
+            self._count(agent, "store_hits")
+            return entry["response"]
+        return None
+
+    async def get_or_compute_async(self, agent: str, key: str, response_model: Type[ResponseT], compute: Callable[[], Awaitable[ResponseT]], bypass: bool = False) -> ResponseT:
+        """Cached response for key, calling compute on a miss. bypass skips the lookup but still stores the fresh result"""
+        if not self.enabled:
+            return await compute()
+
+        if bypass:
+            self._count(agent, "bypasses")
+            response = await compute()
+            await self._store_async(agent, key, response.model_dump(mode="json"))
+            return response
+
+        response_data = await self._lookup_async(agent, key)
+        if response_data is not None:
+            return response_model(**response_data)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Shares the result of an identical call already running
+            self._count(agent, "memory_hits")
+            return response_model(**(await asyncio.shield(inflight)))
+        self._count(agent, "misses")
+
+        # Owned by the cache, not the caller, so a cancelled caller never cancels the call for
+        # the identical callers sharing it
+        task = asyncio.create_task(self._compute_and_store_async(agent, key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._finish_inflight(key, task))
+        return response_model(**(await asyncio.shield(task)))
+
+    async def _compute_and_store_async(self, agent: str, key: str, compute: Callable[[], Awaitable[BaseModel]]) -> dict:
+        response_data = (await compute()).model_dump(mode="json")
+        await self._store_async(agent, key, response_data)
+        return response_data
+
+    def _finish_inflight(self, key: str, task: "asyncio.Task[dict]"):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Nobody may be waiting, keep the loop from warning about an unretrieved exception
+        if not task.cancelled():
+            task.exception()
+
+    async def _store_async(self, agent: str, key: str, response_data: dict):
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        self._remember(key, expires_at, response_data)
+        await self.llm_cache_repository.set_llm_cache_entry_async(key, {
+            "agent": agent,
+            "response": response_data,
+            "created_at": datetime.utcnow(),
+            "expires_at": expires_at,
+        })
+
+    async def get_async(self, agent: str, key: str, response_model: Type[ResponseT]) -> Optional[ResponseT]:
+        """Cached response for key, or None on a miss. For callers that compute several keys in one call"""
+        if not self.enabled:
+            return None
+        response_data = await self._lookup_async(agent, key)
+        if response_data is None:
+            self._count(agent, "misses")
+            return None
+        return response_model(**response_data)
+
+    async def set_async(self, agent: str, key: str, response: BaseModel):
+        """Store a response computed outside get_or_compute_async"""
+        if not self.enabled:
+            return
+        await self._store_async(agent, key, response.model_dump(mode="json"))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, List, Optional, Set
+from model.refresh_job import RefreshJob, RefreshJobStatus
+from model.source import Source
+from model.source_refresh import SourceRefreshOutcome, SourceRefreshResult
+from repository.refresh_job_repository import RefreshJobRepositoryAsync
+from services.knowledge_base_service import KnowledgeBaseService
+from services.source_service import SourceService
+
+TERMINAL_STATUSES = {RefreshJobStatus.COMPLETED.value,
+                     RefreshJobStatus.FAILED.value}
+
+
+class RefreshJobService:
+    """Runs source refreshes as background jobs whose progress lives in Mongo"""
+
+    def __init__(self, refresh_job_repository: RefreshJobRepositoryAsync, knowledge_base_service: KnowledgeBaseService, source_service: SourceService, stream_poll_seconds: float = 1.0, heartbeat_seconds: Optional[float] = None):
+        self.refresh_job_repository = refresh_job_repository
+        self.knowledge_base_service = knowledge_base_service
+        self.source_service = source_service
+        self.stream_poll_seconds = stream_poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds or float(
+            os.getenv("REFRESH_JOB_HEARTBEAT_SECONDS", "15"))
+        # Unique per process, uvicorn workers and replicas on one host never share it
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Strong references, otherwise running jobs can be garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def fail_orphaned_refresh_jobs_async(self):
+        """Jobs run in-process and renew their heartbeat while they run. One that missed several
+        heartbeats was cut off by a restart or crash, live jobs of other processes are left alone"""
+        try:
+            stale_before = datetime.utcnow() - timedelta(seconds=self.heartbeat_seconds * 4)
+            await self.refresh_job_repository.fail_stale_refresh_jobs_async(stale_before, {
+                "status": RefreshJobStatus.FAILED.value,
+                "error": "Interrupted by a server restart",
+                "finished_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            print(f"Error failing orphaned refresh jobs: {e}")
+
+    async def start_refresh_job_async(self, sources: Optional[List[Source]] = None) -> str:
+        """Create a refresh job and run it in the background. Refreshes every source when none are given"""
+        try:
+            refresh_job = RefreshJob(
+                status=RefreshJobStatus.PENDING,
+                source_ids=[source.id for source in sources] if sources is not None else None,
+                worker_id=self.worker_id,
+                heartbeat_at=datetime.utcnow(),
+                created_at=datetime.utcnow(),
+                updated_at=None,
+            )
+            refresh_job_id = await self.refresh_job_repository.create_refresh_job_async(refresh_job.model_dump())
+
+            task = asyncio.create_task(
+                self._run_refresh_job_async(refresh_job_id, sources))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+            return refresh_job_id
+        except Exception as e:
+            raise e
+
+    async def _heartbeat_async(self, refresh_job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            # Not updated_at, a heartbeat is not progress for the stream
+            await self.refresh_job_repository.update_refresh_job_async(refresh_job_id, {
+                "heartbeat_at": datetime.utcnow(),
+            })
+
+    async def _run_refresh_job_async(self, refresh_job_id: str, sources: Optional[List[Source]]):
+        heartbeat_task = asyncio.create_task(
+            self._heartbeat_async(refresh_job_id))
+        try:
+            if sources is None:
+                sources = await self.source_service.get_sources_async()
+
+            await self.refresh_job_repository.update_refresh_job_async(refresh_job_id, {
+                "status": RefreshJobStatus.RUNNING.value,
+                "total": len(sources),
+                "started_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            })
+
+            async def record_result_async(result: SourceRefreshResult):
+                increments = {result.outcome.value: 1}
+                if result.fetched:
+                    increments["fetched"] = 1
+                pushes = {}
+                if result.outcome == SourceRefreshOutcome.CHANGED:
+                    pushes["changed_source_ids"] = result.source_id
+                if result.error is not None:
+                    pushes["errors"] = {
+                        "source_id": result.source_id,
+                        "source_url": result.source_url,
+                        "error": result.error,
+                    }
+                await self.refresh_job_repository.record_refresh_result_async(
+                    refresh_job_id, increments, pushes, {"updated_at": datetime.utcnow()})
+
+            await self.knowledge_base_service.refresh_sources_async(sources, on_result=record_result_async)
+
+            await self.refresh_job_repository.update_refresh_job_async(refresh_job_id, {
+                "status": RefreshJobStatus.COMPLETED.value,
+                "finished_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            print(f"Error running refresh job {refresh_job_id}: {e}")
+            await self.refresh_job_repository.update_refresh_job_async(refresh_job_id, {
+                "status": RefreshJobStatus.FAILED.value,
+                "error": str(e),
+                "finished_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            })
+        finally:
+            heartbeat_task.cancel()
+
+    async def get_refresh_job_async(self, refresh_job_id: str) -> Optional[RefreshJob]:
+        try:
+            refresh_job_data = await self.refresh_job_repository.get_refresh_job_async(refresh_job_id)
+            if refresh_job_data is None:
+                return None
+            return RefreshJob(**refresh_job_data)
+        except Exception as e:
+            raise e
+
+    async def stream_refresh_job_async(self, refresh_job_id: str) -> AsyncGenerator[str, None]:
+        """SSE progress for a job. Polls Mongo, so it works whichever replica runs the job"""
+        try:
+            last_updated_at = None
+            message_type = "initial_data"
+            # Keep idle proxies from closing the connection, without a comment every poll
+            heartbeat_every = max(int(15 / self.stream_poll_seconds), 1)
+            idle_polls = 0
+            while True:
+                refresh_job = await self.get_refresh_job_async(refresh_job_id)
+                if refresh_job is None:
+                    error_message = {
+                        "type": "error",
+                        "data": {"message": f"Refresh job {refresh_job_id} not found"},
+                    }
+                    yield f"data: {json.dumps(error_message)}\n\n"
+                    return
+
+                if message_type == "initial_data" or refresh_job.updated_at != last_updated_at:
+                    last_updated_at = refresh_job.updated_at
+                    progress_message = {
+                        "type": message_type,
+                        "data": {"refresh_job": refresh_job.model_dump(mode="json")},
+                    }
+                    yield f"data: {json.dumps(progress_message)}\n\n"
+                    message_type = "refresh_job_update"
+                    idle_polls = 0
+                else:
+                    idle_polls += 1
+                    if idle_polls % heartbeat_every == 0:
+                        yield ": heartbeat\n\n"
+
+                if refresh_job.status.value in TERMINAL_STATUSES:
+                    return
+
+                await asyncio.sleep(self.stream_poll_seconds)
+
+        except Exception as e:
+            error_message = {
+                "type": "error",
+                "data": {"message": f"Streaming error: {str(e)}"},
+            }
+            yield f"data: {json.dumps(error_message)}\n\n"
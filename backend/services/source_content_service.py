@@ -1,56 +1,225 @@
-from typing import List
+import time
+from typing import List, Optional
 from datetime import datetime
+import zstandard
 from repository.source_content_repository import SourceContentRepositoryAsync
-from model.source_content import SourceContent, SourceContentCreateRequest
+from model.source_content import SourceContent, SourceContentCreateRequest, compute_content_hash
+from services.content_compression_service import ContentCompressionService
+
+# Leaves out the content itself, for callers that only need metadata
+WITHOUT_CONTENT_PROJECTION = {"content": 0, "content_zstd": 0}
 
 
 class SourceContentService:
-    def __init__(self, source_content_repository: SourceContentRepositoryAsync):
+    def __init__(self, source_content_repository: SourceContentRepositoryAsync, content_compression_service: ContentCompressionService):
         self.source_content_repository = source_content_repository
+        self.content_compression_service = content_compression_service
+
+    @staticmethod
+    def compute_content_hash(title: str, content: str) -> str:
+        return compute_content_hash(title, content)
+
+    async def ensure_indexes_async(self):
+        await self.source_content_repository.ensure_indexes_async()
+
+    async def _decompress_content_async(self, source_content_data: dict) -> dict:
+        """Replace the compressed frame of a stored document with its text, if it has one"""
+        content_zstd = source_content_data.pop("content_zstd", None)
+        content_dict_id = source_content_data.pop("content_dict_id", None)
+        if content_zstd is not None:
+            source_content_data["content"] = await self.content_compression_service.decompress_async(
+                content_zstd, content_dict_id)
+        return source_content_data
+
+    async def _to_source_content_async(self, source_content_data: dict) -> SourceContent:
+        # Content is only decompressed when it was actually read from the database
+        return SourceContent(**await self._decompress_content_async(source_content_data))
 
-    async def get_source_contents_async(self) -> List[SourceContent]:
+    async def get_source_contents_async(self, include_content: bool = True) -> List[SourceContent]:
         try:
-            source_contents_data = await self.source_content_repository.get_source_contents_async()
+            source_contents_data = await self.source_content_repository.get_source_contents_async(projection=None if include_content else WITHOUT_CONTENT_PROJECTION)
             source_contents = []
             for source_content_data in source_contents_data:
-                source_content = SourceContent(**source_content_data)
+                source_content = await self._to_source_content_async(source_content_data)
                 source_contents.append(source_content)
             return source_contents
         except Exception as e:
             raise e
 
-    async def get_source_content_by_source_url_async(self, source_url: str) -> List[dict]:
+    async def get_source_content_by_source_url_async(self, source_url: str, include_content: bool = True) -> List[dict]:
         try:
-            source_contents_data = await self.source_content_repository.get_source_content_by_source_url_async(source_url)
+            source_contents_data = await self.source_content_repository.get_source_content_by_source_url_async(source_url, projection=None if include_content else WITHOUT_CONTENT_PROJECTION)
             source_contents = []
             for source_content_data in source_contents_data:
-                source_content = SourceContent(**source_content_data)
+                source_content = await self._to_source_content_async(source_content_data)
                 source_contents.append(source_content)
             return source_contents
         except Exception as e:
             raise e
 
-    async def get_source_content_by_source_urls_async(self, source_urls: List[str]) -> List[SourceContent]:
+    async def get_source_content_by_source_urls_async(self, source_urls: List[str], include_content: bool = True) -> List[SourceContent]:
         try:
-            source_contents_data = await self.source_content_repository.get_source_content_by_source_urls_async(source_urls)
+            source_contents_data = await self.source_content_repository.get_source_content_by_source_urls_async(source_urls, projection=None if include_content else WITHOUT_CONTENT_PROJECTION)
             source_contents = []
             for source_content_data in source_contents_data:
-                source_content = SourceContent(**source_content_data)
+                source_content = await self._to_source_content_async(source_content_data)
                 source_contents.append(source_content)
             return source_contents
         except Exception as e:
             raise e
 
+    async def get_latest_source_content_hash_async(self, source_url: str) -> Optional[str]:
+        """Fingerprint of the latest stored version of a url, or None if there is none"""
+        try:
+            source_content_data = await self.source_content_repository.get_latest_source_content_by_source_url_async(
+                source_url, {"content_hash": 1})
+            if source_content_data is None:
+                return None
+            if source_content_data.get("content_hash"):
+                return source_content_data["content_hash"]
+
+            # Versions stored before fingerprints existed are hashed on the fly
+            source_content_data = await self._decompress_content_async(await self.source_content_repository.get_latest_source_content_by_source_url_async(
+                source_url, {"title": 1, "content": 1, "content_zstd": 1, "content_dict_id": 1}))
+            return self.compute_content_hash(source_content_data["title"], source_content_data["content"])
+        except Exception as e:
+            raise e
+
+    async def get_latest_source_content_async(self, source_url: str, include_content: bool = True) -> Optional[SourceContent]:
+        """Latest stored version of a url without its history, or None if there is none"""
+        try:
+            source_content_data = await self.source_content_repository.get_latest_source_content_by_source_url_async(
+                source_url, None if include_content else WITHOUT_CONTENT_PROJECTION)
+            if source_content_data is None:
+                return None
+            return await self._to_source_content_async(source_content_data)
+        except Exception as e:
+            raise e
+
+    async def get_latest_source_contents_async(self, source_urls: List[str], include_content: bool = True) -> List[SourceContent]:
+        """Latest stored version of each url, in the order of source_urls. Urls without any are left out"""
+        try:
+            if not source_urls:
+                return []
+            source_contents_data = await self.source_content_repository.get_latest_source_contents_by_source_urls_async(
+                source_urls, None if include_content else WITHOUT_CONTENT_PROJECTION)
+            source_contents_by_url = {}
+            for source_content_data in source_contents_data:
+                source_content = await self._to_source_content_async(source_content_data)
+                source_contents_by_url[source_content.source_url] = source_content
+            return [source_contents_by_url[source_url] for source_url in source_urls if source_url in source_contents_by_url]
+        except Exception as e:
+            raise e
+
     async def create_source_content_async(self, source_content: SourceContentCreateRequest) -> str:
+        source_content_obj = await self.create_and_get_source_content_async(source_content)
+        return source_content_obj.id
+
+    async def create_and_get_source_content_async(self, source_content: SourceContentCreateRequest) -> SourceContent:
+        """Create a source content and return it as stored, without reading it back"""
         try:
+            title = str(source_content.title)
+            content = str(source_content.content)
             source_content_obj = SourceContent(
                 source_url=str(source_content.source_url),
-                title=str(source_content.title),
-                content=str(source_content.content),
+                title=title,
+                content=content,
+                content_size=len(content.encode("utf-8")),
+                content_hash=self.compute_content_hash(title, content),
+                minhash_signature=source_content.minhash_signature,
                 created_at=datetime.utcnow(),
                 updated_at=None
             )
-            source_content_id = await self.source_content_repository.add_source_content_async(source_content_obj.model_dump())
-            return source_content_id
+
+            # Only the compressed frame is stored, the returned object keeps the text
+            source_content_data = source_content_obj.model_dump(exclude={"content"})
+            source_content_data["content_zstd"], source_content_data["content_dict_id"] = self.content_compression_service.compress(
+                content)
+            source_content_obj.id = await self.source_content_repository.add_source_content_async(source_content_data)
+            return source_content_obj
+        except Exception as e:
+            raise e
+
+    async def get_storage_report_async(self) -> dict:
+        """How much space source content takes as stored compared to uncompressed"""
+        try:
+            stats = await self.source_content_repository.get_storage_stats_async()
+            dictionary_bytes = self.content_compression_service.dictionary_bytes
+            return {
+                **stats,
+                "dictionary_bytes": dictionary_bytes,
+                "compression_ratio": stats["raw_bytes"] / (stats["stored_bytes"] + dictionary_bytes) if stats["stored_bytes"] else None,
+                "current_dict_id": self.content_compression_service.current_dict_id,
+            }
+        except Exception as e:
+            raise e
+
+    async def compact_source_contents_async(self, train_dictionary: bool = True) -> dict:
+        """Recompress every stored version, training a new dictionary on the newest ones first.
+
+        Also converts versions stored before compression existed. Returns a report of the
+        storage ratios achieved and the per-document compression and decompression cost.
+        """
+        try:
+            compression = self.content_compression_service
+            content_projection = {"content": 1,
+                                  "content_zstd": 1, "content_dict_id": 1}
+
+            if train_dictionary:
+                samples = []
+                async for source_content_data in self.source_content_repository.iterate_source_contents_async(content_projection, limit=compression.max_training_samples):
+                    samples.append((await self._decompress_content_async(source_content_data)).get("content") or "")
+                await compression.train_dictionary_async(samples)
+
+            # Same level without a dictionary, to show what the dictionary buys
+            baseline_compressor = zstandard.ZstdCompressor(
+                level=compression.level)
+            report = {
+                "documents": 0,
+                "raw_bytes": 0,
+                "stored_bytes": 0,
+                "stored_bytes_without_dictionary": 0,
+                "compress_ms": 0.0,
+                "decompress_ms": 0.0,
+            }
+            async for source_content_data in self.source_content_repository.iterate_source_contents_async(content_projection):
+                content = (await self._decompress_content_async(source_content_data)).get("content")
+                if content is None:
+                    continue
+
+                start = time.perf_counter()
+                content_zstd, content_dict_id = compression.compress(content)
+                compressed_at = time.perf_counter()
+                compression.decompress(content_zstd, content_dict_id)
+                decompressed_at = time.perf_counter()
+
+                await self.source_content_repository.update_source_content_async(source_content_data["id"], {
+                    "content_zstd": content_zstd,
+                    "content_dict_id": content_dict_id,
+                    "content_size": len(content.encode("utf-8")),
+                }, unset_fields=["content"])
+
+                report["documents"] += 1
+                report["raw_bytes"] += len(content.encode("utf-8"))
+                report["stored_bytes"] += len(content_zstd)
+                report["stored_bytes_without_dictionary"] += len(
+                    baseline_compressor.compress(content.encode("utf-8")))
+                report["compress_ms"] += (compressed_at - start) * 1000
+                report["decompress_ms"] += (decompressed_at -
+                                            compressed_at) * 1000
+
+            documents = report["documents"] or 1
+            dictionary_bytes = compression.dictionary_bytes
+            return {
+                "documents": report["documents"],
+                "current_dict_id": compression.current_dict_id,
+                "raw_bytes": report["raw_bytes"],
+                "stored_bytes": report["stored_bytes"],
+                "dictionary_bytes": dictionary_bytes,
+                "compression_ratio": report["raw_bytes"] / (report["stored_bytes"] + dictionary_bytes) if report["stored_bytes"] else None,
+                "compression_ratio_without_dictionary": report["raw_bytes"] / report["stored_bytes_without_dictionary"] if report["stored_bytes_without_dictionary"] else None,
+                "avg_compress_ms": report["compress_ms"] / documents,
+                "avg_decompress_ms": report["decompress_ms"] / documents,
+            }
         except Exception as e:
             raise e
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+from tenacity import AsyncRetrying, RetryError, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+from model.source_fetch import SourceFetchResult
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; KnowledgeBaseBot/1.0; +https://aegir.co/bot)"
+}
+
+# Status codes worth retrying, everything else is returned to the caller as is
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class RetryableFetchError(Exception):
+    pass
+
+
+class SourceFetchService:
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_per_host: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        min_host_interval_seconds: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("SOURCE_FETCH_MAX_CONCURRENCY", "16"))
+        self.max_per_host = max_per_host or int(
+            os.getenv("SOURCE_FETCH_MAX_PER_HOST", "2"))
+        self.timeout_seconds = timeout_seconds or float(
+            os.getenv("SOURCE_FETCH_TIMEOUT_SECONDS", "20"))
+        self.max_attempts = max_attempts or int(
+            os.getenv("SOURCE_FETCH_MAX_ATTEMPTS", "3"))
+        # Minimum spacing between two requests to the same host, so we never hammer one domain
+        self.min_host_interval_seconds = min_host_interval_seconds if min_host_interval_seconds is not None else float(
+            os.getenv("SOURCE_FETCH_MIN_HOST_INTERVAL_SECONDS", "1"))
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next_request_at: Dict[str, float] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Lazily create the shared keep-alive client inside the running event loop"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=DEFAULT_HEADERS,
+                timeout=httpx.Timeout(self.timeout_seconds),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _get_host_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _wait_for_host_turn_async(self, host: str):
+        """Space out request starts per host by min_host_interval_seconds"""
+        if self.min_host_interval_seconds <= 0:
+            return
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._host_next_request_at.get(host, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._host_next_request_at[host] = loop.time() + \
+                self.min_host_interval_seconds
+
+    async def fetch_async(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> SourceFetchResult:
+        """Fetch a single url with bounded concurrency, timeouts and retries.
+
+        When validators from a previous fetch are given the request is conditional,
+        and a 304 comes back as not_modified without a body.
+        """
+        result = SourceFetchResult(source_url=url)
+        started_at = time.perf_counter()
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # Host slot first, so requests queued behind a busy host do not hold global slots
+        host = urlparse(url).netloc.lower()
+        async with self._get_host_semaphore(host), self._global_semaphore:
+            client = self._get_client()
+            try:
+                async for attempt in AsyncRetrying(
+                    stop=stop_after_attempt(self.max_attempts),
+                    wait=wait_exponential_jitter(initial=0.5, max=8),
+                    retry=retry_if_exception_type(
+                        (httpx.TransportError, RetryableFetchError)),
+                    reraise=True,
+                ):
+                    with attempt:
+                        result.attempts += 1
+                        await self._wait_for_host_turn_async(host)
+                        response = await client.get(url, headers=headers)
+                        result.status_code = response.status_code
+                        if response.status_code in RETRYABLE_STATUS_CODES:
+                            raise RetryableFetchError(
+                                f"HTTP {response.status_code}")
+                        if response.status_code == 304:
+                            result.not_modified = True
+                        else:
+                            result.text = response.text
+                            result.etag = response.headers.get("ETag")
+                            result.last_modified = response.headers.get(
+                                "Last-Modified")
+                            result.content_length = len(response.content)
+            except (httpx.HTTPError, RetryableFetchError, RetryError) as e:
+                result.error = f"{type(e).__name__}: {e}"
+
+        if result.error is None and result.status_code is not None and result.status_code >= 400:
+            result.error = f"HTTP {result.status_code}"
+
+        result.elapsed_ms = (time.perf_counter() - started_at) * 1000
+        return result
+
+    async def close_async(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,260 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import lxml.html
+from lxml.etree import ParserError
+from pymongo.errors import BulkWriteError
+
+from agents.text_processing import tokenize
+from model.source_content import SourceContent
+from model.source_section import SourceSection
+from repository.source_section_repository import SourceSectionRepositoryAsync
+
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+BLOCK_TAGS = HEADING_TAGS | {"p", "li", "td", "th", "pre", "blockquote", "dd", "dt", "div"}
+
+
+class Bm25Index:
+    """Okapi BM25 over pre-tokenized documents"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(document) for document in documents]
+        self.document_lengths = [len(document) for document in documents]
+        self.average_length = (sum(self.document_lengths) /
+                               len(documents)) if documents else 0.0
+
+        document_frequencies: Dict[str, int] = Counter()
+        for term_frequency in self.term_frequencies:
+            document_frequencies.update(term_frequency.keys())
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies.items()
+        }
+
+    def search(self, query: List[str], top_k: int) -> List[Tuple[int, float]]:
+        """Indices and scores of the top_k best matching documents, best first"""
+        query_terms = [term for term in set(query) if term in self.idf]
+        scores = []
+        for i, term_frequency in enumerate(self.term_frequencies):
+            score = 0.0
+            length_norm = self.k1 * \
+                (1 - self.b + self.b * self.document_lengths[i] / (self.average_length or 1))
+            for term in query_terms:
+                frequency = term_frequency.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * \
+                        (self.k1 + 1) / (frequency + length_norm)
+            if score > 0:
+                scores.append((i, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+
+
+class SourceSectionService:
+    """Splits source contents into citable sections and retrieves the ones relevant to a query"""
+
+    def __init__(self, source_section_repository: SourceSectionRepositoryAsync, max_section_chars: Optional[int] = None, top_k: Optional[int] = None, cache_size: int = 256):
+        self.source_section_repository = source_section_repository
+        self.max_section_chars = max_section_chars or int(
+            os.getenv("SOURCE_SECTION_MAX_CHARS", "2000"))
+        self.top_k = top_k or int(os.getenv("SOURCE_SECTION_TOP_K", "8"))
+        # Source contents are immutable versions, so their sections can be cached by id
+        self.cache_size = cache_size
+        self._sections_cache: "OrderedDict[str, List[Tuple[SourceSection, List[str]]]]" = OrderedDict()
+        # Versions being split on first use, so concurrent analyses of one version split it once
+        self._splitting: Dict[str, "asyncio.Task[List[SourceSection]]"] = {}
+
+    async def ensure_indexes_async(self):
+        await self.source_section_repository.ensure_indexes_async()
+
+    def split_content(self, content: str) -> List[Tuple[Optional[str], str]]:
+        """Split extracted HTML into (heading, text) sections of at most max_section_chars"""
+        blocks: List[Tuple[bool, str]] = []
+        try:
+            root = lxml.html.fromstring(content)
+            # One walk: text belongs to the innermost block around it, so a wrapper's own text
+            # (before, between or after its nested blocks) is kept and nothing is counted twice
+            parts: List[str] = []
+            # Whether each enclosing block is a heading, the outermost is not
+            enclosing_headings = [False]
+
+            def flush_block(is_heading: bool):
+                text = " ".join("".join(parts).split())
+                parts.clear()
+                if text:
+                    blocks.append((is_heading, text))
+
+            # Depth first without recursion, comments included for their tails
+            stack = [(root, False)]
+            while stack:
+                element, leaving = stack.pop()
+                # Comments and processing instructions have no string tag and no visible text
+                is_element = isinstance(element.tag, str)
+                is_block = is_element and element.tag in BLOCK_TAGS
+                if not leaving:
+                    stack.append((element, True))
+                    stack.extend((child, False) for child in reversed(element))
+                    if is_block:
+                        flush_block(enclosing_headings[-1])
+                        enclosing_headings.append(element.tag in HEADING_TAGS)
+                    if is_element and element.text:
+                        parts.append(element.text)
+                else:
+                    if is_block:
+                        flush_block(enclosing_headings.pop())
+                    if element.tail and element is not root:
+                        parts.append(element.tail)
+            flush_block(enclosing_headings[-1])
+        except (ParserError, ValueError):
+            pass
+
+        if not blocks:
+            blocks = [(False, " ".join(paragraph.split()))
+                      for paragraph in re.split(r"\n\s*\n", content) if paragraph.strip()]
+
+        sections: List[Tuple[Optional[str], str]] = []
+        heading: Optional[str] = None
+        paragraphs: List[str] = []
+        length = 0
+
+        def flush():
+            if paragraphs:
+                sections.append((heading, "\n".join(paragraphs)))
+
+        for is_heading, text in blocks:
+            if is_heading:
+                flush()
+                heading, paragraphs, length = text, [], 0
+                continue
+            if paragraphs and length + len(text) > self.max_section_chars:
+                flush()
+                paragraphs, length = [], 0
+            paragraphs.append(text)
+            length += len(text)
+        flush()
+
+        return sections
+
+    async def create_source_sections_async(self, source_content: SourceContent) -> List[SourceSection]:
+        try:
+            now = datetime.utcnow()
+            source_sections = [
+                SourceSection(
+                    section_id=f"{source_content.id}-s{position}",
+                    source_content_id=source_content.id,
+                    source_url=source_content.source_url,
+                    position=position,
+                    heading=heading,
+                    text=text,
+                    created_at=now,
+                )
+                for position, (heading, text) in enumerate(self.split_content(source_content.content))
+            ]
+            try:
+                await self.source_section_repository.add_source_sections_async(
+                    [source_section.model_dump() for source_section in source_sections])
+            except BulkWriteError as e:
+                # Another replica split the same version meanwhile, its sections are the stored ones
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                source_sections_data = await self.source_section_repository.get_source_sections_by_source_content_ids_async(
+                    [source_content.id])
+                source_sections = [SourceSection(**source_section_data)
+                                   for source_section_data in source_sections_data]
+            return source_sections
+        except Exception as e:
+            raise e
+
+    async def _split_once_async(self, source_content: SourceContent) -> List[SourceSection]:
+        """Split and store a version's sections, sharing the work with concurrent callers.
+
+        The split runs in its own task, so a cancelled caller does not fail the others.
+        """
+        task = self._splitting.get(source_content.id)
+        if task is None:
+            task = asyncio.create_task(
+                self.create_source_sections_async(source_content))
+            self._splitting[source_content.id] = task
+
+            def forget(done_task: asyncio.Task):
+                self._splitting.pop(source_content.id, None)
+                if not done_task.cancelled():
+                    # Retrieved even when every caller was cancelled meanwhile
+                    done_task.exception()
+            task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    async def _get_tokenized_sections_async(self, source_contents: List[SourceContent]) -> List[Tuple[SourceSection, List[str]]]:
+        missing = [source_content for source_content in source_contents
+                   if source_content.id not in self._sections_cache]
+
+        if missing:
+            source_sections_data = await self.source_section_repository.get_source_sections_by_source_content_ids_async(
+                [source_content.id for source_content in missing])
+            grouped: Dict[str, List[SourceSection]] = {}
+            for source_section_data in source_sections_data:
+                source_section = SourceSection(**source_section_data)
+                grouped.setdefault(
+                    source_section.source_content_id, []).append(source_section)
+
+            for source_content in missing:
+                source_sections = grouped.get(source_content.id)
+                # Versions stored before sectioning existed are split on first use
+                if source_sections is None:
+                    source_sections = await self._split_once_async(source_content)
+                self._sections_cache[source_content.id] = [
+                    (source_section, tokenize(
+                        f"{source_section.heading or ''} {source_section.text}"))
+                    for source_section in source_sections
+                ]
+
+        tokenized_sections = []
+        for source_content in source_contents:
+            self._sections_cache.move_to_end(source_content.id)
+            tokenized_sections.extend(self._sections_cache[source_content.id])
+
+        while len(self._sections_cache) > self.cache_size:
+            self._sections_cache.popitem(last=False)
+
+        return tokenized_sections
+
+    async def get_source_terms_async(self, source_contents: List[SourceContent]) -> List[str]:
+        """Distinct terms of the source contents' titles and section text, markup left out"""
+        try:
+            tokenized_sections = await self._get_tokenized_sections_async(source_contents)
+            terms = {token for _, tokens in tokenized_sections for token in tokens}
+            for source_content in source_contents:
+                terms.update(tokenize(source_content.title))
+            return sorted(terms)
+        except Exception as e:
+            raise e
+
+    async def retrieve_sections_async(self, source_contents: List[SourceContent], queries: List[str], top_k: Optional[int] = None) -> List[List[SourceSection]]:
+        """Top-k sections of the given source contents for each query, in document order"""
+        try:
+            top_k = top_k or self.top_k
+            tokenized_sections = await self._get_tokenized_sections_async(source_contents)
+            index = Bm25Index(
+                [tokens for _, tokens in tokenized_sections])
+
+            results = []
+            for query in queries:
+                matches = index.search(tokenize(query), top_k)
+                if matches:
+                    positions = sorted(i for i, _ in matches)
+                else:
+                    # No term in common, the leading sections rather than no context at all
+                    positions = list(
+                        range(min(top_k, len(tokenized_sections))))
+                results.append([tokenized_sections[i][0] for i in positions])
+            return results
+        except Exception as e:
+            raise e
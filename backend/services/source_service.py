@@ -1,6 +1,6 @@
 import json
 from datetime import datetime
-from typing import AsyncGenerator, List
+from typing import AsyncGenerator, List, Optional
 from model.source import Source, SourceCreateRequest, SourceUpdateRequest
 from repository.source_repository import SourceRepositoryAsync
 from agents.source_tagging_agent import SourceTaggingAgent
@@ -37,6 +37,41 @@ class SourceService:
         except Exception as e:
             raise e
 
+    async def ensure_indexes_async(self):
+        await self.source_repository.ensure_indexes_async()
+
+    async def get_due_sources_async(self, now: datetime, limit: int) -> list[Source]:
+        """Up to limit sources due for a refresh at now, most overdue first, through the next_refresh_at index"""
+        try:
+            sources_data = await self.source_repository.get_due_sources(now, limit)
+            return [Source(**source_data) for source_data in sources_data]
+        except Exception as e:
+            raise e
+
+    async def get_next_refresh_at_async(self, now: datetime) -> Optional[datetime]:
+        """When the next source falls due, now for a never refreshed one, None without sources"""
+        try:
+            source_data = await self.source_repository.get_next_due_source()
+            if source_data is None:
+                return None
+            return Source(**source_data).next_refresh_at or now
+        except Exception as e:
+            raise e
+
+    async def get_sources_by_tags_async(self, tags: List[str]) -> list[Source]:
+        """Sources tagged with any of the tags, through the tags index"""
+        try:
+            if not tags:
+                return []
+            sources_data = await self.source_repository.get_sources_by_tags(tags)
+            sources = []
+            for source_data in sources_data:
+                source = Source(**source_data)
+                sources.append(source)
+            return sources
+        except Exception as e:
+            raise e
+
     async def create_source_async(self, source_request: SourceCreateRequest) -> str:
         try:
             # TODO: Add a pre-processing layer to add more metadata to the source
@@ -60,8 +95,9 @@ class SourceService:
         self, source_id: str, source_request: SourceUpdateRequest
     ) -> bool:
         try:
+            # Only write the fields the caller actually set
             return await self.source_repository.update_source(
-                source_id, source_request.model_dump()
+                source_id, source_request.model_dump(exclude_unset=True)
             )
         except Exception as e:
             raise e
@@ -129,42 +129,34 @@ features = [
 
 
 def upload_features():
-    """Upload all features to the API endpoint"""
-    successful_uploads = 0
-    failed_uploads = 0
-
-    print(f"Starting upload of {len(features)} features to {API_URL}")
+    """Upload all features to the bulk endpoint, which tags them in batches"""
+    print(f"Starting upload of {len(features)} features to {API_URL}/bulk")
     print("-" * 50)
 
-    for i, feature in enumerate(features, 1):
-        try:
-            response = requests.post(
-                API_URL,
-                json=feature,
-                headers={'Content-Type': 'application/json'}
-            )
+    try:
+        response = requests.post(
+            f"{API_URL}/bulk",
+            json={"features": features},
+            headers={'Content-Type': 'application/json'}
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Connection error: {str(e)}")
+        return
 
-            if response.status_code in [200, 201]:
-                print(
-                    f"✓ [{i:2d}/{len(features)}] Successfully uploaded: {feature['name'][:50]}...")
-                successful_uploads += 1
-            else:
-                print(
-                    f"✗ [{i:2d}/{len(features)}] Failed to upload: {feature['name'][:50]}...")
-                print(f"    Status Code: {response.status_code}")
-                print(f"    Response: {response.text}")
-                failed_uploads += 1
+    if response.status_code not in [200, 201]:
+        print(f"✗ Failed to upload {len(features)} features")
+        print(f"    Status Code: {response.status_code}")
+        print(f"    Response: {response.text}")
+        return
 
-        except requests.exceptions.RequestException as e:
-            print(
-                f"✗ [{i:2d}/{len(features)}] Connection error for: {feature['name'][:50]}...")
-            print(f"    Error: {str(e)}")
-            failed_uploads += 1
+    feature_ids = response.json()["feature_ids"]
+    for i, (feature, feature_id) in enumerate(zip(features, feature_ids), 1):
+        print(
+            f"✓ [{i:2d}/{len(features)}] Successfully uploaded: {feature['name'][:50]}... ({feature_id})")
 
     print("-" * 50)
     print(f"Upload Summary:")
-    print(f"  Successful: {successful_uploads}")
-    print(f"  Failed: {failed_uploads}")
+    print(f"  Successful: {len(feature_ids)}")
     print(f"  Total: {len(features)}")
 
 